@@ -0,0 +1,21 @@
+# Route for conversion cache statistics
+import asyncio
+
+from fastapi import APIRouter, HTTPException
+
+from app.api.v1.schemas import CacheStatsResponse
+from app.services.conversion_cache import get_cache_stats
+
+cache_router = APIRouter()
+
+
+@cache_router.get("/stats", response_model=CacheStatsResponse, status_code=200)
+async def get_conversion_cache_stats():
+    """
+    Hit and miss counts of the conversion cache, used to size the cache.
+    """
+    try:
+        return CacheStatsResponse(**await asyncio.to_thread(get_cache_stats))
+    except Exception as e:
+        print(f"Error retrieving conversion cache stats: {e}")
+        raise HTTPException(status_code=503, detail="Cache stats unavailable")
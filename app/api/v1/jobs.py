@@ -1,37 +1,208 @@
 # Route for handling file uploads
+import asyncio
+import hmac
+import json
 import os
-from fastapi import APIRouter, Depends, UploadFile, File, HTTPException
-from fastapi.responses import StreamingResponse, FileResponse
-import boto3
+from fastapi import (
+    APIRouter,
+    Body,
+    Depends,
+    UploadFile,
+    File,
+    HTTPException,
+    Header,
+    Query,
+    Request,
+)
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import (
+    StreamingResponse,
+    JSONResponse,
+    RedirectResponse,
+    Response,
+)
 from botocore.exceptions import ClientError
 
 
-from sqlalchemy.orm import Session
-from typing import List
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from pathlib import PurePosixPath
+from datetime import datetime
+from typing import List, Optional
 import uuid
-from app.database.models import Job
-from app.database.session import get_db
+from app.database.models import FileConversion, Job, JobStatusEnum
+from app.database.session import AsyncSessionLocal, get_async_db
+from app.services.direct_upload import (
+    create_direct_upload,
+    finish_direct_upload,
+    start_ingestion,
+    uploaded_job_ids,
+    uploaded_zip_exists,
+)
 from app.services.file_upload import handle_file_upload
+from app.services.job_cancellation import cancel_job
+from app.services.job_events import job_event_hub
+from app.services.job_listing import list_job_files, list_jobs
+from app.services.job_status import (
+    get_job_status,
+    status_etag,
+    wait_for_job_status,
+)
 from app.api.v1.schemas import (
+    CompleteUploadRequest,
+    DirectUploadRequest,
+    DirectUploadResponse,
+    FileListResponse,
+    JobListResponse,
     JobResponse,
     JobStatusResponse,
-    FileConversionStatusResponse,
 )
-from app.config import S3_BUCKET_NAME, USE_S3, UPLOAD_DIR
+from app.services.file_download import local_file_response, s3_file_response
+from app.services.generate_s3_url import generate_presigned_url
+from app.services.zip_stream import stream_converted_files
+from app.config import (
+    S3_BUCKET_NAME,
+    USE_S3,
+    UPLOAD_DIR,
+    STREAM_ZIP_DOWNLOADS,
+    JOB_STATUS_MAX_WAIT,
+    SSE_HEARTBEAT_INTERVAL,
+    DIRECT_UPLOAD_MAX_BYTES,
+    S3_NOTIFICATION_TOKEN,
+    JOB_MAX_PRIORITY,
+    LIST_PAGE_MAX_SIZE,
+    USE_PRESIGNED_URL,
+)
 
 upload_router = APIRouter()
 
+FINISHED_JOB_STATUSES = (
+    JobStatusEnum.completed.value,
+    JobStatusEnum.failed.value,
+    JobStatusEnum.cancelled.value,
+)
+
 
 @upload_router.post("/", response_model=JobResponse, status_code=202)
 async def create_conversion_job(
-    file: UploadFile = File(...), db: Session = Depends(get_db)
+    file: UploadFile = File(...),
+    priority: int = Query(1, ge=1, le=JOB_MAX_PRIORITY),
+    db: AsyncSession = Depends(get_async_db),
 ):
     """
     Create a new file conversion job.
     This endpoint accepts zip file containing docx files and
-    returns a job ID.
+    returns a job ID. With the fair-share scheduler, a job of priority N
+    gets N times the conversion capacity of a priority 1 job.
     """
-    job_id = await handle_file_upload(file, db)
+    job_id = await handle_file_upload(file, db, priority)
+    return JobResponse(job_id=job_id)
+
+
+@upload_router.get(
+    "/", response_model=JobListResponse, response_model_exclude_none=True
+)
+async def list_conversion_jobs(
+    status: Optional[JobStatusEnum] = None,
+    created_after: Optional[datetime] = None,
+    created_before: Optional[datetime] = None,
+    limit: int = Query(50, ge=1, le=LIST_PAGE_MAX_SIZE),
+    cursor: Optional[str] = None,
+    db: AsyncSession = Depends(get_async_db),
+):
+    """
+    List jobs, newest first, optionally of one status and created within
+    [created_after, created_before). Pages are fetched with the
+    `next_cursor` of the previous page.
+    """
+    try:
+        jobs, next_cursor = await list_jobs(
+            db, limit, cursor, status, created_after, created_before
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return JobListResponse(jobs=jobs, next_cursor=next_cursor)
+
+
+@upload_router.post("/uploads", response_model=DirectUploadResponse, status_code=201)
+async def create_direct_upload_job(
+    request: DirectUploadRequest = Body(DirectUploadRequest()),
+    db: AsyncSession = Depends(get_async_db),
+):
+    """
+    Create a job whose ZIP the client uploads straight to the bucket.
+    Returns a presigned POST, or presigned part URLs when `size` needs a
+    multipart upload. Processing starts with the completion call or the
+    bucket notification for the upload.
+    """
+    if not USE_S3:
+        raise HTTPException(status_code=400, detail="Direct uploads need S3 storage")
+    if request.size and request.size > DIRECT_UPLOAD_MAX_BYTES:
+        raise HTTPException(status_code=413, detail="ZIP file is too large")
+    job_id, upload = await create_direct_upload(db, request.size, request.priority)
+    return DirectUploadResponse(job_id=job_id, **upload)
+
+
+@upload_router.post("/uploads/notifications", status_code=204)
+async def receive_upload_notification(
+    event: dict = Body(...),
+    authorization: Optional[str] = Header(None),
+    db: AsyncSession = Depends(get_async_db),
+):
+    """
+    Webhook for S3 ObjectCreated notifications (S3 via SNS, MinIO).
+    Starts the jobs whose ZIP arrived, clients then need no completion call.
+    Disabled unless S3_NOTIFICATION_TOKEN is set. A job only starts once
+    its ZIP is actually in the bucket, so a forged event cannot start it.
+    """
+    if not S3_NOTIFICATION_TOKEN:
+        raise HTTPException(status_code=403, detail="Bucket notifications disabled")
+    if not any(
+        hmac.compare_digest(authorization or "", expected)
+        for expected in (S3_NOTIFICATION_TOKEN, f"Bearer {S3_NOTIFICATION_TOKEN}")
+    ):
+        raise HTTPException(status_code=401, detail="Invalid notification token")
+    for job_id in uploaded_job_ids(event):
+        if await asyncio.to_thread(uploaded_zip_exists, job_id):
+            await start_ingestion(db, job_id)
+        else:
+            print(f"Ignored notification for job {job_id}: no uploaded ZIP")
+    return Response(status_code=204)
+
+
+@upload_router.post("/{job_id}/complete", response_model=JobResponse, status_code=202)
+async def complete_direct_upload(
+    job_id: uuid.UUID,
+    request: CompleteUploadRequest = Body(CompleteUploadRequest()),
+    db: AsyncSession = Depends(get_async_db),
+):
+    """
+    Tell the API a direct upload has finished. Completes the multipart
+    upload when `upload_id` is given and schedules the conversion.
+    """
+    job = await db.get(Job, job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    if job.status != JobStatusEnum.uploading:
+        raise HTTPException(status_code=409, detail="Upload already completed")
+
+    parts = (
+        [{"PartNumber": p.part_number, "ETag": p.etag} for p in request.parts]
+        if request.parts is not None
+        else None
+    )
+    try:
+        uploaded = await asyncio.to_thread(
+            finish_direct_upload, job_id, request.upload_id, parts
+        )
+    except ClientError as e:
+        raise HTTPException(
+            status_code=400, detail=f"S3 Error: {e.response['Error']['Message']}"
+        )
+    if not uploaded:
+        raise HTTPException(status_code=400, detail="Uploaded ZIP file not found")
+    if not await start_ingestion(db, job_id):
+        raise HTTPException(status_code=409, detail="Upload already completed")
     return JobResponse(job_id=job_id)
 
 
@@ -41,81 +212,233 @@ async def create_conversion_job(
     response_model_exclude_none=True,
     status_code=200,
 )
-async def get_conversion_job_status(job_id: uuid.UUID, db: Session = Depends(get_db)):
+async def get_conversion_job_status(
+    job_id: uuid.UUID,
+    wait: int = Query(0, ge=0, le=JOB_STATUS_MAX_WAIT),
+    files: bool = False,
+    if_none_match: Optional[str] = Header(None),
+    db: AsyncSession = Depends(get_async_db),
+):
     """
     Retrieve the status of a file conversion job.
     This endpoint returns the current status of the
     job along with details of the files being processed.
+    Responses carry an ETag; a matching If-None-Match is answered with 304,
+    after holding the request for up to `wait` seconds for a change.
+    Files are counted, not listed: page through `files_url`, or pass
+    `files=true` to include every file.
     """
     try:
-        job = db.query(Job).filter(Job.id == job_id).first()
-        print(
-            f"Retrieving job status for {job_id}: {job.file_conversions[0].output_file_path}"
-        )
-        if not job:
+        if wait and if_none_match:
+            payload = await wait_for_job_status(db, job_id, if_none_match, wait, files)
+        else:
+            payload = await get_job_status(db, job_id, files)
+        if payload is None:
             return JobStatusResponse(
-                job_id=job_id,
-                status="not_found",
-                files=[],
-                created_at="",
-                downloaded_url=None,
+                job_id=job_id, status="not_found", created_at="", downloaded_url=None
             )
 
-        file_conversions = [
-            FileConversionStatusResponse(
-                file_name=fc.file_name,
-                status=fc.status.value,
-                error_message=fc.error_message,
-            )
-            for fc in job.file_conversions
-        ]
-
-        return JobStatusResponse(
-            job_id=job.id,
-            status=job.status.value,
-            files=file_conversions,
-            created_at=job.created_at.isoformat(),
-            downloaded_url=job.download_url if job.download_url else None,
+        etag = status_etag(payload)
+        headers = {"ETag": etag, "Cache-Control": "no-cache"}
+        if if_none_match == etag:
+            return Response(status_code=304, headers=headers)
+        response = JobStatusResponse(**payload)
+        return JSONResponse(
+            content=jsonable_encoder(response, exclude_none=True), headers=headers
         )
     except Exception as e:
         print(f"Error retrieving job status for {job_id}: {e}")
         return JobStatusResponse(
-            job_id=job_id, status="error", files=[], created_at="", downloaded_url=None
+            job_id=job_id, status="error", created_at="", downloaded_url=None
         )
 
 
-@upload_router.get("/{job_id}/download", status_code=200)
-async def download_converted_files(job_id: uuid.UUID):
+@upload_router.get(
+    "/{job_id}/files", response_model=FileListResponse, response_model_exclude_none=True
+)
+async def list_conversion_job_files(
+    job_id: uuid.UUID,
+    status: Optional[JobStatusEnum] = None,
+    limit: int = Query(100, ge=1, le=LIST_PAGE_MAX_SIZE),
+    cursor: Optional[str] = None,
+    db: AsyncSession = Depends(get_async_db),
+):
     """
-    Stream the converted ZIP file for a specific job from S3.
+    Files of a job by name, a page at a time, optionally of one status
+    (e.g. `?status=failed`). Large jobs can be followed through this
+    instead of the full file list of the status endpoint.
     """
-    if not USE_S3:
-        file_path = f"/app/{UPLOAD_DIR}/{job_id}/{job_id}.zip"  # Adjust path as per your project
+    if await db.get(Job, job_id) is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    try:
+        files, next_cursor = await list_job_files(db, job_id, limit, cursor, status)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return FileListResponse(job_id=job_id, files=files, next_cursor=next_cursor)
+
+
+@upload_router.delete("/{job_id}", response_model=JobResponse, status_code=202)
+async def cancel_conversion_job(
+    job_id: uuid.UUID, db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Cancel a job. Its queued conversions are revoked, running ones are
+    stopped and the job is not zipped. Files converted already stay
+    downloadable. Cancelling a cancelled job again is a no-op.
+    """
+    previous = await cancel_job(db, job_id)
+    if previous is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    if previous in (JobStatusEnum.completed, JobStatusEnum.failed):
+        raise HTTPException(status_code=409, detail="Job already finished")
+    return JobResponse(job_id=job_id)
 
-        if not os.path.exists(file_path):
-            raise HTTPException(status_code=404, detail="File not found")
 
-        return FileResponse(
-            path=file_path, filename=f"{job_id}.zip", media_type="application/zip"
+@upload_router.get("/{job_id}/events", status_code=200)
+async def stream_job_events(
+    job_id: uuid.UUID, request: Request, db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Server-Sent Events stream of a job's progress. The current status is
+    sent first, followed by `file`, `progress` and `job` events as the
+    workers publish them. The stream ends when the job is finished.
+    """
+    if await get_job_status(db, job_id) is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+
+    async def events():
+        async with job_event_hub.subscribe(job_id) as queue:
+            # Snapshot after subscribing, so no event is missed in between
+            async with AsyncSessionLocal() as session:
+                payload = await get_job_status(session, job_id)
+            yield f"event: status\ndata: {json.dumps(payload)}\n\n"
+            if payload["status"] in FINISHED_JOB_STATUSES:
+                return
+
+            while not await request.is_disconnected():
+                try:
+                    data = await asyncio.wait_for(queue.get(), SSE_HEARTBEAT_INTERVAL)
+                except asyncio.TimeoutError:
+                    yield ": keep-alive\n\n"
+                    continue
+                event = json.loads(data)
+                yield f"event: {event['type']}\ndata: {data}\n\n"
+                if event["type"] == "job" and event["status"] in FINISHED_JOB_STATUSES:
+                    return
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+async def _converted_files(db: AsyncSession, job_id: uuid.UUID) -> List[tuple]:
+    """
+    (file name, output path) of the files of a job converted so far.
+    """
+    result = await db.execute(
+        select(FileConversion.file_name, FileConversion.output_file_path)
+        .where(
+            FileConversion.job_id == job_id,
+            FileConversion.status == JobStatusEnum.completed,
         )
+        .order_by(FileConversion.file_name)
+    )
+    return [tuple(row) for row in result.all()]
 
-    key = f"{job_id}/{job_id}.zip"
-    s3 = boto3.client("s3")
 
-    try:
-        s3_response = s3.get_object(Bucket=S3_BUCKET_NAME, Key=key)
-        file_stream = s3_response["Body"]
+def _pdf_name(file_name: str) -> str:
+    return PurePosixPath(file_name).with_suffix(".pdf").name
 
-        return StreamingResponse(
-            file_stream,
-            media_type="application/zip",
-            headers={"Content-Disposition": f'attachment; filename="{job_id}.zip"'},
+
+@upload_router.api_route(
+    "/{job_id}/files/{file_id}/download", methods=["GET", "HEAD"], status_code=200
+)
+async def download_converted_file(
+    job_id: uuid.UUID,
+    file_id: uuid.UUID,
+    request: Request,
+    db: AsyncSession = Depends(get_async_db),
+):
+    """
+    Download the PDF of one converted file, available as soon as the file
+    is done rather than when the whole job is. With presigned URLs enabled
+    the client is redirected to S3. Byte ranges are supported.
+    """
+    file_conversion = await db.get(FileConversion, file_id)
+    if not file_conversion or file_conversion.job_id != job_id:
+        raise HTTPException(status_code=404, detail="File not found")
+    if file_conversion.status != JobStatusEnum.completed:
+        raise HTTPException(
+            status_code=409,
+            detail=f"File is {file_conversion.status.value}, not converted",
         )
+    filename = _pdf_name(file_conversion.file_name)
+    path = file_conversion.output_file_path
 
-    except ClientError as e:
-        if e.response["Error"]["Code"] == "NoSuchKey":
-            raise HTTPException(status_code=404, detail="ZIP file not found in S3")
-        else:
+    if not USE_S3:
+        return local_file_response(path, filename, "application/pdf")
+    if USE_PRESIGNED_URL:
+        url = await asyncio.to_thread(generate_presigned_url, S3_BUCKET_NAME, path)
+        if url:
+            return RedirectResponse(url, status_code=307)
+    return await s3_file_response(request, path, filename, "application/pdf")
+
+
+@upload_router.api_route("/{job_id}/download", methods=["GET", "HEAD"], status_code=200)
+async def download_converted_files(
+    job_id: uuid.UUID,
+    request: Request,
+    stream: bool = False,
+    partial: bool = False,
+    db: AsyncSession = Depends(get_async_db),
+):
+    """
+    Download the converted ZIP file of a job. The stored ZIP supports byte
+    ranges (Range/If-Range), so an interrupted download can resume: local
+    files are sent by the server, S3 ranges are fetched as ranged GETs.
+    With STREAM_ZIP_DOWNLOADS or `?stream=true` the ZIP is built on the fly
+    from the individual converted files instead. `?partial=true` streams
+    the files converted so far while the job is still running; the
+    X-Files-Included and X-Files-Total headers tell how much it holds.
+    Archives built on the fly cannot be resumed.
+    """
+    if stream or partial or STREAM_ZIP_DOWNLOADS:
+        job = await db.get(Job, job_id)
+        if not job or not (partial or job.status == JobStatusEnum.completed):
             raise HTTPException(
-                status_code=500, detail=f"S3 Error: {e.response['Error']['Message']}"
+                status_code=404, detail="Job not found or not completed"
             )
+
+        files = await _converted_files(db, job_id)
+        if not files:
+            raise HTTPException(status_code=404, detail="No converted files yet")
+        name = f"{job_id}-partial.zip" if partial else f"{job_id}.zip"
+        headers = {
+            "Accept-Ranges": "none",
+            "Content-Disposition": f'attachment; filename="{name}"',
+            "X-Files-Included": str(len(files)),
+            "X-Files-Total": str(job.total_files),
+        }
+        if request.method == "HEAD":
+            # The size is only known once the archive is built
+            return Response(media_type="application/zip", headers=headers)
+        return StreamingResponse(
+            stream_converted_files(files),
+            media_type="application/zip",
+            headers=headers,
+        )
+
+    filename = f"{job_id}.zip"
+    if not USE_S3:
+        # Same location zip_converted_files writes to
+        file_path = os.path.join(UPLOAD_DIR, str(job_id), filename)
+        return local_file_response(file_path, filename, "application/zip")
+
+    key = f"{job_id}/{filename}"
+    if USE_PRESIGNED_URL:
+        url = await asyncio.to_thread(generate_presigned_url, S3_BUCKET_NAME, key)
+        if url:
+            return RedirectResponse(url, status_code=307)
+    return await s3_file_response(request, key, filename, "application/zip")
@@ -1,6 +1,8 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 import uuid
-from typing import List, Optional
+from typing import Dict, List, Optional
+
+from app.config import JOB_MAX_PRIORITY
 
 
 class JobResponse(BaseModel):
@@ -9,14 +11,90 @@ class JobResponse(BaseModel):
 
 
 class FileConversionStatusResponse(BaseModel):
+    file_id: Optional[uuid.UUID] = None
     file_name: str
     status: str
     error_message: Optional[str] = None
+    # Set once the file is converted, also before the job completes
+    download_url: Optional[str] = None
 
 
 class JobStatusResponse(BaseModel):
     job_id: uuid.UUID
     status: str
-    files: List[FileConversionStatusResponse] = []
+    total_files: Optional[int] = None
+    completed_files: Optional[int] = None
+    failed_files: Optional[int] = None
+    # Paginated file listing, every file is only included with ?files=true
+    files_url: Optional[str] = None
+    files: Optional[List[FileConversionStatusResponse]] = None
+    created_at: str
+    downloaded_url: Optional[str] = None
+    # Set when the job failed as a whole, e.g. its archive was rejected
+    error_message: Optional[str] = None
+
+
+class JobSummaryResponse(BaseModel):
+    job_id: uuid.UUID
+    status: str
     created_at: str
+    total_files: int
+    completed_files: int
+    failed_files: int
+    priority: int
     downloaded_url: Optional[str] = None
+
+
+class JobListResponse(BaseModel):
+    jobs: List[JobSummaryResponse]
+    # Pass as ?cursor= for the next page, absent on the last page
+    next_cursor: Optional[str] = None
+
+
+class FileListResponse(BaseModel):
+    job_id: uuid.UUID
+    files: List[FileConversionStatusResponse]
+    next_cursor: Optional[str] = None
+
+
+class CacheStatsResponse(BaseModel):
+    hits: int
+    misses: int
+    hit_ratio: float
+
+
+class DirectUploadRequest(BaseModel):
+    # Size of the ZIP in bytes, larger ZIPs are uploaded in parts
+    size: Optional[int] = Field(None, gt=0)
+    # Share of the conversion capacity, see USE_FAIR_SCHEDULER
+    priority: int = Field(1, ge=1, le=JOB_MAX_PRIORITY)
+
+
+class PresignedPost(BaseModel):
+    url: str
+    fields: Dict[str, str]
+
+
+class PresignedPart(BaseModel):
+    part_number: int
+    url: str
+
+
+class DirectUploadResponse(BaseModel):
+    job_id: uuid.UUID
+    key: str
+    expires_in: int
+    post: Optional[PresignedPost] = None
+    upload_id: Optional[str] = None
+    part_size: Optional[int] = None
+    parts: Optional[List[PresignedPart]] = None
+
+
+class CompletedPart(BaseModel):
+    part_number: int
+    etag: str
+
+
+class CompleteUploadRequest(BaseModel):
+    upload_id: Optional[str] = None
+    parts: Optional[List[CompletedPart]] = None
@@ -1,8 +1,138 @@
-import os
-from celery.app import Celery
+import time
+from contextlib import contextmanager
 
-redis_url = os.getenv("REDIS_URL", "redis://localhost:6379")
+from celery.app import Celery
+from celery.signals import (
+    before_task_publish,
+    task_failure,
+    task_postrun,
+    task_prerun,
+    worker_init,
+    worker_process_shutdown,
+    worker_ready,
+)
+from app.config import (
+    REDIS_URL,
+    USE_FAIR_SCHEDULER,
+    FAIR_SCHEDULER_TICK,
+    METRICS_WORKER_PORT,
+    RECOVERY_SWEEP_INTERVAL,
+    RETENTION_SWEEP_INTERVAL,
+    TASK_VISIBILITY_TIMEOUT,
+)
+from app.metrics import (
+    mark_process_dead,
+    record_task_wait,
+    start_worker_metrics_server,
+)
+from app.tracing import (
+    end_task_span,
+    inject_trace_context,
+    record_task_failure,
+    shutdown_tracing,
+    start_task_span,
+)
+from app.services.conversion_slots import conversion_slot_count
+from app.services.libreoffice_pool import close_libreoffice_pool
+from app.services.retention import remove_stale_temp_files
 
-celery_app = Celery(__name__, broker=redis_url, backend=redis_url)
+celery_app = Celery(__name__, broker=REDIS_URL, backend=REDIS_URL)
 
 celery_app.autodiscover_tasks(["app.tasks"])
+
+# One worker process per conversion slot of the host, workers started with
+# -c (zip and unzip queues) keep their own setting
+celery_app.conf.worker_concurrency = conversion_slot_count()
+
+# Tasks are acknowledged once they finished, a task of a worker that died
+# is delivered again. The tasks check the FileConversion status first, so
+# a redelivery does not redo finished work.
+celery_app.conf.task_acks_late = True
+celery_app.conf.task_reject_on_worker_lost = True
+celery_app.conf.broker_transport_options = {
+    "visibility_timeout": TASK_VISIBILITY_TIMEOUT
+}
+
+celery_app.conf.beat_schedule = {
+    "recover-stuck-jobs": {
+        "task": "app.tasks.recover_stuck_jobs",
+        "schedule": RECOVERY_SWEEP_INTERVAL,
+        "options": {"queue": "file_conversion_queue"},
+    },
+    "collect-garbage": {
+        "task": "app.tasks.collect_garbage",
+        "schedule": RETENTION_SWEEP_INTERVAL,
+        "options": {"queue": "file_conversion_queue"},
+    },
+}
+
+if USE_FAIR_SCHEDULER:
+    # Workers should only hold the tasks the scheduler released to them
+    celery_app.conf.worker_prefetch_multiplier = 1
+    celery_app.conf.beat_schedule["release-fair-share-conversions"] = {
+        "task": "app.tasks.release_fair_share_conversions",
+        "schedule": FAIR_SCHEDULER_TICK,
+        "options": {"queue": "file_conversion_queue"},
+    }
+
+
+@contextmanager
+def task_producer():
+    """
+    Producer to publish a burst of task messages over one connection.
+    Eager mode (tests, benchmarks) runs tasks inline and needs no broker.
+    """
+    if celery_app.conf.task_always_eager:
+        yield None
+        return
+    with celery_app.producer_or_acquire() as producer:
+        yield producer
+
+
+@worker_process_shutdown.connect
+def shutdown_worker_process(pid=None, **kwargs):
+    close_libreoffice_pool()
+    shutdown_tracing()
+    if pid is not None:
+        mark_process_dead(pid)
+
+
+@worker_init.connect
+def serve_worker_metrics(**kwargs):
+    if METRICS_WORKER_PORT:
+        start_worker_metrics_server(METRICS_WORKER_PORT)
+
+
+@worker_ready.connect
+def clean_temp_dir(**kwargs):
+    # The periodic sweep runs on one worker, temp files are local to each host
+    removed = remove_stale_temp_files()
+    if removed:
+        print(f"Removed {removed} stale temp files")
+
+
+@before_task_publish.connect
+def stamp_task_headers(headers=None, **kwargs):
+    # Read back by the worker to measure how long the task waited
+    if headers is not None:
+        headers["published_at"] = time.time()
+        inject_trace_context(headers)
+
+
+@task_prerun.connect
+def observe_task_wait(task=None, **kwargs):
+    published_at = task.request.get("published_at")
+    if published_at is not None:
+        delivery_info = task.request.delivery_info or {}
+        record_task_wait(task.name, delivery_info.get("routing_key"), published_at)
+    start_task_span(task)
+
+
+@task_failure.connect
+def trace_task_failure(task_id=None, exception=None, **kwargs):
+    record_task_failure(task_id, exception)
+
+
+@task_postrun.connect
+def end_task_trace(task_id=None, state=None, **kwargs):
+    end_task_span(task_id, state)
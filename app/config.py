@@ -3,10 +3,213 @@ import os
 UPLOAD_DIR = os.getenv("UPLOAD_DIR", "uploads")  # Directory for local file uploads
 USE_S3 = os.getenv("USE_S3", "false").lower() == "true"  # Use S3 for file storage
 S3_BUCKET_NAME = os.getenv("S3_BUCKET", "upload")  # bucket name of S3 storage
+S3_ENDPOINT_URL = (
+    os.getenv("S3_ENDPOINT_URL") or None
+)  # Custom S3 endpoint, e.g. a local MinIO for development and tests
+S3_UPLOAD_PART_SIZE = max(
+    int(os.getenv("S3_UPLOAD_PART_SIZE", str(8 * 1024 * 1024))), 5 * 1024 * 1024
+)  # Part size of multipart uploads, S3 requires at least 5 MB
+S3_UPLOAD_CONCURRENCY = int(
+    os.getenv("S3_UPLOAD_CONCURRENCY", "4")
+)  # Parts of one upload sent to S3 at the same time
+S3_TRANSFER_CONCURRENCY = int(
+    os.getenv("S3_TRANSFER_CONCURRENCY", "16")
+)  # Objects downloaded or uploaded in parallel by the workers
+S3_MULTIPART_THRESHOLD = int(
+    os.getenv("S3_MULTIPART_THRESHOLD", str(16 * 1024 * 1024))
+)  # Objects above this size are transferred in parts
+S3_MULTIPART_CHUNKSIZE = int(
+    os.getenv("S3_MULTIPART_CHUNKSIZE", str(8 * 1024 * 1024))
+)  # Part size of multipart transfers
+S3_MULTIPART_CONCURRENCY = int(
+    os.getenv("S3_MULTIPART_CONCURRENCY", "4")
+)  # Parts of one object transferred in parallel
+S3_MAX_POOL_CONNECTIONS = int(
+    os.getenv("S3_MAX_POOL_CONNECTIONS", "64")
+)  # HTTP connections kept by the shared S3 client of a process
+S3_PUBLIC_ENDPOINT_URL = (
+    os.getenv("S3_PUBLIC_ENDPOINT_URL") or None
+)  # Endpoint clients reach S3 at, when it differs from S3_ENDPOINT_URL
+DIRECT_UPLOAD_URL_EXPIRY = int(
+    os.getenv("DIRECT_UPLOAD_URL_EXPIRY", "3600")
+)  # Seconds the presigned upload URLs stay valid
+DIRECT_UPLOAD_MAX_BYTES = int(
+    os.getenv("DIRECT_UPLOAD_MAX_BYTES", str(5 * 1024 * 1024 * 1024))
+)  # Largest ZIP accepted through a direct upload
+S3_NOTIFICATION_TOKEN = (
+    os.getenv("S3_NOTIFICATION_TOKEN") or None
+)  # Token bucket notifications must send in the Authorization header
 STATIC_BASE_URL = os.getenv(
     "STATIC_BASE_URL", "http://localhost:8088"
 )  # Base URL for static files for local
 BASE_URL = os.getenv("BASE_URL", "http://localhost:8000")  # Base URL for API
+STREAM_ZIP_DOWNLOADS = (
+    os.getenv("STREAM_ZIP_DOWNLOADS", "false").lower() == "true"
+)  # Build the download ZIP on the fly instead of materializing it at job completion
+DOWNLOAD_ACCEL_REDIRECT_PREFIX = os.getenv(
+    "DOWNLOAD_ACCEL_REDIRECT_PREFIX", ""
+)  # nginx internal location mapped to UPLOAD_DIR, local downloads are then sent by nginx
 USE_PRESIGNED_URL = (
     os.getenv("USE_S3_PRESIGNED_URL", "false").lower() == "true"
 )  # Use presigned URLs for S3 access
+LIBREOFFICE_BINARY = os.getenv(
+    "LIBREOFFICE_BINARY", "libreoffice"
+)  # LibreOffice executable used for conversions
+LIBREOFFICE_POOL_SIZE = int(
+    os.getenv("LIBREOFFICE_POOL_SIZE", "1")
+)  # Persistent LibreOffice instances per worker process, 0 starts one process per file
+LIBREOFFICE_MAX_CONVERSIONS = int(
+    os.getenv("LIBREOFFICE_MAX_CONVERSIONS", "200")
+)  # Recycle a pooled instance after this many documents
+LIBREOFFICE_STARTUP_TIMEOUT = float(
+    os.getenv("LIBREOFFICE_STARTUP_TIMEOUT", "30")
+)  # Seconds to wait for a pooled instance to accept connections
+LIBREOFFICE_TIMEOUT = float(
+    os.getenv("LIBREOFFICE_TIMEOUT", "60")
+)  # Seconds a conversion may take before LibreOffice is killed, per document
+LIBREOFFICE_TIMEOUT_PER_MB = float(
+    os.getenv("LIBREOFFICE_TIMEOUT_PER_MB", "30")
+)  # Extra seconds allowed per MB of input document
+LIBREOFFICE_TIMEOUT_MAX = float(
+    os.getenv("LIBREOFFICE_TIMEOUT_MAX", "600")
+)  # Upper bound on the timeout of a single document
+CONVERSION_MAX_RETRIES = int(
+    os.getenv("CONVERSION_MAX_RETRIES", "3")
+)  # Retries of a conversion task after a transient failure
+CONVERSION_RETRY_BACKOFF = int(
+    os.getenv("CONVERSION_RETRY_BACKOFF", "10")
+)  # Base seconds of the exponential backoff between retries
+CONVERSION_RETRY_BACKOFF_MAX = int(
+    os.getenv("CONVERSION_RETRY_BACKOFF_MAX", "600")
+)  # Longest wait between retries
+LIBREOFFICE_SLOTS = int(
+    os.getenv("LIBREOFFICE_SLOTS", "0")
+)  # Concurrent conversions per host, 0 derives it from the CPUs and memory
+LIBREOFFICE_SLOT_MEMORY = int(
+    os.getenv("LIBREOFFICE_SLOT_MEMORY", str(1024 * 1024 * 1024))
+)  # Memory budgeted per concurrent conversion when deriving the slots
+LIBREOFFICE_SLOT_DIR = os.getenv(
+    "LIBREOFFICE_SLOT_DIR", "/tmp/libreoffice_slots"
+)  # Per-slot LibreOffice profiles and scratch output directories
+CONVERSION_BATCH_SIZE = int(
+    os.getenv("CONVERSION_BATCH_SIZE", "1")
+)  # Files converted per Celery task, 1 sends one task per file
+CONVERSION_BATCH_MAX_BYTES = int(
+    os.getenv("CONVERSION_BATCH_MAX_BYTES", str(50 * 1024 * 1024))
+)  # Upper bound on the total input size of one conversion batch
+USE_FAIR_SCHEDULER = (
+    os.getenv("USE_FAIR_SCHEDULER", "false").lower() == "true"
+)  # Interleave conversions of all active jobs instead of one FIFO libre_queue
+FAIR_SCHEDULER_MAX_IN_FLIGHT = int(
+    os.getenv("FAIR_SCHEDULER_MAX_IN_FLIGHT", "8")
+)  # Conversion tasks released to libre_queue at a time, about the worker slots
+FAIR_SCHEDULER_LEASE_TIMEOUT = int(
+    os.getenv("FAIR_SCHEDULER_LEASE_TIMEOUT", "900")
+)  # Seconds after which a released task no longer holds its slot
+FAIR_SCHEDULER_TICK = float(
+    os.getenv("FAIR_SCHEDULER_TICK", "5")
+)  # Seconds between periodic releases, covering slots freed by expired leases
+TASK_VISIBILITY_TIMEOUT = int(
+    os.getenv("TASK_VISIBILITY_TIMEOUT", "3600")
+)  # Seconds before an unacknowledged task is redelivered, above the longest task and retry backoff
+STALE_JOB_AFTER = int(
+    os.getenv("STALE_JOB_AFTER", "1800")
+)  # Seconds without progress after which the sweeper resumes a job
+
+# A batch task runs up to LIBREOFFICE_TIMEOUT_MAX per file before it is
+# acknowledged and records its files. Running longer than either timeout,
+# it would be redelivered or resumed while it still converts.
+if CONVERSION_BATCH_SIZE * LIBREOFFICE_TIMEOUT_MAX >= min(
+    TASK_VISIBILITY_TIMEOUT, STALE_JOB_AFTER
+):
+    raise ValueError(
+        f"CONVERSION_BATCH_SIZE * LIBREOFFICE_TIMEOUT_MAX "
+        f"({CONVERSION_BATCH_SIZE} * {LIBREOFFICE_TIMEOUT_MAX:g}s) must stay below "
+        f"TASK_VISIBILITY_TIMEOUT ({TASK_VISIBILITY_TIMEOUT}s) and "
+        f"STALE_JOB_AFTER ({STALE_JOB_AFTER}s)"
+    )
+RECOVERY_SWEEP_INTERVAL = float(
+    os.getenv("RECOVERY_SWEEP_INTERVAL", "300")
+)  # Seconds between sweeps for stuck jobs (celery beat)
+JOB_CANCEL_FLAG_TTL = int(
+    os.getenv("JOB_CANCEL_FLAG_TTL", str(24 * 3600))
+)  # Seconds the Redis flag of a cancelled job is kept for running tasks to see
+JOB_CANCEL_POLL_INTERVAL = float(
+    os.getenv("JOB_CANCEL_POLL_INTERVAL", "1")
+)  # Seconds between cancellation checks of a running conversion
+RETENTION_INPUTS_TTL = int(
+    os.getenv("RETENTION_INPUTS_TTL", str(24 * 3600))
+)  # Seconds after a job finished its archive and DOCX files are kept, 0 keeps them
+RETENTION_OUTPUTS_TTL = int(
+    os.getenv("RETENTION_OUTPUTS_TTL", str(7 * 24 * 3600))
+)  # Seconds after a job finished all its files (PDFs, ZIP) are kept, 0 keeps them
+RETENTION_JOBS_TTL = int(
+    os.getenv("RETENTION_JOBS_TTL", str(30 * 24 * 3600))
+)  # Seconds after creation finished (and abandoned uploading) jobs are deleted, 0 keeps them
+RETENTION_TEMP_FILES_TTL = int(
+    os.getenv("RETENTION_TEMP_FILES_TTL", str(24 * 3600))
+)  # Age after which worker temp files left by crashed conversions are removed, 0 keeps them
+RETENTION_SWEEP_INTERVAL = float(
+    os.getenv("RETENTION_SWEEP_INTERVAL", "3600")
+)  # Seconds between retention sweeps (celery beat)
+RETENTION_BATCH_SIZE = int(
+    os.getenv("RETENTION_BATCH_SIZE", "500")
+)  # Jobs (and file rows) handled per transaction by a retention sweep
+JOB_MAX_PRIORITY = int(
+    os.getenv("JOB_MAX_PRIORITY", "10")
+)  # Highest job priority, the share of a job is proportional to its priority
+ZIP_MAX_MEMBERS = int(
+    os.getenv("ZIP_MAX_MEMBERS", "50000")
+)  # Archives with more DOCX documents are rejected
+ZIP_MAX_MEMBER_BYTES = int(
+    os.getenv("ZIP_MAX_MEMBER_BYTES", str(100 * 1024 * 1024))
+)  # Largest uncompressed size of one document in an archive
+ZIP_MAX_TOTAL_BYTES = int(
+    os.getenv("ZIP_MAX_TOTAL_BYTES", str(2 * 1024 * 1024 * 1024))
+)  # Largest uncompressed size of all documents in an archive
+ZIP_MAX_COMPRESSION_RATIO = int(
+    os.getenv("ZIP_MAX_COMPRESSION_RATIO", "100")
+)  # Higher uncompressed/compressed ratios are treated as zip bombs
+METRICS_WORKER_PORT = int(
+    os.getenv("METRICS_WORKER_PORT", "9100")
+)  # Port Celery workers serve Prometheus metrics on, 0 disables the server
+TRACING_EXPORTER = os.getenv(
+    "TRACING_EXPORTER", "none"
+)  # none, file, console, otlp or module:factory returning an OpenTelemetry SpanExporter
+TRACE_FILE = os.getenv(
+    "TRACE_FILE", "traces/spans.jsonl"
+)  # Spans are appended here with TRACING_EXPORTER=file
+TRACING_SAMPLE_RATIO = float(
+    os.getenv("TRACING_SAMPLE_RATIO", "1.0")
+)  # Share of jobs traced, tasks follow the decision made for their job
+TRACING_SERVICE_NAME = os.getenv(
+    "TRACING_SERVICE_NAME", "file-conversion"
+)  # service.name of the exported spans
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379")  # Broker and cache URL
+JOB_STATUS_CACHE_TTL = int(
+    os.getenv("JOB_STATUS_CACHE_TTL", "300")
+)  # Seconds a cached job status payload is kept in Redis
+JOB_STATUS_MAX_WAIT = int(
+    os.getenv("JOB_STATUS_MAX_WAIT", "30")
+)  # Longest long-poll allowed with ?wait= on the job status endpoint
+LIST_PAGE_MAX_SIZE = int(
+    os.getenv("LIST_PAGE_MAX_SIZE", "500")
+)  # Largest ?limit= of the job and file listings
+SSE_HEARTBEAT_INTERVAL = int(
+    os.getenv("SSE_HEARTBEAT_INTERVAL", "15")
+)  # Seconds between keep-alive comments on job event streams
+CONVERSION_CACHE_ENABLED = (
+    os.getenv("CONVERSION_CACHE_ENABLED", "true").lower() == "true"
+)  # Reuse PDFs of documents that were converted before
+CONVERSION_CACHE_DIR = os.getenv(
+    "CONVERSION_CACHE_DIR", "conversion_cache"
+)  # Directory for cached PDFs when S3 is not used
+CONVERSION_CACHE_S3_PREFIX = os.getenv(
+    "CONVERSION_CACHE_S3_PREFIX", "conversion-cache"
+)  # S3 prefix for cached PDFs
+CONVERSION_CACHE_MAX_BYTES = int(
+    os.getenv("CONVERSION_CACHE_MAX_BYTES", str(5 * 1024 * 1024 * 1024))
+)  # Least recently used entries are evicted above this size
+CONVERSION_CACHE_TTL = int(
+    os.getenv("CONVERSION_CACHE_TTL", str(7 * 24 * 3600))
+)  # Seconds a cached PDF stays valid
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, String, DateTime, Enum, ForeignKey
+from sqlalchemy import Column, String, DateTime, Enum, ForeignKey, Index, Integer
 from sqlalchemy.dialects.postgresql import UUID
 from sqlalchemy.orm import relationship
 
@@ -9,10 +9,12 @@ import enum
 
 
 class JobStatusEnum(str, enum.Enum):
+    uploading = "uploading"  # Waiting for its ZIP to be stored
     pending = "pending"
     in_progress = "in_progress"
     completed = "completed"
     failed = "failed"
+    cancelled = "cancelled"  # Stopped by DELETE /api/v1/jobs/{job_id}
 
 
 class Job(Base):
@@ -21,11 +23,48 @@ class Job(Base):
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     status = Column(Enum(JobStatusEnum), default=JobStatusEnum.pending)
     created_at = Column(DateTime, default=datetime.now)
+    # Advanced by every progress update, stuck jobs are found by it
+    updated_at = Column(DateTime, default=datetime.now, onupdate=datetime.now)
     download_url = Column(String, nullable=True)
+    # Maintained with atomic UPDATEs by the workers, see app/tasks.py
+    total_files = Column(Integer, nullable=False, default=0, server_default="0")
+    completed_files = Column(Integer, nullable=False, default=0, server_default="0")
+    failed_files = Column(Integer, nullable=False, default=0, server_default="0")
+    # Weight of the job in the fair-share scheduler, see app/services/fair_scheduler.py
+    priority = Column(Integer, nullable=False, default=1, server_default="1")
+    # Why the job failed as a whole, e.g. its archive was rejected
+    error_message = Column(String, nullable=True)
+    # Uploaded ZIP (S3 key or local path), extracted again by the recovery
+    # sweep when its unzip task was lost
+    archive_path = Column(String, nullable=True)
+    # Set by the retention sweep once the inputs (or all files) are removed
+    inputs_expired_at = Column(DateTime, nullable=True)
+    outputs_expired_at = Column(DateTime, nullable=True)
     file_conversions = relationship(
         "FileConversion", back_populates="job", cascade="all, delete-orphan"
     )
 
+    __table_args__ = (
+        Index("ix_jobs_status_updated_at", "status", "updated_at"),
+        # Job listings (keyset-paginated on created_at, id) and retention
+        # sweeps, which look for finished jobs by age
+        Index("ix_jobs_status_created_at_id", "status", "created_at", "id"),
+        Index("ix_jobs_created_at_id", "created_at", "id"),
+        # Retention sweeps, which look for finished jobs not expired yet
+        Index(
+            "ix_jobs_inputs_unexpired",
+            "status",
+            "updated_at",
+            postgresql_where=inputs_expired_at.is_(None),
+        ),
+        Index(
+            "ix_jobs_outputs_unexpired",
+            "status",
+            "updated_at",
+            postgresql_where=outputs_expired_at.is_(None),
+        ),
+    )
+
 
 class FileConversion(Base):
     __tablename__ = "file_conversions"
@@ -40,3 +79,11 @@ class FileConversion(Base):
     status = Column(Enum(JobStatusEnum), default=JobStatusEnum.pending)
     error_message = Column(String, nullable=True)
     created_at = Column(DateTime, default=datetime.now)
+    updated_at = Column(DateTime, default=datetime.now, onupdate=datetime.now)
+
+    __table_args__ = (
+        # Files are looked up by job, often for one status only
+        Index("ix_file_conversions_job_id_status", "job_id", "status"),
+        # File listing of a job, keyset-paginated on (file_name, id)
+        Index("ix_file_conversions_job_id_file_name_id", "job_id", "file_name", "id"),
+    )
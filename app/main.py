@@ -1,14 +1,43 @@
-from fastapi import FastAPI
+import time
+
+from fastapi import FastAPI, Request, Response
 from fastapi.staticfiles import StaticFiles
 from app.api.v1.jobs import upload_router
+from app.api.v1.cache import cache_router
 import os
 from app.config import USE_S3
+from app.metrics import HTTP_REQUEST_SECONDS, latest_api_metrics
 
 app = FastAPI()
 
 app.include_router(upload_router, prefix="/api/v1/jobs", tags=["upload"])
+app.include_router(cache_router, prefix="/api/v1/cache", tags=["cache"])
 
 
 @app.get("/")
 async def root():
     return {"message": "Welcome to the File Upload API"}
+
+
+@app.middleware("http")
+async def observe_request_latency(request: Request, call_next):
+    start = time.perf_counter()
+    response = await call_next(request)
+    # The route template keeps one series per endpoint, not per job id
+    route = request.scope.get("route")
+    HTTP_REQUEST_SECONDS.labels(
+        method=request.method,
+        route=route.path if route else "unmatched",
+        status=response.status_code,
+    ).observe(time.perf_counter() - start)
+    return response
+
+
+@app.get("/metrics", include_in_schema=False)
+def metrics():
+    """
+    Prometheus metrics of the API and the broker queue depths. Workers
+    serve theirs on METRICS_WORKER_PORT.
+    """
+    content, content_type = latest_api_metrics()
+    return Response(content=content, media_type=content_type)
@@ -0,0 +1,208 @@
+import glob
+import os
+import time
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Histogram,
+    generate_latest,
+    multiprocess,
+    start_http_server,
+)
+from prometheus_client.core import GaugeMetricFamily
+from sqlalchemy import event
+
+from app.config import USE_FAIR_SCHEDULER
+
+# Celery queues whose depth is exported, see the worker commands
+QUEUES = ("file_conversion_queue", "libre_queue", "zip_queue")
+# Kombu keeps messages sent with a priority in one Redis list per step
+PRIORITY_STEPS = (3, 6, 9)
+PRIORITY_SEPARATOR = "\x06\x16"
+
+STAGE_SECONDS = Histogram(
+    "conversion_stage_seconds",
+    "Duration of a pipeline stage: s3_download, conversion, s3_upload, unzip, zip",
+    ["stage"],
+    buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600),
+)
+TASK_WAIT_SECONDS = Histogram(
+    "celery_task_wait_seconds",
+    "Time between publishing a task and a worker starting it",
+    ["task", "queue"],
+    buckets=(0.01, 0.05, 0.1, 0.5, 1, 5, 10, 30, 60, 300, 900, 3600),
+)
+CONVERSIONS = Counter(
+    "file_conversions_total",
+    "Converted files by outcome, failures by error class",
+    ["status", "error_class"],
+)
+TRANSFERRED_BYTES = Counter(
+    "transferred_bytes_total",
+    "Bytes received (in) or sent (out) by a stage",
+    ["direction", "stage"],
+)
+DB_QUERY_SECONDS = Histogram(
+    "db_query_seconds",
+    "Database statement latency by statement type",
+    ["operation"],
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5),
+)
+HTTP_REQUEST_SECONDS = Histogram(
+    "http_request_seconds",
+    "API request latency by route",
+    ["method", "route", "status"],
+)
+
+
+def stage_timer(stage: str):
+    """
+    Time a pipeline stage, usable as a context manager or decorator.
+    """
+    return STAGE_SECONDS.labels(stage=stage).time()
+
+
+def observe_stage(stage: str, seconds: float):
+    STAGE_SECONDS.labels(stage=stage).observe(seconds)
+
+
+def record_conversion(status: str, error_class: str = ""):
+    CONVERSIONS.labels(status=status, error_class=error_class).inc()
+
+
+def record_bytes(direction: str, stage: str, size: int):
+    TRANSFERRED_BYTES.labels(direction=direction, stage=stage).inc(size)
+
+
+def record_task_wait(task_name: str, queue: str, published_at: float):
+    # Publisher and worker clocks may differ slightly, never report < 0
+    wait = max(0.0, time.time() - published_at)
+    TASK_WAIT_SECONDS.labels(task=task_name, queue=queue or "").observe(wait)
+
+
+def instrument_engine(engine):
+    """
+    Record the latency of every statement run on a (sync) SQLAlchemy
+    engine; pass `async_engine.sync_engine` for an async one.
+    """
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def start_timer(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def stop_timer(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info["query_start"].pop()
+        operation = statement.lstrip().split(" ", 1)[0].upper() or "OTHER"
+        DB_QUERY_SECONDS.labels(operation=operation).observe(elapsed)
+
+    @event.listens_for(engine, "handle_error")
+    def discard_timer(context):
+        starts = (
+            context.connection.info.get("query_start") if context.connection else None
+        )
+        if starts:
+            starts.pop()
+
+
+class QueueDepthCollector:
+    """
+    Messages waiting in the broker queues, read from Redis on every scrape.
+    With USE_FAIR_SCHEDULER also the conversions held by the scheduler.
+    """
+
+    def collect(self):
+        from app.redis_client import get_redis
+        from app.services.fair_scheduler import scheduler_backlog
+
+        depth = GaugeMetricFamily(
+            "celery_queue_depth", "Messages waiting in a queue", labels=["queue"]
+        )
+        try:
+            pipe = get_redis().pipeline(transaction=False)
+            for queue in QUEUES:
+                pipe.llen(queue)
+                for step in PRIORITY_STEPS:
+                    pipe.llen(f"{queue}{PRIORITY_SEPARATOR}{step}")
+            lengths = pipe.execute()
+            per_queue = len(PRIORITY_STEPS) + 1
+            for index, queue in enumerate(QUEUES):
+                depth.add_metric(
+                    [queue], sum(lengths[index * per_queue : (index + 1) * per_queue])
+                )
+            if USE_FAIR_SCHEDULER:
+                held, in_flight = scheduler_backlog()
+                depth.add_metric(["fair_scheduler"], held)
+                yield GaugeMetricFamily(
+                    "fair_scheduler_in_flight",
+                    "Conversions released by the fair scheduler and not finished",
+                    value=in_flight,
+                )
+        except Exception as e:
+            print(f"Could not read queue depths: {e}")
+        yield depth
+
+
+def _registry() -> CollectorRegistry:
+    """
+    Registry to export. Prefork Celery workers write their metrics to
+    PROMETHEUS_MULTIPROC_DIR, which is aggregated over all processes.
+    """
+    if "PROMETHEUS_MULTIPROC_DIR" not in os.environ:
+        return REGISTRY
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    return registry
+
+
+_api_registry = None
+
+
+def latest_api_metrics() -> tuple[bytes, str]:
+    """
+    Metrics of the API process and the broker queue depths, as the
+    Prometheus text exposition and its content type.
+    """
+    global _api_registry
+    if _api_registry is None:
+        _api_registry = _registry()
+        _api_registry.register(QueueDepthCollector())
+    return generate_latest(_api_registry), CONTENT_TYPE_LATEST
+
+
+def _clear_dead_process_files(directory: str):
+    """
+    Remove the metric files of processes of an earlier run. Live processes
+    (another worker sharing the directory) keep theirs.
+    """
+    for path in glob.glob(os.path.join(directory, "*.db")):
+        try:
+            pid = int(os.path.basename(path)[: -len(".db")].rsplit("_", 1)[1])
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            os.remove(path)
+        except (ValueError, IndexError, PermissionError):
+            continue
+
+
+def start_worker_metrics_server(port: int):
+    """
+    Serve the metrics of a Celery worker and its pool processes on `port`.
+    Called once in the main worker process before the pool starts.
+    """
+    directory = os.environ.get("PROMETHEUS_MULTIPROC_DIR")
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+        _clear_dead_process_files(directory)
+    else:
+        print("PROMETHEUS_MULTIPROC_DIR is not set, pool process metrics are lost")
+    start_http_server(port, registry=_registry())
+    print(f"Serving worker metrics on port {port}")
+
+
+def mark_process_dead(pid: int):
+    if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+        multiprocess.mark_process_dead(pid)
@@ -0,0 +1,27 @@
+import redis
+import redis.asyncio
+
+from app.config import REDIS_URL
+
+_client = None
+_async_client = None
+
+
+def get_redis() -> redis.Redis:
+    """
+    Return the shared Redis client, created on first use.
+    """
+    global _client
+    if _client is None:
+        _client = redis.Redis.from_url(REDIS_URL, decode_responses=True)
+    return _client
+
+
+def get_async_redis() -> redis.asyncio.Redis:
+    """
+    Return the shared asyncio Redis client used by the API.
+    """
+    global _async_client
+    if _async_client is None:
+        _async_client = redis.asyncio.Redis.from_url(REDIS_URL, decode_responses=True)
+    return _async_client
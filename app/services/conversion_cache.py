@@ -0,0 +1,255 @@
+import hashlib
+import os
+import shutil
+import subprocess
+import time
+from datetime import datetime, timezone
+from functools import lru_cache
+from pathlib import Path
+from typing import Optional
+
+from botocore.exceptions import ClientError
+
+from app.config import (
+    CONVERSION_CACHE_DIR,
+    CONVERSION_CACHE_ENABLED,
+    CONVERSION_CACHE_MAX_BYTES,
+    CONVERSION_CACHE_S3_PREFIX,
+    CONVERSION_CACHE_TTL,
+    LIBREOFFICE_BINARY,
+    S3_BUCKET_NAME,
+    USE_S3,
+)
+from app.redis_client import get_redis
+from app.services.s3_client import get_s3_client
+
+# Converter options that influence the produced PDF, part of every cache key
+CONVERSION_OPTIONS = "pdf:writer_pdf_Export"
+STATS_KEY = "conversion_cache:stats"
+EVICT_INTERVAL = 60  # Seconds between eviction passes of one process
+# S3 hits rewrite the access time once it is older than this share of the TTL
+ACCESS_REFRESH_FRACTION = 0.1
+
+
+@lru_cache(maxsize=1)
+def converter_version() -> str:
+    """
+    Version string of the installed LibreOffice, so upgrading the
+    converter never serves PDFs produced by the previous version.
+    """
+    try:
+        result = subprocess.run(
+            [LIBREOFFICE_BINARY, "--version"],
+            capture_output=True,
+            text=True,
+            timeout=60,
+        )
+        return result.stdout.strip() or "unknown"
+    except Exception as e:
+        print(f"Could not determine LibreOffice version: {e}")
+        return "unknown"
+
+
+def cache_key(docx_path: str) -> str:
+    """
+    Content address of a conversion: hash of the input document together
+    with the converter version and options.
+    """
+    digest = hashlib.sha256()
+    digest.update(converter_version().encode())
+    digest.update(b"\0")
+    digest.update(CONVERSION_OPTIONS.encode())
+    digest.update(b"\0")
+    with open(docx_path, "rb") as f:
+        while chunk := f.read(1024 * 1024):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def record_lookup(hit: bool):
+    try:
+        get_redis().hincrby(STATS_KEY, "hits" if hit else "misses", 1)
+    except Exception as e:
+        print(f"Could not record conversion cache stats: {e}")
+
+
+def get_cache_stats() -> dict:
+    """
+    Hit and miss counters across all workers.
+    """
+    stats = get_redis().hgetall(STATS_KEY)
+    hits = int(stats.get("hits", 0))
+    misses = int(stats.get("misses", 0))
+    lookups = hits + misses
+    return {
+        "hits": hits,
+        "misses": misses,
+        "hit_ratio": hits / lookups if lookups else 0.0,
+    }
+
+
+class LocalConversionCache:
+    """
+    PDF cache on local disk. Hits refresh the file mtime, which is used
+    for least recently used eviction.
+    """
+
+    def __init__(self, directory: str, max_bytes: int, ttl: int):
+        self.directory = Path(directory)
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._last_evict = 0.0
+
+    def _path(self, key: str) -> Path:
+        return self.directory / key[:2] / f"{key}.pdf"
+
+    def get(self, key: str, dest_path: str) -> bool:
+        path = self._path(key)
+        try:
+            if time.time() - path.stat().st_mtime > self.ttl:
+                path.unlink(missing_ok=True)
+                return False
+            # Renamed into place, a PDF under its final name is complete
+            temp_path = f"{dest_path}.{os.getpid()}.tmp"
+            shutil.copyfile(path, temp_path)
+            os.replace(temp_path, dest_path)
+            os.utime(path)
+            return True
+        except FileNotFoundError:
+            return False
+
+    def put(self, key: str, pdf_path: str):
+        path = self._path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        temp_path = path.with_suffix(f".{os.getpid()}.tmp")
+        shutil.copyfile(pdf_path, temp_path)
+        os.replace(temp_path, path)
+        if time.monotonic() - self._last_evict > EVICT_INTERVAL:
+            self.evict()
+
+    def evict(self):
+        self._last_evict = time.monotonic()
+        now = time.time()
+        entries = []
+        for path in self.directory.glob("*/*.pdf"):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            if now - stat.st_mtime > self.ttl:
+                path.unlink(missing_ok=True)
+            else:
+                entries.append((stat.st_mtime, stat.st_size, path))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            path.unlink(missing_ok=True)
+            total -= size
+
+
+class S3ConversionCache:
+    """
+    PDF cache under an S3 prefix. Hits rewrite the object metadata in place
+    so LastModified reflects the last access for eviction, at most once per
+    ACCESS_REFRESH_FRACTION of the TTL. Evicted by the retention sweep.
+    """
+
+    def __init__(self, prefix: str, max_bytes: int, ttl: int):
+        self.prefix = prefix.strip("/")
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+
+    def _key(self, key: str) -> str:
+        return f"{self.prefix}/{key[:2]}/{key}.pdf"
+
+    def get(self, key: str, dest_path: str) -> bool:
+        s3_key = self._key(key)
+        try:
+            head = get_s3_client().head_object(Bucket=S3_BUCKET_NAME, Key=s3_key)
+        except ClientError as e:
+            if e.response["Error"]["Code"] in ("404", "NoSuchKey", "NotFound"):
+                return False
+            raise
+        # The last access, copy_object below refreshes LastModified
+        age = (datetime.now(timezone.utc) - head["LastModified"]).total_seconds()
+        if age > self.ttl:
+            get_s3_client().delete_object(Bucket=S3_BUCKET_NAME, Key=s3_key)
+            return False
+        # Renamed into place, a PDF under its final name is complete
+        temp_path = f"{dest_path}.{os.getpid()}.tmp"
+        get_s3_client().download_file(S3_BUCKET_NAME, s3_key, temp_path)
+        os.replace(temp_path, dest_path)
+        if age > self.ttl * ACCESS_REFRESH_FRACTION:
+            get_s3_client().copy_object(
+                Bucket=S3_BUCKET_NAME,
+                Key=s3_key,
+                CopySource={"Bucket": S3_BUCKET_NAME, "Key": s3_key},
+                Metadata={"last-access": str(int(time.time()))},
+                MetadataDirective="REPLACE",
+            )
+        return True
+
+    def put(self, key: str, pdf_path: str):
+        get_s3_client().upload_file(pdf_path, S3_BUCKET_NAME, self._key(key))
+
+    def evict(self) -> int:
+        """
+        Delete expired entries, then least recently used ones until the
+        cache fits CONVERSION_CACHE_MAX_BYTES. Lists the whole prefix, so
+        it runs once per retention sweep rather than from every worker.
+        Returns the number of entries deleted.
+        """
+        now = datetime.now(timezone.utc)
+        expired, entries = [], []
+        paginator = get_s3_client().get_paginator("list_objects_v2")
+        for page in paginator.paginate(Bucket=S3_BUCKET_NAME, Prefix=f"{self.prefix}/"):
+            for obj in page.get("Contents", []):
+                if (now - obj["LastModified"]).total_seconds() > self.ttl:
+                    expired.append(obj["Key"])
+                else:
+                    entries.append((obj["LastModified"], obj["Size"], obj["Key"]))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, s3_key in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            expired.append(s3_key)
+            total -= size
+
+        for start in range(0, len(expired), 1000):
+            get_s3_client().delete_objects(
+                Bucket=S3_BUCKET_NAME,
+                Delete={
+                    "Objects": [{"Key": k} for k in expired[start : start + 1000]],
+                    "Quiet": True,
+                },
+            )
+        return len(expired)
+
+
+_cache = None
+
+
+def get_conversion_cache() -> Optional[LocalConversionCache | S3ConversionCache]:
+    """
+    Return the configured conversion cache, or None when caching is disabled.
+    """
+    global _cache
+    if not CONVERSION_CACHE_ENABLED:
+        return None
+    if _cache is None:
+        if USE_S3:
+            _cache = S3ConversionCache(
+                CONVERSION_CACHE_S3_PREFIX,
+                CONVERSION_CACHE_MAX_BYTES,
+                CONVERSION_CACHE_TTL,
+            )
+        else:
+            _cache = LocalConversionCache(
+                CONVERSION_CACHE_DIR,
+                CONVERSION_CACHE_MAX_BYTES,
+                CONVERSION_CACHE_TTL,
+            )
+    return _cache
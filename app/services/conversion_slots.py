@@ -0,0 +1,129 @@
+import fcntl
+import os
+import shutil
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Iterator, Optional
+
+from app.config import (
+    LIBREOFFICE_SLOT_DIR,
+    LIBREOFFICE_SLOT_MEMORY,
+    LIBREOFFICE_SLOTS,
+)
+
+
+def available_cpus() -> int:
+    """
+    CPUs this process may use, honouring the affinity mask and a cgroup
+    (container) CPU quota.
+    """
+    cpus = len(os.sched_getaffinity(0))
+    try:
+        quota, period = Path("/sys/fs/cgroup/cpu.max").read_text().split()
+        if quota != "max":
+            cpus = min(cpus, max(1, int(quota) // int(period)))
+    except (OSError, ValueError):
+        pass
+    return max(cpus, 1)
+
+
+def available_memory() -> Optional[int]:
+    """
+    Memory available to this host or container in bytes, None if unknown.
+    """
+    limits = []
+    try:
+        limits.append(os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES"))
+    except (OSError, ValueError):
+        pass
+    for limit_file in (
+        "/sys/fs/cgroup/memory.max",
+        "/sys/fs/cgroup/memory/memory.limit_in_bytes",
+    ):
+        try:
+            limits.append(int(Path(limit_file).read_text()))
+        except (OSError, ValueError):
+            # "max" means no limit
+            pass
+    return min(limits) if limits else None
+
+
+def conversion_slot_count() -> int:
+    """
+    Concurrent LibreOffice conversions per host: LIBREOFFICE_SLOTS, or one
+    per available CPU as far as LIBREOFFICE_SLOT_MEMORY each fits in memory.
+    """
+    if LIBREOFFICE_SLOTS > 0:
+        return LIBREOFFICE_SLOTS
+    slots = available_cpus()
+    memory = available_memory()
+    if memory:
+        slots = min(slots, memory // LIBREOFFICE_SLOT_MEMORY)
+    return max(slots, 1)
+
+
+class ConversionSlot:
+    """
+    A LibreOffice user profile and scratch output directory used by one
+    conversion at a time. Concurrent soffice runs sharing a profile corrupt
+    each other's lock files and settings, and a shared output directory
+    mixes up PDFs of documents with the same name.
+    """
+
+    def __init__(self, index: int):
+        self.index = index
+        self.root = os.path.join(LIBREOFFICE_SLOT_DIR, f"slot-{index}")
+        self.profile_dir = os.path.join(self.root, "profile")
+        self.scratch_dir = os.path.join(self.root, "out")
+
+    @property
+    def user_installation(self) -> str:
+        return f"-env:UserInstallation={Path(self.profile_dir).as_uri()}"
+
+    def reset_profile(self):
+        """
+        Drop the profile, e.g. after a killed run left its lock file behind.
+        The next conversion in this slot creates a new one.
+        """
+        shutil.rmtree(self.profile_dir, ignore_errors=True)
+
+    def prepare(self):
+        # The profile survives between conversions, initialising one is slow
+        os.makedirs(self.profile_dir, exist_ok=True)
+        shutil.rmtree(self.scratch_dir, ignore_errors=True)
+        os.makedirs(self.scratch_dir)
+
+
+@contextmanager
+def conversion_slot() -> Iterator[ConversionSlot]:
+    """
+    Hold one of the host's conversion slots, waiting for a free one.
+    Slots are claimed with flock on a file per slot, so they are shared by
+    every worker process on the host and freed when a process dies.
+    """
+    os.makedirs(LIBREOFFICE_SLOT_DIR, exist_ok=True)
+    slots = conversion_slot_count()
+    # Different processes start probing at different slots
+    first = os.getpid() % slots
+    while True:
+        for offset in range(slots):
+            index = (first + offset) % slots
+            fd = os.open(
+                os.path.join(LIBREOFFICE_SLOT_DIR, f"slot-{index}.lock"),
+                os.O_CREAT | os.O_RDWR,
+            )
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                os.close(fd)
+                continue
+            try:
+                slot = ConversionSlot(index)
+                slot.prepare()
+                yield slot
+                return
+            finally:
+                fcntl.flock(fd, fcntl.LOCK_UN)
+                os.close(fd)
+        time.sleep(0.1)
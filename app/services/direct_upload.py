@@ -0,0 +1,200 @@
+import asyncio
+import math
+import re
+import uuid
+from typing import List, Optional
+from urllib.parse import unquote_plus
+
+from botocore.exceptions import ClientError
+from sqlalchemy import update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config import (
+    DIRECT_UPLOAD_MAX_BYTES,
+    DIRECT_UPLOAD_URL_EXPIRY,
+    S3_BUCKET_NAME,
+    S3_UPLOAD_PART_SIZE,
+)
+from app.database.models import Job, JobStatusEnum
+from app.services.s3_client import get_presign_s3_client, get_s3_client
+from app.tasks import unzip_and_schedule_file_conversion
+from app.tracing import set_job_id, span, traced
+
+# S3 allows at most 10000 parts per multipart upload
+MAX_UPLOAD_PARTS = 10000
+
+UPLOAD_KEY_PATTERN = re.compile(r"^([0-9a-f-]{36})/upload\.zip$")
+
+
+def direct_upload_key(job_id: uuid.UUID) -> str:
+    return f"{job_id}/upload.zip"
+
+
+def presign_direct_upload(job_id: uuid.UUID, size: Optional[int] = None) -> dict:
+    """
+    Presign the upload of a job's ZIP straight to the bucket.
+    Without a size, or for a ZIP that fits in one part, the client gets a
+    presigned POST limited to DIRECT_UPLOAD_MAX_BYTES. Larger ZIPs get a
+    multipart upload with one presigned URL per part, so the client can
+    send the parts in parallel.
+    """
+    key = direct_upload_key(job_id)
+    presign = get_presign_s3_client()
+    if size is None or size <= S3_UPLOAD_PART_SIZE:
+        post = presign.generate_presigned_post(
+            Bucket=S3_BUCKET_NAME,
+            Key=key,
+            Conditions=[["content-length-range", 1, DIRECT_UPLOAD_MAX_BYTES]],
+            ExpiresIn=DIRECT_UPLOAD_URL_EXPIRY,
+        )
+        return {"key": key, "expires_in": DIRECT_UPLOAD_URL_EXPIRY, "post": post}
+
+    part_size = max(S3_UPLOAD_PART_SIZE, math.ceil(size / MAX_UPLOAD_PARTS))
+    upload = get_s3_client().create_multipart_upload(Bucket=S3_BUCKET_NAME, Key=key)
+    upload_id = upload["UploadId"]
+    parts = [
+        {
+            "part_number": part_number,
+            "url": presign.generate_presigned_url(
+                "upload_part",
+                Params={
+                    "Bucket": S3_BUCKET_NAME,
+                    "Key": key,
+                    "UploadId": upload_id,
+                    "PartNumber": part_number,
+                },
+                ExpiresIn=DIRECT_UPLOAD_URL_EXPIRY,
+            ),
+        }
+        for part_number in range(1, math.ceil(size / part_size) + 1)
+    ]
+    return {
+        "key": key,
+        "expires_in": DIRECT_UPLOAD_URL_EXPIRY,
+        "upload_id": upload_id,
+        "part_size": part_size,
+        "parts": parts,
+    }
+
+
+@traced("s3.finish_direct_upload")
+def finish_direct_upload(
+    job_id: uuid.UUID,
+    upload_id: Optional[str] = None,
+    parts: Optional[List[dict]] = None,
+) -> bool:
+    """
+    Complete the multipart upload of a job if there is one, then check
+    the ZIP is in the bucket. Parts the client does not report are listed
+    from S3. Returns False when no uploaded ZIP exists.
+    """
+    s3 = get_s3_client()
+    key = direct_upload_key(job_id)
+    if upload_id:
+        if parts is None:
+            listed = s3.list_parts(Bucket=S3_BUCKET_NAME, Key=key, UploadId=upload_id)
+            parts = [
+                {"PartNumber": part["PartNumber"], "ETag": part["ETag"]}
+                for part in listed.get("Parts", [])
+            ]
+        try:
+            s3.complete_multipart_upload(
+                Bucket=S3_BUCKET_NAME,
+                Key=key,
+                UploadId=upload_id,
+                MultipartUpload={
+                    "Parts": sorted(parts, key=lambda part: part["PartNumber"])
+                },
+            )
+        except ClientError as e:
+            # A retried completion finds the upload already gone
+            if e.response["Error"]["Code"] != "NoSuchUpload":
+                raise
+    return uploaded_zip_exists(job_id)
+
+
+def uploaded_zip_exists(job_id: uuid.UUID) -> bool:
+    """
+    Whether the ZIP of a direct upload is in the bucket. An oversized ZIP
+    is deleted and counts as missing.
+    """
+    s3 = get_s3_client()
+    key = direct_upload_key(job_id)
+    try:
+        size = s3.head_object(Bucket=S3_BUCKET_NAME, Key=key)["ContentLength"]
+    except ClientError as e:
+        if e.response["Error"]["Code"] in ("404", "NoSuchKey", "NotFound"):
+            return False
+        raise
+    if size > DIRECT_UPLOAD_MAX_BYTES:
+        s3.delete_object(Bucket=S3_BUCKET_NAME, Key=key)
+        return False
+    return True
+
+
+async def create_direct_upload(
+    db: AsyncSession, size: Optional[int] = None, priority: int = 1
+) -> tuple[uuid.UUID, dict]:
+    """
+    Create a job waiting for its ZIP and presign the upload.
+    """
+    job = Job(status=JobStatusEnum.uploading, priority=priority)
+    db.add(job)
+    await db.commit()
+    print(f"Job created with ID: {job.id}, waiting for direct upload")
+    upload = await asyncio.to_thread(presign_direct_upload, job.id, size)
+    return job.id, upload
+
+
+async def start_ingestion(db: AsyncSession, job_id: uuid.UUID) -> bool:
+    """
+    Move an uploading job to pending and schedule the unzip task.
+    The status flip is one conditional UPDATE, so a completion call and a
+    bucket notification for the same upload schedule the job only once.
+    Returns False when the job was not waiting for its upload.
+    """
+    # Root span of the job's trace, the tasks continue it
+    with span("start_ingestion", job_id=job_id):
+        set_job_id(job_id)
+        result = await db.execute(
+            update(Job)
+            .where(Job.id == job_id, Job.status == JobStatusEnum.uploading)
+            .values(
+                status=JobStatusEnum.pending, archive_path=direct_upload_key(job_id)
+            )
+            .returning(Job.id)
+        )
+        if result.first() is None:
+            await db.rollback()
+            return False
+        await db.commit()
+        unzip_and_schedule_file_conversion.apply_async(
+            (direct_upload_key(job_id), job_id), queue="file_conversion_queue"
+        )
+    print(f"Direct upload of job {job_id} received, scheduled unzip")
+    return True
+
+
+def uploaded_job_ids(event: dict) -> List[uuid.UUID]:
+    """
+    Extract the jobs whose ZIP was created from an S3 event notification
+    (the format S3, SNS raw delivery and MinIO webhooks share).
+    """
+    job_ids = []
+    for record in event.get("Records", []):
+        if not record.get("eventName", "").startswith(
+            ("ObjectCreated", "s3:ObjectCreated")
+        ):
+            continue
+        s3 = record.get("s3", {})
+        if s3.get("bucket", {}).get("name") != S3_BUCKET_NAME:
+            continue
+        match = UPLOAD_KEY_PATTERN.match(
+            unquote_plus(s3.get("object", {}).get("key", ""))
+        )
+        if match:
+            try:
+                job_ids.append(uuid.UUID(match.group(1)))
+            except ValueError:
+                continue
+    return job_ids
@@ -0,0 +1,181 @@
+import json
+import time
+import uuid
+
+from app.celery import celery_app
+from app.config import (
+    FAIR_SCHEDULER_LEASE_TIMEOUT,
+    FAIR_SCHEDULER_MAX_IN_FLIGHT,
+)
+from app.redis_client import get_redis
+from app.tracing import inject_trace_context
+
+ACTIVE_JOBS_KEY = "fair_scheduler:active"
+WEIGHTS_KEY = "fair_scheduler:weights"
+VIRTUAL_TIME_KEY = "fair_scheduler:virtual_time"
+IN_FLIGHT_KEY = "fair_scheduler:in_flight"
+JOB_QUEUE_PREFIX = "fair_scheduler:job:"
+
+# Queue conversions of a job. A job becoming active starts at the current
+# virtual time, so it neither waits behind nor jumps ahead of the backlog.
+ENQUEUE_SCRIPT = """
+redis.call('RPUSH', KEYS[1], unpack(ARGV, 3))
+redis.call('HSET', KEYS[3], ARGV[1], ARGV[2])
+redis.call('ZADD', KEYS[2], 'NX', redis.call('GET', KEYS[4]) or 0, ARGV[1])
+"""
+
+# Stride scheduling: release conversions of the job with the lowest pass
+# while fewer than the maximum are in flight. Each release advances the
+# job's pass by 1 / weight, so a job of weight 4 gets four times the
+# releases of a job of weight 1. Leases older than the timeout are dropped,
+# a worker that died mid-task cannot hold its slot forever.
+RELEASE_SCRIPT = """
+redis.call('ZREMRANGEBYSCORE', KEYS[2], '-inf', tonumber(ARGV[1]) - tonumber(ARGV[2]))
+local released = {}
+while redis.call('ZCARD', KEYS[2]) < tonumber(ARGV[3]) do
+    local head = redis.call('ZRANGE', KEYS[1], 0, 0, 'WITHSCORES')
+    if #head == 0 then
+        break
+    end
+    local job, pass = head[1], tonumber(head[2])
+    local job_queue = ARGV[4] .. job
+    local payload = redis.call('LPOP', job_queue)
+    if payload then
+        redis.call('ZADD', KEYS[2], ARGV[1], cjson.decode(payload)['lease'])
+        redis.call('SET', KEYS[4], pass)
+        table.insert(released, payload)
+    end
+    if redis.call('LLEN', job_queue) == 0 then
+        redis.call('ZREM', KEYS[1], job)
+        redis.call('HDEL', KEYS[3], job)
+    else
+        local weight = tonumber(redis.call('HGET', KEYS[3], job) or '1')
+        redis.call('ZADD', KEYS[1], pass + 1 / weight, job)
+    end
+end
+return released
+"""
+
+
+def enqueue_conversion(
+    job_id: uuid.UUID,
+    weight: int,
+    lease: str,
+    task_name: str,
+    args: list,
+    headers: dict = None,
+):
+    """
+    Hold a conversion task back in the job's queue until the scheduler
+    releases it to libre_queue. `lease` identifies the task while in flight.
+    """
+    payload = json.dumps(
+        {
+            "lease": lease,
+            "task": task_name,
+            "args": args,
+            # The task continues the job's trace whoever releases it
+            "headers": inject_trace_context(
+                {**(headers or {}), "scheduled_at": time.time()}
+            ),
+        },
+        default=str,
+    )
+    get_redis().eval(
+        ENQUEUE_SCRIPT,
+        4,
+        f"{JOB_QUEUE_PREFIX}{job_id}",
+        ACTIVE_JOBS_KEY,
+        WEIGHTS_KEY,
+        VIRTUAL_TIME_KEY,
+        str(job_id),
+        max(int(weight), 1),
+        payload,
+    )
+
+
+def release_conversions() -> int:
+    """
+    Publish as many held conversions to libre_queue as there are free
+    in-flight slots, interleaving the active jobs by weight.
+    Returns the number of released tasks.
+    """
+    released = get_redis().eval(
+        RELEASE_SCRIPT,
+        4,
+        ACTIVE_JOBS_KEY,
+        IN_FLIGHT_KEY,
+        WEIGHTS_KEY,
+        VIRTUAL_TIME_KEY,
+        time.time(),
+        FAIR_SCHEDULER_LEASE_TIMEOUT,
+        FAIR_SCHEDULER_MAX_IN_FLIGHT,
+        JOB_QUEUE_PREFIX,
+    )
+    if not released:
+        return 0
+    with celery_app.producer_or_acquire() as producer:
+        for payload in released:
+            entry = json.loads(payload)
+            celery_app.send_task(
+                entry["task"],
+                args=entry["args"],
+                queue="libre_queue",
+                headers=entry.get("headers"),
+                # Known ids let a cancelled job revoke its tasks
+                task_id=entry["lease"],
+                producer=producer,
+            )
+    return len(released)
+
+
+def drop_job(job_id: uuid.UUID) -> int:
+    """
+    Discard the conversions of a job still held by the scheduler, e.g. of a
+    cancelled job. Returns the number of dropped tasks.
+    """
+    pipe = get_redis().pipeline()
+    pipe.llen(f"{JOB_QUEUE_PREFIX}{job_id}")
+    pipe.delete(f"{JOB_QUEUE_PREFIX}{job_id}")
+    pipe.zrem(ACTIVE_JOBS_KEY, str(job_id))
+    pipe.hdel(WEIGHTS_KEY, str(job_id))
+    dropped, *_ = pipe.execute()
+    return dropped
+
+
+def held_files(job_id: uuid.UUID) -> set:
+    """
+    Ids (as strings) of the files whose conversions the scheduler still
+    holds back for a job.
+    """
+    held = set()
+    for payload in get_redis().lrange(f"{JOB_QUEUE_PREFIX}{job_id}", 0, -1):
+        # A single file id or the file ids of a batch
+        file_ids = json.loads(payload)["args"][0]
+        held.update(map(str, file_ids if isinstance(file_ids, list) else [file_ids]))
+    return held
+
+
+def finish_conversion(lease: str):
+    """
+    Free the in-flight slot of a finished task and release the next ones.
+    """
+    try:
+        get_redis().zrem(IN_FLIGHT_KEY, lease)
+        release_conversions()
+    except Exception as e:
+        print(f"Fair scheduler could not release conversions: {e}")
+
+
+def scheduler_backlog() -> tuple[int, int]:
+    """
+    Conversions held back by the scheduler and conversions in flight.
+    """
+    redis = get_redis()
+    jobs = redis.zrange(ACTIVE_JOBS_KEY, 0, -1)
+    pipe = redis.pipeline(transaction=False)
+    for job in jobs:
+        pipe.llen(f"{JOB_QUEUE_PREFIX}{job}")
+    pipe.zcard(IN_FLIGHT_KEY)
+    *held, in_flight = pipe.execute()
+    return sum(held), in_flight
@@ -1,75 +1,484 @@
 import os
-import time
-from typing import List
+import shutil
+import signal
+import tempfile
+from collections import defaultdict
+from contextlib import contextmanager
+from typing import Callable, Iterator, List, Optional, Tuple
 import zipfile
 import subprocess
-from pathlib import Path
-from app.config import USE_S3
+import time
+from pathlib import Path, PurePosixPath
+from app.config import (
+    USE_S3,
+    JOB_CANCEL_POLL_INTERVAL,
+    LIBREOFFICE_BINARY,
+    LIBREOFFICE_TIMEOUT,
+    LIBREOFFICE_TIMEOUT_MAX,
+    LIBREOFFICE_TIMEOUT_PER_MB,
+    ZIP_MAX_MEMBERS,
+    ZIP_MAX_MEMBER_BYTES,
+    ZIP_MAX_TOTAL_BYTES,
+    ZIP_MAX_COMPRESSION_RATIO,
+)
+from app.services.conversion_cache import (
+    cache_key,
+    get_conversion_cache,
+    record_lookup,
+)
+from app.metrics import observe_stage, stage_timer
+from app.tracing import span, traced
+from app.services.conversion_slots import conversion_slot
+from app.services.libreoffice_pool import (
+    TEMP_PREFIX,
+    ConversionCancelled,
+    ConversionTimeout,
+    get_libreoffice_pool,
+)
+from app.services.s3_client import download_file
+
+EXTRACT_CHUNK_SIZE = 1024 * 1024
+CANCELLED = {
+    "status": "error",
+    "error_message": "Conversion cancelled",
+    "retryable": False,
+}
+
+
+def _pdf_path(docx_path: str) -> Path:
+    return Path(docx_path).parent / f"{Path(docx_path).stem}.pdf"
 
 
-def convert_docx_to_pdf(docx_path: str):
+def _temp_path(pdf_path: Path) -> Path:
+    return pdf_path.with_name(f".{pdf_path.name}.{os.getpid()}.tmp")
+
+
+def _place_pdf(source, pdf_path: Path, copy: bool = False):
+    """
+    Move (or copy) a finished PDF to its final path through a temporary
+    name in the same directory, so a PDF under its final name is never
+    partial, even when the worker dies while writing it.
+    """
+    temp_path = _temp_path(pdf_path)
+    if copy:
+        shutil.copyfile(source, temp_path)
+    else:
+        shutil.move(source, temp_path)
+    os.replace(temp_path, pdf_path)
+
+
+def _error(error_message: str, retryable: bool = False) -> dict:
+    """
+    Failed conversion result. Retryable (transient) failures may succeed on
+    another attempt, the others are final for this document.
+    """
+    return {"status": "error", "error_message": error_message, "retryable": retryable}
+
+
+def conversion_timeout(docx_paths: List[str]) -> float:
+    """
+    Seconds a converter run may take: LIBREOFFICE_TIMEOUT plus
+    LIBREOFFICE_TIMEOUT_PER_MB per MB of input, at most LIBREOFFICE_TIMEOUT_MAX
+    per document.
+    """
+    total = 0.0
+    for docx_path in docx_paths:
+        size_mb = os.path.getsize(docx_path) / (1024 * 1024)
+        total += min(
+            LIBREOFFICE_TIMEOUT + LIBREOFFICE_TIMEOUT_PER_MB * size_mb,
+            LIBREOFFICE_TIMEOUT_MAX,
+        )
+    return total
+
+
+def _run_converter(
+    command: List[str],
+    timeout: float,
+    is_cancelled: Optional[Callable[[], bool]] = None,
+) -> subprocess.CompletedProcess:
+    """
+    Run LibreOffice in a process group of its own. When it does not finish
+    within `timeout` seconds the whole group is killed: the libreoffice
+    wrapper starts soffice.bin, which would survive a kill of the wrapper.
+    Raises subprocess.TimeoutExpired after the kill, or ConversionCancelled
+    when `is_cancelled`, checked every JOB_CANCEL_POLL_INTERVAL seconds,
+    turned true.
+    """
+    process = subprocess.Popen(
+        command,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        text=True,
+        start_new_session=True,
+    )
+    deadline = time.monotonic() + timeout
+    try:
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise subprocess.TimeoutExpired(command, timeout)
+            if is_cancelled is not None and is_cancelled():
+                raise ConversionCancelled(f"{command[0]} run was cancelled")
+            try:
+                stdout, stderr = process.communicate(
+                    timeout=min(remaining, JOB_CANCEL_POLL_INTERVAL)
+                )
+                break
+            except subprocess.TimeoutExpired:
+                continue
+    except BaseException:
+        # A timeout, but also a Celery time limit or the worker shutting down
+        try:
+            os.killpg(process.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+        process.communicate()
+        raise
+    return subprocess.CompletedProcess(command, process.returncode, stdout, stderr)
+
+
+def _cache_get(cache, docx_path: str):
+    """
+    Look a document up in the conversion cache. Returns the cache key (None
+    when the lookup failed) and the success result on a hit.
+    """
+    try:
+        with span("conversion_cache.get", document=docx_path) as lookup:
+            key = cache_key(docx_path)
+            hit = cache.get(key, str(_pdf_path(docx_path)))
+            lookup.set_attribute("cache.hit", hit)
+    except Exception as e:
+        print(f"Conversion cache lookup failed for {docx_path}: {e}")
+        return None, None
+    record_lookup(hit)
+    if hit:
+        print(f"Conversion cache hit for {docx_path}")
+        return key, {"status": "success", "converted_file": str(_pdf_path(docx_path))}
+    return key, None
+
+
+def _cache_put(cache, key: str, result: dict):
+    if key is None or result["status"] != "success":
+        return
+    try:
+        with span("conversion_cache.put", document=result["converted_file"]):
+            cache.put(key, result["converted_file"])
+    except Exception as e:
+        print(f"Could not store conversion in cache: {e}")
+
+
+def convert_docx_to_pdf(
+    docx_path: str, is_cancelled: Optional[Callable[[], bool]] = None
+):
     """
     Process the uploaded file.
     This function is called by the Celery worker to handle the file conversion in the background.
+    Documents converted before are served from the conversion cache.
+    The converter is killed once `is_cancelled` returns true.
     """
+    cache = get_conversion_cache()
+    if cache is None:
+        return _convert_with_libreoffice(docx_path, is_cancelled)
+
+    key, result = _cache_get(cache, docx_path)
+    if result is not None:
+        return result
+    result = _convert_with_libreoffice(docx_path, is_cancelled)
+    _cache_put(cache, key, result)
+    return result
+
+
+def _convert_with_libreoffice(
+    docx_path: str, is_cancelled: Optional[Callable[[], bool]] = None
+):
     output_dir = Path(docx_path).parent
     print(f"Converting {output_dir} to PDF in {docx_path}")
-    # if USE_S3:
-    result = subprocess.run(
-        [
-            "libreoffice",
-            "--invisible",
-            "--convert-to",
-            "pdf:writer_pdf_Export",
-            "--outdir",
-            f"{output_dir}",
-            f"{docx_path}",
-        ],
-        capture_output=True,
-        text=True,
+
+    pool = get_libreoffice_pool()
+    if pool is not None:
+        pdf_path = _pdf_path(docx_path)
+        temp_path = _temp_path(pdf_path)
+        try:
+            with span("libreoffice.convert", document=docx_path, pooled=True):
+                with stage_timer("conversion"):
+                    pool.convert(
+                        docx_path,
+                        str(temp_path),
+                        conversion_timeout([docx_path]),
+                        is_cancelled,
+                    )
+            os.replace(temp_path, pdf_path)
+        except ConversionCancelled:
+            return dict(CANCELLED)
+        except (ConversionTimeout, ValueError) as e:
+            # The document hangs the converter or cannot be opened at all
+            return _error(str(e))
+        except Exception as e:
+            # The office process crashed or could not be started
+            return _error(str(e), retryable=True)
+        return {"status": "success", "converted_file": str(pdf_path)}
+
+    return _convert_in_slot([docx_path], is_cancelled)[docx_path]
+
+
+def _convert_in_slot(
+    docx_paths: List[str], is_cancelled: Optional[Callable[[], bool]] = None
+) -> dict:
+    """
+    Convert documents of one directory with a single LibreOffice run in a
+    conversion slot of its own, then move the PDFs next to the documents.
+    Returns the result of every input path.
+
+    A run exceeding its timeout is killed. Its documents without a PDF fail
+    for good when the run converted a single document; in a batch the
+    document that hung is not known, so they are retryable on their own.
+    """
+    timeout = conversion_timeout(docx_paths)
+    with conversion_slot() as slot:
+        start = time.perf_counter()
+        timed_out = False
+        with span(
+            "libreoffice.convert", documents=len(docx_paths), slot=slot.index
+        ) as run:
+            try:
+                result = _run_converter(
+                    [
+                        LIBREOFFICE_BINARY,
+                        slot.user_installation,
+                        "--invisible",
+                        "--convert-to",
+                        "pdf:writer_pdf_Export",
+                        "--outdir",
+                        slot.scratch_dir,
+                        *docx_paths,
+                    ],
+                    timeout,
+                    is_cancelled,
+                )
+                run.set_attribute("process.exit_code", result.returncode)
+            except ConversionCancelled:
+                run.set_attribute("cancelled", True)
+                slot.reset_profile()
+                return {docx_path: dict(CANCELLED) for docx_path in docx_paths}
+            except subprocess.TimeoutExpired:
+                timed_out = True
+                run.set_attribute("timed_out", True)
+                # The killed run may have left the profile locked or half written
+                slot.reset_profile()
+            except OSError as e:
+                return {
+                    docx_path: _error(f"Could not start LibreOffice: {e}", True)
+                    for docx_path in docx_paths
+                }
+        # One run converts the whole batch, each document gets its share
+        elapsed = (time.perf_counter() - start) / len(docx_paths)
+        for _ in docx_paths:
+            observe_stage("conversion", elapsed)
+        results = {}
+        for docx_path in docx_paths:
+            scratch_pdf = Path(slot.scratch_dir) / _pdf_path(docx_path).name
+            if scratch_pdf.exists():
+                _place_pdf(scratch_pdf, _pdf_path(docx_path))
+                results[docx_path] = {
+                    "status": "success",
+                    "converted_file": str(_pdf_path(docx_path)),
+                }
+            elif timed_out:
+                results[docx_path] = _error(
+                    f"Conversion timed out after {timeout:.0f}s",
+                    retryable=len(docx_paths) > 1,
+                )
+            elif result.returncode < 0:
+                # Killed by a signal, e.g. by the OOM killer
+                results[docx_path] = _error(
+                    f"LibreOffice was killed by signal {-result.returncode}",
+                    retryable=True,
+                )
+            else:
+                results[docx_path] = _error(result.stderr or "No PDF was produced")
+        return results
+
+
+def convert_docx_to_pdf_batch(
+    docx_paths: List[str],
+    isolate: bool = False,
+    is_cancelled: Optional[Callable[[], bool]] = None,
+) -> List[dict]:
+    """
+    Convert several documents with as few converter launches as possible.
+    Cached documents are not converted again, and identical documents within
+    the batch are converted once and copied. With `isolate` every document
+    gets a converter run of its own, so a document that hangs fails alone.
+    Conversion stops once `is_cancelled` returns true.
+    Returns one result per input path, in the same order.
+    """
+    cache = get_conversion_cache()
+    if cache is None:
+        return _convert_batch_with_libreoffice(docx_paths, isolate, is_cancelled)
+
+    results = {}
+    pending = []  # (cache key, path) of documents that need converting
+    first_by_key = {}
+    duplicates = []
+    for docx_path in docx_paths:
+        key, result = _cache_get(cache, docx_path)
+        if result is not None:
+            results[docx_path] = result
+        elif key is not None and key in first_by_key:
+            duplicates.append((docx_path, first_by_key[key]))
+        else:
+            if key is not None:
+                first_by_key[key] = docx_path
+            pending.append((key, docx_path))
+
+    converted = _convert_batch_with_libreoffice(
+        [path for _, path in pending], isolate, is_cancelled
     )
+    for (key, docx_path), result in zip(pending, converted):
+        results[docx_path] = result
+        _cache_put(cache, key, result)
+
+    for docx_path, original_path in duplicates:
+        result = results[original_path]
+        if result["status"] == "success":
+            _place_pdf(result["converted_file"], _pdf_path(docx_path), copy=True)
+            result = {"status": "success", "converted_file": str(_pdf_path(docx_path))}
+        results[docx_path] = result
+    return [results[docx_path] for docx_path in docx_paths]
 
-    if result.returncode == 0:
-        pdf_path = docx_path.replace(".docx", ".pdf")
-        time.sleep(0.1)
 
-        return {
-            "status": "success",
-            "converted_file": f"{output_dir}/{Path(pdf_path).name}",
-        }
-    time.sleep(0.1)
-    return {"status": "error", "error_message": result.stderr}
+def _convert_batch_with_libreoffice(
+    docx_paths: List[str],
+    isolate: bool = False,
+    is_cancelled: Optional[Callable[[], bool]] = None,
+) -> List[dict]:
+    """
+    Pooled instances convert the files one after another, otherwise a single
+    LibreOffice invocation converts every file sharing an output directory.
+    """
+    if isolate or get_libreoffice_pool() is not None:
+        results = []
+        for docx_path in docx_paths:
+            if is_cancelled is not None and is_cancelled():
+                results.append(dict(CANCELLED))
+            else:
+                results.append(_convert_with_libreoffice(docx_path, is_cancelled))
+        return results
+
+    by_output_dir = defaultdict(list)
+    for docx_path in docx_paths:
+        by_output_dir[Path(docx_path).parent].append(docx_path)
+
+    results = {}
+    for output_dir, paths in by_output_dir.items():
+        print(f"Converting {len(paths)} files to PDF in {output_dir}")
+        results.update(_convert_in_slot(paths, is_cancelled))
+    return [results[docx_path] for docx_path in docx_paths]
 
 
-def file_zip(files: List[str], zip_name: str):
+@traced("archive.zip")
+@stage_timer("zip")
+def file_zip(files: List[Tuple[str, str]], zip_name: str):
     """
-    Create a zip file containing the converted files.
+    Create a zip file containing the converted files, given as (path,
+    name in the archive).
     """
 
     with zipfile.ZipFile(zip_name, "w") as zipf:
-        for file in files:
-            zipf.write(file, arcname=Path(file).name)
+        for file, arcname in files:
+            zipf.write(file, arcname=arcname)
     return zip_name
 
 
-def unzip_file(zip_path: str) -> List[str]:
+class ArchiveValidationError(ValueError):
+    """The uploaded archive is rejected as a whole."""
+
+
+def _is_skipped_member(name: str) -> bool:
+    base = PurePosixPath(name).name
+    return (
+        name.endswith("/")
+        or name.startswith("__MACOSX/")
+        or base.startswith((".~", "~$"))
+    )
+
+
+def validate_archive(zip_ref: zipfile.ZipFile) -> List[zipfile.ZipInfo]:
+    """
+    Check an archive from its central directory alone, before anything is
+    extracted, and return the DOCX members to convert.
+    Archives with unsafe paths, encrypted members, too many members or
+    sizes and compression ratios typical of zip bombs are rejected with
+    ArchiveValidationError. Members that are not DOCX files are skipped
+    and do not count towards ZIP_MAX_MEMBERS.
+    """
+    members, names, total_bytes = [], set(), 0
+    for info in zip_ref.infolist():
+        name = info.filename
+        path = PurePosixPath(name)
+        if path.is_absolute() or ".." in path.parts or "\\" in name or ":" in name:
+            raise ArchiveValidationError(f"Unsafe path in archive: {name}")
+        if _is_skipped_member(name):
+            continue
+        if path.suffix.lower() != ".docx":
+            print(f"Skipping non-docx archive member: {name}")
+            continue
+        if info.flag_bits & 0x1:
+            raise ArchiveValidationError(f"Encrypted archive member: {name}")
+        if info.file_size > ZIP_MAX_MEMBER_BYTES:
+            raise ArchiveValidationError(f"Archive member too large: {name}")
+        if info.file_size > ZIP_MAX_COMPRESSION_RATIO * max(info.compress_size, 1):
+            raise ArchiveValidationError(f"Suspicious compression ratio: {name}")
+        total_bytes += info.file_size
+        if total_bytes > ZIP_MAX_TOTAL_BYTES:
+            raise ArchiveValidationError("Archive content is too large")
+        if name in names:
+            print(f"Skipping duplicate archive member: {name}")
+            continue
+        names.add(name)
+        members.append(info)
+        if len(members) > ZIP_MAX_MEMBERS:
+            raise ArchiveValidationError(
+                f"Archive has more than {ZIP_MAX_MEMBERS} documents"
+            )
+    return members
+
+
+def extract_member(zip_ref: zipfile.ZipFile, info: zipfile.ZipInfo, dest_path: str):
     """
-    Unzip the uploaded file and return a list of file paths.
-    This function is called by the Celery worker to handle unzipping in the background.
+    Stream one archive member to `dest_path`. zipfile stops decompressing at
+    the size declared in the central directory (already validated) and
+    checks the CRC, so a member lying about its size fails here.
     """
-    extracted_files = []
-    print(f"Unzipping file: {zip_path}")
-    with zipfile.ZipFile(zip_path, "r") as zip_ref:
-        zip_ref.extractall(os.path.dirname(zip_path))
-        import shutil
+    os.makedirs(os.path.dirname(dest_path) or ".", exist_ok=True)
+    with span("archive.extract", member=info.filename), zip_ref.open(info) as src, open(
+        dest_path, "wb"
+    ) as dst:
+        chunk = src.read(EXTRACT_CHUNK_SIZE)
+        # A DOCX file is itself a ZIP archive
+        if not chunk.startswith(b"PK\x03\x04"):
+            raise ValueError("Not a valid .docx file")
+        while chunk:
+            dst.write(chunk)
+            chunk = src.read(EXTRACT_CHUNK_SIZE)
+
 
-        shutil.rmtree(os.path.dirname(zip_path) + "/__MACOSX", ignore_errors=True)
+@contextmanager
+def open_archive(zip_path: str) -> Iterator[zipfile.ZipFile]:
+    """
+    Open an uploaded archive, given as an S3 key or a local path. Archives
+    in S3 are fetched to a temporary file, removed again on exit.
+    """
+    if not USE_S3:
+        with zipfile.ZipFile(zip_path, "r") as zip_ref:
+            yield zip_ref
+        return
 
-        extracted_files = [
-            f
-            for f in zip_ref.namelist()
-            if not f.startswith("__MACOSX/")
-            and not f.endswith("/")
-            and not f.startswith(".~")
-        ]
-    return extracted_files
+    fd, local_path = tempfile.mkstemp(prefix=TEMP_PREFIX, suffix=".zip")
+    os.close(fd)
+    try:
+        download_file(zip_path, local_path)
+        with zipfile.ZipFile(local_path, "r") as zip_ref:
+            yield zip_ref
+    finally:
+        os.remove(local_path)
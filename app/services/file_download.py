@@ -0,0 +1,155 @@
+import asyncio
+import os
+import re
+from email.utils import format_datetime
+from typing import Iterator, Optional
+
+from botocore.exceptions import ClientError
+from fastapi import HTTPException, Request
+from fastapi.responses import FileResponse, Response, StreamingResponse
+
+from app.config import (
+    DOWNLOAD_ACCEL_REDIRECT_PREFIX,
+    S3_BUCKET_NAME,
+    UPLOAD_DIR,
+)
+from app.services.s3_client import get_s3_client
+
+CHUNK_SIZE = 1024 * 1024
+# S3 answers a single range only, requests for several get the whole object
+SINGLE_RANGE = re.compile(r"^bytes=(\d+-\d*|-\d+)$")
+
+
+def _content_disposition(filename: str) -> str:
+    return f'attachment; filename="{filename}"'
+
+
+def local_file_response(path: str, filename: str, media_type: str) -> Response:
+    """
+    Serve a file from local storage. FileResponse answers Range, If-Range
+    and conditional requests with Content-Length, ETag and Last-Modified,
+    and hands the file to the server (pathsend) when it supports that.
+    With DOWNLOAD_ACCEL_REDIRECT_PREFIX files under UPLOAD_DIR are sent by
+    the nginx in front of the API instead, with sendfile.
+    """
+    if not os.path.isfile(path):
+        raise HTTPException(status_code=404, detail="File not found")
+    relative = os.path.relpath(os.path.abspath(path), os.path.abspath(UPLOAD_DIR))
+    if DOWNLOAD_ACCEL_REDIRECT_PREFIX and not relative.startswith(".."):
+        return Response(
+            media_type=media_type,
+            headers={
+                "X-Accel-Redirect": f"{DOWNLOAD_ACCEL_REDIRECT_PREFIX.rstrip('/')}/"
+                f"{relative}",
+                "Content-Disposition": _content_disposition(filename),
+            },
+        )
+    return FileResponse(path=path, filename=filename, media_type=media_type)
+
+
+def _read_body(body) -> Iterator[bytes]:
+    try:
+        yield from body.iter_chunks(CHUNK_SIZE)
+    finally:
+        body.close()
+
+
+def _s3_request_params(request: Request, key: str) -> dict:
+    """
+    GetObject parameters for the Range, If-Range and If-None-Match headers
+    of the request. If-Range becomes an S3 precondition on the range, so a
+    changed object fails with 412 and is sent whole instead.
+    """
+    params = {"Bucket": S3_BUCKET_NAME, "Key": key}
+    byte_range = request.headers.get("range", "").replace(" ", "")
+    if SINGLE_RANGE.match(byte_range):
+        params["Range"] = byte_range
+        if_range = request.headers.get("if-range")
+        if if_range and (if_range.startswith('"') or if_range.startswith("W/")):
+            params["IfMatch"] = if_range
+        elif if_range:
+            params["IfUnmodifiedSince"] = if_range
+    if request.headers.get("if-none-match"):
+        params["IfNoneMatch"] = request.headers["if-none-match"]
+    return params
+
+
+def _s3_headers(s3_response: dict, filename: str) -> dict:
+    headers = {
+        "Accept-Ranges": "bytes",
+        "Content-Disposition": _content_disposition(filename),
+        "Content-Length": str(s3_response["ContentLength"]),
+        "ETag": s3_response["ETag"],
+    }
+    if s3_response.get("LastModified"):
+        headers["Last-Modified"] = format_datetime(
+            s3_response["LastModified"], usegmt=True
+        )
+    if s3_response.get("ContentRange"):
+        headers["Content-Range"] = s3_response["ContentRange"]
+    return headers
+
+
+def _error_code(error: ClientError) -> str:
+    return str(error.response.get("Error", {}).get("Code", ""))
+
+
+async def s3_file_response(
+    request: Request, key: str, filename: str, media_type: str
+) -> Response:
+    """
+    Serve an S3 object through the API. Single byte ranges are passed to
+    S3 as ranged GETs and answered with 206, so interrupted downloads can
+    resume; only the requested bytes leave S3. HEAD answers from
+    HeadObject without reading the object.
+    """
+    s3 = get_s3_client()
+    params = _s3_request_params(request, key)
+    try:
+        if request.method == "HEAD":
+            head = {k: v for k, v in params.items() if k in ("Bucket", "Key")}
+            s3_response = await asyncio.to_thread(s3.head_object, **head)
+            return Response(
+                media_type=media_type, headers=_s3_headers(s3_response, filename)
+            )
+        try:
+            s3_response = await asyncio.to_thread(s3.get_object, **params)
+        except ClientError as e:
+            if _error_code(e) not in ("PreconditionFailed", "412"):
+                raise
+            # If-Range did not match: the object changed, send all of it
+            for precondition in ("Range", "IfMatch", "IfUnmodifiedSince"):
+                params.pop(precondition, None)
+            s3_response = await asyncio.to_thread(s3.get_object, **params)
+    except ClientError as e:
+        code = _error_code(e)
+        if code in ("NoSuchKey", "404", "NotFound"):
+            raise HTTPException(status_code=404, detail="File not found in S3")
+        if code in ("304", "NotModified"):
+            return Response(status_code=304)
+        if code == "InvalidRange":
+            size = await _object_size(key)
+            return Response(
+                status_code=416,
+                headers={"Content-Range": f"bytes */{size}" if size else "bytes */*"},
+            )
+        raise HTTPException(
+            status_code=500, detail=f"S3 Error: {e.response['Error']['Message']}"
+        )
+
+    return StreamingResponse(
+        _read_body(s3_response["Body"]),
+        status_code=206 if s3_response.get("ContentRange") else 200,
+        media_type=media_type,
+        headers=_s3_headers(s3_response, filename),
+    )
+
+
+async def _object_size(key: str) -> Optional[int]:
+    try:
+        head = await asyncio.to_thread(
+            get_s3_client().head_object, Bucket=S3_BUCKET_NAME, Key=key
+        )
+    except ClientError:
+        return None
+    return head["ContentLength"]
@@ -1,15 +1,92 @@
+import asyncio
 import uuid
 import os
 from typing import List
 from fastapi import UploadFile
-from sqlalchemy.orm import Session
-from app.database.models import FileConversion, Job
+from sqlalchemy import update
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.database.models import FileConversion, Job, JobStatusEnum
+from app.metrics import record_bytes
 from app.tasks import unzip_and_schedule_file_conversion
-import boto3
-import io
-from app.config import UPLOAD_DIR, USE_S3, S3_BUCKET_NAME
+from app.services.job_status import publish_job_events
+from app.tracing import set_job_id, span
+from app.services.s3_client import get_s3_client
+from app.config import (
+    UPLOAD_DIR,
+    USE_S3,
+    S3_BUCKET_NAME,
+    S3_UPLOAD_CONCURRENCY,
+    S3_UPLOAD_PART_SIZE,
+)
 
-s3 = boto3.client("s3")
+
+async def upload_to_s3(file: UploadFile, s3_key: str):
+    """
+    Stream the uploaded file to S3 in parts of S3_UPLOAD_PART_SIZE.
+    At most S3_UPLOAD_CONCURRENCY parts are in flight, so memory stays
+    bounded by the part size. The blocking boto3 calls run in worker threads
+    to keep the event loop free for other requests.
+    """
+    s3 = get_s3_client()
+    chunk = await file.read(S3_UPLOAD_PART_SIZE)
+    if len(chunk) < S3_UPLOAD_PART_SIZE:
+        # Fits in a single part, a plain PUT is cheaper
+        await asyncio.to_thread(
+            s3.put_object, Bucket=S3_BUCKET_NAME, Key=s3_key, Body=chunk
+        )
+        return
+
+    upload = await asyncio.to_thread(
+        s3.create_multipart_upload, Bucket=S3_BUCKET_NAME, Key=s3_key
+    )
+    upload_id = upload["UploadId"]
+    slots = asyncio.Semaphore(S3_UPLOAD_CONCURRENCY)
+    part_uploads = []
+
+    async def upload_part(part_number: int, body: bytes) -> dict:
+        try:
+            response = await asyncio.to_thread(
+                s3.upload_part,
+                Bucket=S3_BUCKET_NAME,
+                Key=s3_key,
+                UploadId=upload_id,
+                PartNumber=part_number,
+                Body=body,
+            )
+            return {"PartNumber": part_number, "ETag": response["ETag"]}
+        finally:
+            slots.release()
+
+    try:
+        part_number = 1
+        while chunk:
+            await slots.acquire()
+            for part_upload in part_uploads:
+                if part_upload.done() and part_upload.exception():
+                    raise part_upload.exception()
+            part_uploads.append(asyncio.create_task(upload_part(part_number, chunk)))
+            part_number += 1
+            chunk = await file.read(S3_UPLOAD_PART_SIZE)
+
+        parts = await asyncio.gather(*part_uploads)
+        await asyncio.to_thread(
+            s3.complete_multipart_upload,
+            Bucket=S3_BUCKET_NAME,
+            Key=s3_key,
+            UploadId=upload_id,
+            MultipartUpload={"Parts": parts},
+        )
+    except BaseException:
+        for part_upload in part_uploads:
+            part_upload.cancel()
+        await asyncio.gather(*part_uploads, return_exceptions=True)
+        await asyncio.to_thread(
+            s3.abort_multipart_upload,
+            Bucket=S3_BUCKET_NAME,
+            Key=s3_key,
+            UploadId=upload_id,
+        )
+        raise
 
 
 async def save_file(job_id: uuid.UUID, file: UploadFile) -> str:
@@ -18,43 +95,89 @@ async def save_file(job_id: uuid.UUID, file: UploadFile) -> str:
     Returns the file path or S3 key where the file is stored.
     """
     filename = file.filename
-    if USE_S3:
-        s3_key = f"{job_id}/{filename}"
-        contents = await file.read()
-        s3.upload_fileobj(io.BytesIO(contents), S3_BUCKET_NAME, s3_key)
-        return s3_key
-    else:
-        print(f"Saving file locally: {filename}")
-        job_dir = os.path.join(UPLOAD_DIR, str(job_id))
-        os.makedirs(job_dir, exist_ok=True)
-        file_path = os.path.join(job_dir, filename)
-        with open(file_path, "wb") as f:
-            while chunk := await file.read(1024 * 1024):  # chunks
-                f.write(chunk)
-        await file.close()
-        return file_path
-
-
-async def handle_file_upload(file: UploadFile, db: Session) -> tuple[uuid.UUID, int]:
+    with span("save_file", file_name=filename, size=file.size, s3=USE_S3):
+        if USE_S3:
+            s3_key = f"{job_id}/{filename}"
+            await upload_to_s3(file, s3_key)
+            await file.close()
+            return s3_key
+        else:
+            print(f"Saving file locally: {filename}")
+            job_dir = os.path.join(UPLOAD_DIR, str(job_id))
+            os.makedirs(job_dir, exist_ok=True)
+            file_path = os.path.join(job_dir, filename)
+            with open(file_path, "wb") as f:
+                while chunk := await file.read(1024 * 1024):  # chunks
+                    f.write(chunk)
+            await file.close()
+            return file_path
+
+
+async def handle_file_upload(
+    file: UploadFile, db: AsyncSession, priority: int = 1
+) -> tuple[uuid.UUID, int]:
     """
     File upload handler that saves files and creates a job entry.
     This function is called by the API endpoint to handle file uploads.
     Returns the job ID and the count of files uploaded.
+    A job cancelled while its ZIP is stored stays cancelled and is not
+    scheduled, a job whose ZIP could not be stored fails.
     """
+    job_id = None
     try:
-        job = Job()
-        db.add(job)
-        db.commit()
-        db.refresh(job)
-
-        job_id = job.id
-        print(f"Job created with ID: {job_id}")
-        zip_path = await save_file(job_id, file)
-        unzip_and_schedule_file_conversion.apply_async(
-            (zip_path, job_id), queue="file_conversion_queue"
-        )
-        return job_id
+        # Root span of the job's trace, the tasks continue it
+        with span("handle_file_upload"):
+            # Uploading until the ZIP is stored, the recovery sweep leaves it
+            job = Job(status=JobStatusEnum.uploading, priority=priority)
+            db.add(job)
+            await db.commit()
+
+            job_id = job.id
+            set_job_id(job_id)
+            print(f"Job created with ID: {job_id}")
+            zip_path = await save_file(job_id, file)
+            record_bytes("in", "upload", file.size or 0)
+            if not await _set_upload_status(
+                db, job_id, JobStatusEnum.pending, archive_path=zip_path
+            ):
+                print(f"Job {job_id} was cancelled during its upload")
+                return job_id
+            unzip_and_schedule_file_conversion.apply_async(
+                (zip_path, job_id), queue="file_conversion_queue"
+            )
+            return job_id
     except Exception as e:
         print(f"Error handling file upload: {e}")
-        db.rollback()
+        await db.rollback()
+        if job_id is not None:
+            await _set_upload_status(
+                db, job_id, JobStatusEnum.failed, error_message=f"Upload failed: {e}"
+            )
         raise e
+
+
+async def _set_upload_status(
+    db: AsyncSession, job_id: uuid.UUID, status: JobStatusEnum, **values
+) -> bool:
+    """
+    Move a job out of uploading with one conditional UPDATE, so a job
+    cancelled meanwhile stays cancelled. Returns False when it was not
+    uploading anymore.
+    """
+    result = await db.execute(
+        update(Job)
+        .where(Job.id == job_id, Job.status == JobStatusEnum.uploading)
+        .values(status=status, **values)
+        .returning(Job.id)
+        .execution_options(synchronize_session=False)
+    )
+    if result.first() is None:
+        await db.rollback()
+        return False
+    await db.commit()
+    await asyncio.to_thread(
+        publish_job_events,
+        job_id,
+        [{"type": "job", "status": status.value, "download_url": None}],
+    )
+    return True
@@ -1,6 +1,4 @@
-import boto3
-
-s3_client = boto3.client("s3")
+from app.services.s3_client import get_s3_client
 
 
 def generate_presigned_url(bucket_name, object_key, expiration=3600):
@@ -13,7 +11,7 @@ def generate_presigned_url(bucket_name, object_key, expiration=3600):
     :return: Presigned URL as string
     """
     try:
-        response = s3_client.generate_presigned_url(
+        response = get_s3_client().generate_presigned_url(
             "get_object",
             Params={"Bucket": bucket_name, "Key": object_key},
             ExpiresIn=expiration,
@@ -0,0 +1,108 @@
+import asyncio
+import uuid
+from typing import List, Optional
+
+from sqlalchemy import update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.celery import celery_app
+from app.config import JOB_CANCEL_FLAG_TTL, USE_FAIR_SCHEDULER
+from app.database.models import FileConversion, Job, JobStatusEnum
+from app.redis_client import get_redis
+from app.services.fair_scheduler import drop_job
+from app.services.job_status import publish_job_events
+
+FINISHED_STATUSES = (JobStatusEnum.completed, JobStatusEnum.failed)
+
+
+def _cancelled_key(job_id) -> str:
+    return f"job_cancelled:{job_id}"
+
+
+def is_job_cancelled(job_id: uuid.UUID) -> bool:
+    """
+    Checked by the workers between documents and while a conversion runs.
+    A Redis outage reads as not cancelled: the task then finishes its work
+    and the cancelled status in the database keeps it from being recorded.
+    """
+    try:
+        return bool(get_redis().exists(_cancelled_key(job_id)))
+    except Exception as e:
+        print(f"Could not check cancellation of job {job_id}: {e}")
+        return False
+
+
+def _stop_queued_work(job_id: uuid.UUID, file_ids: List[uuid.UUID]):
+    """
+    Flag the job for running tasks, drop conversions held by the fair
+    scheduler and revoke the queued tasks. Conversion tasks are published
+    with the id of their (first) file as task id.
+    """
+    try:
+        get_redis().set(_cancelled_key(job_id), 1, ex=JOB_CANCEL_FLAG_TTL)
+        if USE_FAIR_SCHEDULER:
+            print(f"Dropped {drop_job(job_id)} held conversions of job {job_id}")
+    except Exception as e:
+        print(f"Could not flag job {job_id} as cancelled: {e}")
+    if file_ids:
+        try:
+            celery_app.control.revoke([str(file_id) for file_id in file_ids])
+        except Exception as e:
+            print(f"Could not revoke the tasks of job {job_id}: {e}")
+    publish_job_events(
+        job_id,
+        [
+            {
+                "type": "job",
+                "status": JobStatusEnum.cancelled.value,
+                "download_url": None,
+            }
+        ],
+    )
+
+
+async def cancel_job(db: AsyncSession, job_id: uuid.UUID) -> Optional[JobStatusEnum]:
+    """
+    Cancel a job that has not finished: the job and its unfinished files
+    become cancelled, queued conversions are revoked and running ones are
+    killed by their workers. Returns the status of the job before the call,
+    None when there is no such job.
+    """
+    job = await db.get(Job, job_id)
+    if job is None:
+        return None
+    previous = job.status
+    if previous in FINISHED_STATUSES:
+        return previous
+
+    # Conditional, so a job finishing meanwhile stays finished
+    cancelled = await db.execute(
+        update(Job)
+        .where(Job.id == job_id, Job.status.notin_(FINISHED_STATUSES))
+        .values(status=JobStatusEnum.cancelled)
+        .returning(Job.id)
+        .execution_options(synchronize_session=False)
+    )
+    if cancelled.scalar_one_or_none() is None:
+        await db.rollback()
+        await db.refresh(job)
+        return job.status
+    file_ids = (
+        await db.scalars(
+            update(FileConversion)
+            .where(
+                FileConversion.job_id == job_id,
+                FileConversion.status.notin_(
+                    FINISHED_STATUSES + (JobStatusEnum.cancelled,)
+                ),
+            )
+            .values(status=JobStatusEnum.cancelled)
+            .returning(FileConversion.id)
+            .execution_options(synchronize_session=False)
+        )
+    ).all()
+    await db.commit()
+
+    if previous != JobStatusEnum.cancelled:
+        await asyncio.to_thread(_stop_queued_work, job_id, list(file_ids))
+    return previous
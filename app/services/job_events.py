@@ -0,0 +1,77 @@
+import asyncio
+from collections import defaultdict
+from contextlib import asynccontextmanager
+
+from app.redis_client import get_async_redis
+
+CHANNEL_PREFIX = "job_events:"
+WATCHER_QUEUE_SIZE = 100
+
+
+def job_events_channel(job_id) -> str:
+    return f"{CHANNEL_PREFIX}{job_id}"
+
+
+class JobEventHub:
+    """
+    Fans job events out to watchers inside one API process. A single Redis
+    pattern subscription serves every watcher, so thousands of open event
+    streams cost one Redis connection and no database access per event.
+    """
+
+    def __init__(self):
+        self._watchers = defaultdict(set)
+        self._listener = None
+        self._ready = asyncio.Event()
+
+    def _ensure_listening(self):
+        if self._listener is None or self._listener.done():
+            self._ready = asyncio.Event()
+            self._listener = asyncio.create_task(self._listen())
+
+    async def _listen(self):
+        while True:
+            pubsub = get_async_redis().pubsub()
+            try:
+                await pubsub.psubscribe(f"{CHANNEL_PREFIX}*")
+                self._ready.set()
+                async for message in pubsub.listen():
+                    if message["type"] != "pmessage":
+                        continue
+                    job_id = message["channel"][len(CHANNEL_PREFIX) :]
+                    for queue in list(self._watchers.get(job_id, ())):
+                        try:
+                            queue.put_nowait(message["data"])
+                        except asyncio.QueueFull:
+                            # A stalled watcher loses events, never the hub
+                            pass
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Job event subscription failed, reconnecting: {e}")
+                await asyncio.sleep(1)
+            finally:
+                await pubsub.aclose()
+
+    @asynccontextmanager
+    async def subscribe(self, job_id, ready_timeout: float = 5):
+        """
+        Yield a queue receiving the raw event messages of one job.
+        """
+        queue = asyncio.Queue(maxsize=WATCHER_QUEUE_SIZE)
+        key = str(job_id)
+        self._watchers[key].add(queue)
+        try:
+            self._ensure_listening()
+            try:
+                await asyncio.wait_for(self._ready.wait(), ready_timeout)
+            except asyncio.TimeoutError:
+                print("Job event subscription is not ready yet")
+            yield queue
+        finally:
+            self._watchers[key].discard(queue)
+            if not self._watchers[key]:
+                del self._watchers[key]
+
+
+job_event_hub = JobEventHub()
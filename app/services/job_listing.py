@@ -0,0 +1,144 @@
+import base64
+import json
+import uuid
+from datetime import datetime
+from typing import List, Optional, Tuple
+
+from sqlalchemy import select, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.database.models import FileConversion, Job, JobStatusEnum
+from app.services.job_status import file_download_url
+
+
+def encode_cursor(*values) -> str:
+    """
+    Opaque cursor of the sort key of the last row on a page.
+    """
+    raw = json.dumps([str(value) for value in values]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, count: int) -> list:
+    """
+    Sort key values of a cursor, raises ValueError for a malformed one.
+    """
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except Exception:
+        raise ValueError("Invalid cursor")
+    if (
+        not isinstance(values, list)
+        or len(values) != count
+        or not all(isinstance(value, str) for value in values)
+    ):
+        raise ValueError("Invalid cursor")
+    return values
+
+
+def _page(rows: list, limit: int) -> Tuple[list, bool]:
+    # One row more than the page is fetched to know whether another follows
+    return rows[:limit], len(rows) > limit
+
+
+async def list_jobs(
+    db: AsyncSession,
+    limit: int,
+    cursor: Optional[str] = None,
+    status: Optional[JobStatusEnum] = None,
+    created_after: Optional[datetime] = None,
+    created_before: Optional[datetime] = None,
+) -> Tuple[List[dict], Optional[str]]:
+    """
+    Newest jobs first, one page of at most `limit` and the cursor of the
+    next page. Keyset pagination on (created_at, id): every page is one
+    index range scan, however deep into the list it is.
+    """
+    query = select(Job)
+    if status is not None:
+        query = query.where(Job.status == status)
+    if created_after is not None:
+        query = query.where(Job.created_at >= created_after)
+    if created_before is not None:
+        query = query.where(Job.created_at < created_before)
+    if cursor:
+        created_at, job_id = decode_cursor(cursor, 2)
+        try:
+            key = (datetime.fromisoformat(created_at), uuid.UUID(job_id))
+        except (TypeError, ValueError, AttributeError):
+            raise ValueError("Invalid cursor")
+        query = query.where(tuple_(Job.created_at, Job.id) < key)
+    jobs, more = _page(
+        (
+            await db.scalars(
+                query.order_by(Job.created_at.desc(), Job.id.desc()).limit(limit + 1)
+            )
+        ).all(),
+        limit,
+    )
+    page = [
+        {
+            "job_id": job.id,
+            "status": job.status.value,
+            "created_at": job.created_at.isoformat(),
+            "total_files": job.total_files,
+            "completed_files": job.completed_files,
+            "failed_files": job.failed_files,
+            "priority": job.priority,
+            "downloaded_url": job.download_url,
+        }
+        for job in jobs
+    ]
+    next_cursor = (
+        encode_cursor(jobs[-1].created_at.isoformat(), jobs[-1].id) if more else None
+    )
+    return page, next_cursor
+
+
+async def list_job_files(
+    db: AsyncSession,
+    job_id: uuid.UUID,
+    limit: int,
+    cursor: Optional[str] = None,
+    status: Optional[JobStatusEnum] = None,
+) -> Tuple[List[dict], Optional[str]]:
+    """
+    Files of a job by name, one page of at most `limit` and the cursor of
+    the next page, keyset-paginated on (file_name, id).
+    """
+    query = select(FileConversion).where(FileConversion.job_id == job_id)
+    if status is not None:
+        query = query.where(FileConversion.status == status)
+    if cursor:
+        file_name, file_id = decode_cursor(cursor, 2)
+        try:
+            key = (file_name, uuid.UUID(file_id))
+        except (TypeError, ValueError, AttributeError):
+            raise ValueError("Invalid cursor")
+        query = query.where(tuple_(FileConversion.file_name, FileConversion.id) > key)
+    files, more = _page(
+        (
+            await db.scalars(
+                query.order_by(FileConversion.file_name, FileConversion.id).limit(
+                    limit + 1
+                )
+            )
+        ).all(),
+        limit,
+    )
+    page = [
+        {
+            "file_id": fc.id,
+            "file_name": fc.file_name,
+            "status": fc.status.value,
+            "error_message": fc.error_message,
+            "download_url": (
+                file_download_url(job_id, fc.id)
+                if fc.status == JobStatusEnum.completed
+                else None
+            ),
+        }
+        for fc in files
+    ]
+    next_cursor = encode_cursor(files[-1].file_name, files[-1].id) if more else None
+    return page, next_cursor
@@ -0,0 +1,155 @@
+import asyncio
+import hashlib
+import json
+import uuid
+from typing import List, Optional
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import joinedload
+
+from app.config import BASE_URL, JOB_STATUS_CACHE_TTL
+from app.database.models import Job, JobStatusEnum
+from app.redis_client import get_async_redis, get_redis
+from app.services.job_events import job_event_hub, job_events_channel
+from app.tracing import span
+
+
+def _cache_key(job_id, files: bool = False) -> str:
+    return f"job_status:{job_id}:files" if files else f"job_status:{job_id}"
+
+
+def _version_key(job_id) -> str:
+    return f"job_status_version:{job_id}"
+
+
+def file_download_url(job_id, file_id) -> str:
+    return f"{BASE_URL}/api/v1/jobs/{job_id}/files/{file_id}/download"
+
+
+def publish_job_events(job_id: uuid.UUID, events: List[dict]):
+    """
+    Called by the workers after a file or job changed state. Bumping the
+    version makes every cached payload of the job stale, and the events
+    published on the job channel reach long-polling and SSE clients.
+    """
+    try:
+        with span("redis.publish_job_events", events=len(events)):
+            pipe = get_redis().pipeline()
+            pipe.incr(_version_key(job_id))
+            pipe.expire(_version_key(job_id), JOB_STATUS_CACHE_TTL)
+            for event in events:
+                pipe.publish(job_events_channel(job_id), json.dumps(event))
+            pipe.execute()
+    except Exception as e:
+        print(f"Could not publish events of job {job_id}: {e}")
+
+
+async def _load_job_status(
+    db: AsyncSession, job_id: uuid.UUID, files: bool = False
+) -> Optional[dict]:
+    query = select(Job).where(Job.id == job_id)
+    if files:
+        query = query.options(joinedload(Job.file_conversions))
+    job = (await db.execute(query)).unique().scalar_one_or_none()
+    if not job:
+        return None
+    payload = {
+        "job_id": str(job.id),
+        "status": job.status.value,
+        "total_files": job.total_files,
+        "completed_files": job.completed_files,
+        "failed_files": job.failed_files,
+        "files_url": f"{BASE_URL}/api/v1/jobs/{job.id}/files",
+        "created_at": job.created_at.isoformat(),
+        "downloaded_url": job.download_url if job.download_url else None,
+        "error_message": job.error_message,
+    }
+    if files:
+        payload["files"] = [
+            {
+                "file_id": str(fc.id),
+                "file_name": fc.file_name,
+                "status": fc.status.value,
+                "error_message": fc.error_message,
+                # Finished PDFs can be fetched before the job completes
+                "download_url": (
+                    file_download_url(job.id, fc.id)
+                    if fc.status == JobStatusEnum.completed
+                    else None
+                ),
+            }
+            for fc in sorted(job.file_conversions, key=lambda fc: fc.file_name)
+        ]
+    return payload
+
+
+async def get_job_status(
+    db: AsyncSession, job_id: uuid.UUID, files: bool = False
+) -> Optional[dict]:
+    """
+    Return the status payload of a job, from Redis when the cached copy is
+    still current, otherwise with one query against the database. The
+    payload holds the file counters, and every file only with `files`:
+    large jobs are better listed a page at a time from /files.
+    """
+    redis = get_async_redis()
+    version, expires_in = None, JOB_STATUS_CACHE_TTL * 1000
+    try:
+        pipe = redis.pipeline()
+        pipe.mget(_version_key(job_id), _cache_key(job_id, files))
+        pipe.pttl(_version_key(job_id))
+        (version, cached), version_ttl = await pipe.execute()
+        if version_ttl > 0:
+            # An entry outliving the version could match a counter that
+            # restarted after the version key expired, and be served stale
+            expires_in = min(expires_in, version_ttl)
+        if cached:
+            entry = json.loads(cached)
+            if entry["version"] == version:
+                return entry["payload"]
+    except Exception as e:
+        print(f"Job status cache unavailable: {e}")
+
+    payload = await _load_job_status(db, job_id, files)
+    if payload is not None:
+        try:
+            # The version read before the query is stored, so a change that
+            # lands while we query makes this entry stale right away
+            await redis.set(
+                _cache_key(job_id, files),
+                json.dumps({"version": version, "payload": payload}),
+                px=expires_in,
+            )
+        except Exception as e:
+            print(f"Could not cache status of job {job_id}: {e}")
+    return payload
+
+
+def status_etag(payload: dict) -> str:
+    digest = hashlib.sha256(json.dumps(payload, sort_keys=True).encode())
+    return f'"{digest.hexdigest()[:32]}"'
+
+
+async def wait_for_job_status(
+    db: AsyncSession, job_id: uuid.UUID, etag: str, timeout: float, files: bool = False
+) -> Optional[dict]:
+    """
+    Long-poll: return the job status as soon as its ETag differs from
+    `etag`, or the unchanged status once `timeout` seconds have passed.
+    """
+    async with job_event_hub.subscribe(job_id) as events:
+        # Subscribed before reading, so no change can slip in between
+        payload = await get_job_status(db, job_id, files)
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        while payload is not None and status_etag(payload) == etag:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+            try:
+                await asyncio.wait_for(events.get(), remaining)
+            except asyncio.TimeoutError:
+                break
+            payload = await get_job_status(db, job_id, files)
+        return payload
@@ -0,0 +1,308 @@
+import atexit
+import os
+import queue
+import shutil
+import signal
+import subprocess
+import tempfile
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import Callable, Optional
+
+from app.config import (
+    JOB_CANCEL_POLL_INTERVAL,
+    LIBREOFFICE_BINARY,
+    LIBREOFFICE_MAX_CONVERSIONS,
+    LIBREOFFICE_POOL_SIZE,
+    LIBREOFFICE_STARTUP_TIMEOUT,
+)
+
+try:
+    # python3-uno ships with the LibreOffice packages, only the worker image has it
+    import uno
+    from com.sun.star.beans import PropertyValue
+    from com.sun.star.connection import NoConnectException
+except ImportError:
+    uno = None
+
+# Prefix of the temp files and directories of the workers, those left by a
+# crashed worker are removed by the retention sweep
+TEMP_PREFIX = "docx2pdf_"
+
+
+class ConversionTimeout(Exception):
+    """
+    A pooled conversion did not finish in time, its instance was killed.
+    """
+
+
+class ConversionCancelled(Exception):
+    """
+    The job of a running conversion was cancelled, the converter was killed.
+    """
+
+
+def _properties(**kwargs):
+    """
+    Build the UNO PropertyValue tuple expected by the office API.
+    """
+    properties = []
+    for name, value in kwargs.items():
+        prop = PropertyValue()
+        prop.Name = name
+        prop.Value = value
+        properties.append(prop)
+    return tuple(properties)
+
+
+class LibreOfficeInstance:
+    """
+    A single headless LibreOffice process listening on a UNO pipe.
+    Every instance owns its own user profile so instances never share
+    lock files or configuration.
+    """
+
+    def __init__(self, index: int):
+        self.index = index
+        self.pipe_name = f"lo_{os.getpid()}_{index}_{uuid.uuid4().hex[:8]}"
+        self.profile_dir = tempfile.mkdtemp(prefix=f"{TEMP_PREFIX}lo_profile_{index}_")
+        self.process: Optional[subprocess.Popen] = None
+        self.desktop = None
+        self.conversions = 0
+
+    def is_alive(self) -> bool:
+        return self.process is not None and self.process.poll() is None
+
+    def touch_profile(self) -> bool:
+        """
+        Mark the profile as in use, the retention sweep removes temp
+        directories left untouched for RETENTION_TEMP_FILES_TTL. False when
+        it was removed already, e.g. while the instance sat idle.
+        """
+        try:
+            os.utime(self.profile_dir)
+            return True
+        except FileNotFoundError:
+            return False
+
+    def start(self):
+        print(f"Starting LibreOffice instance {self.index} ({self.pipe_name})")
+        os.makedirs(self.profile_dir, exist_ok=True)
+        self.process = subprocess.Popen(
+            [
+                LIBREOFFICE_BINARY,
+                "--headless",
+                "--invisible",
+                "--nologo",
+                "--nodefault",
+                "--norestore",
+                "--nolockcheck",
+                f"-env:UserInstallation={Path(self.profile_dir).as_uri()}",
+                f"--accept=pipe,name={self.pipe_name};urp;StarOffice.ComponentContext",
+            ],
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+            start_new_session=True,
+        )
+        self.conversions = 0
+        self.desktop = self._connect()
+
+    def _connect(self):
+        local_context = uno.getComponentContext()
+        resolver = local_context.ServiceManager.createInstanceWithContext(
+            "com.sun.star.bridge.UnoUrlResolver", local_context
+        )
+        deadline = time.monotonic() + LIBREOFFICE_STARTUP_TIMEOUT
+        while True:
+            if self.process.poll() is not None:
+                raise RuntimeError(
+                    f"LibreOffice instance {self.index} exited during startup"
+                )
+            try:
+                context = resolver.resolve(
+                    f"uno:pipe,name={self.pipe_name};urp;StarOffice.ComponentContext"
+                )
+                return context.ServiceManager.createInstanceWithContext(
+                    "com.sun.star.frame.Desktop", context
+                )
+            except NoConnectException:
+                if time.monotonic() > deadline:
+                    self.stop()
+                    raise RuntimeError(
+                        f"LibreOffice instance {self.index} did not start in time"
+                    )
+                time.sleep(0.2)
+
+    def kill(self):
+        """
+        Kill the office process and everything it started.
+        """
+        if self.process is not None:
+            try:
+                os.killpg(self.process.pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+
+    def _watch(self, done: threading.Event, timeout, is_cancelled, reasons: list):
+        deadline = time.monotonic() + timeout if timeout else None
+        while not done.wait(JOB_CANCEL_POLL_INTERVAL):
+            if deadline is not None and time.monotonic() >= deadline:
+                reasons.append("timeout")
+            elif is_cancelled is not None and is_cancelled():
+                reasons.append("cancelled")
+            else:
+                continue
+            self.kill()
+            return
+
+    def convert(
+        self,
+        docx_path: str,
+        pdf_path: str,
+        timeout: Optional[float] = None,
+        is_cancelled: Optional[Callable[[], bool]] = None,
+    ):
+        """
+        Convert a single document using the running office process. A
+        conversion running longer than `timeout` seconds kills the instance
+        and raises ConversionTimeout; one whose `is_cancelled` check turns
+        true kills it and raises ConversionCancelled.
+        """
+        done, reasons = threading.Event(), []
+        if timeout or is_cancelled:
+            threading.Thread(
+                target=self._watch,
+                args=(done, timeout, is_cancelled, reasons),
+                daemon=True,
+            ).start()
+        try:
+            document = self.desktop.loadComponentFromURL(
+                uno.systemPathToFileUrl(os.path.abspath(docx_path)),
+                "_blank",
+                0,
+                _properties(Hidden=True, ReadOnly=True),
+            )
+            if document is None:
+                raise ValueError(f"LibreOffice could not open {docx_path}")
+            try:
+                document.storeToURL(
+                    uno.systemPathToFileUrl(os.path.abspath(pdf_path)),
+                    _properties(FilterName="writer_pdf_Export"),
+                )
+            finally:
+                document.close(True)
+        except Exception:
+            if reasons == ["timeout"]:
+                raise ConversionTimeout(
+                    f"Conversion of {docx_path} timed out after {timeout:.0f}s"
+                )
+            if reasons == ["cancelled"]:
+                raise ConversionCancelled(f"Conversion of {docx_path} was cancelled")
+            raise
+        finally:
+            done.set()
+        self.conversions += 1
+
+    def stop(self):
+        """
+        Shut the office process down. The profile directory is kept so a
+        restarted instance does not pay for profile initialisation again.
+        """
+        if self.desktop is not None:
+            try:
+                self.desktop.terminate()
+            except Exception:
+                pass
+            self.desktop = None
+        if self.process is not None:
+            try:
+                self.process.wait(timeout=5)
+            except subprocess.TimeoutExpired:
+                self.kill()
+                self.process.wait()
+            self.process = None
+
+    def close(self):
+        self.stop()
+        shutil.rmtree(self.profile_dir, ignore_errors=True)
+
+
+class LibreOfficePool:
+    """
+    Fixed-size pool of LibreOffice instances. Conversions are routed to
+    an idle instance; instances that crash, fail a conversion or reach
+    `max_conversions` documents are recycled.
+    """
+
+    def __init__(self, size: int, max_conversions: int):
+        self.max_conversions = max_conversions
+        self._instances = [LibreOfficeInstance(index) for index in range(size)]
+        self._idle = queue.Queue()
+        for instance in self._instances:
+            self._idle.put(instance)
+
+    def convert(
+        self,
+        docx_path: str,
+        pdf_path: str,
+        timeout: Optional[float] = None,
+        is_cancelled: Optional[Callable[[], bool]] = None,
+    ):
+        instance = self._idle.get()
+        try:
+            if not instance.touch_profile() or not instance.is_alive():
+                instance.stop()
+                instance.start()
+            instance.convert(docx_path, pdf_path, timeout, is_cancelled)
+        except Exception:
+            # The office process may be wedged after a failure, start fresh
+            instance.stop()
+            raise
+        finally:
+            if instance.conversions >= self.max_conversions:
+                print(
+                    f"Recycling LibreOffice instance {instance.index} "
+                    f"after {instance.conversions} conversions"
+                )
+                instance.stop()
+            self._idle.put(instance)
+
+    def close(self):
+        for instance in self._instances:
+            instance.close()
+
+
+_pool: Optional[LibreOfficePool] = None
+_pool_pid: Optional[int] = None
+_pool_lock = threading.Lock()
+
+
+def get_libreoffice_pool() -> Optional[LibreOfficePool]:
+    """
+    Return the pool for the current process, creating it on first use.
+    Returns None when pooling is disabled or UNO is not available, in
+    which case callers fall back to one LibreOffice process per file.
+    """
+    global _pool, _pool_pid
+    if LIBREOFFICE_POOL_SIZE <= 0 or uno is None:
+        return None
+    with _pool_lock:
+        # A pool inherited through fork belongs to the parent process
+        if _pool is None or _pool_pid != os.getpid():
+            _pool = LibreOfficePool(LIBREOFFICE_POOL_SIZE, LIBREOFFICE_MAX_CONVERSIONS)
+            _pool_pid = os.getpid()
+        return _pool
+
+
+def close_libreoffice_pool():
+    global _pool, _pool_pid
+    with _pool_lock:
+        if _pool is not None and _pool_pid == os.getpid():
+            _pool.close()
+        _pool = None
+        _pool_pid = None
+
+
+atexit.register(close_libreoffice_pool)
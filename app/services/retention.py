@@ -0,0 +1,305 @@
+import os
+import shutil
+import tempfile
+import time
+import uuid
+from datetime import datetime, timedelta
+from typing import Iterator, List
+
+from sqlalchemy import delete, func, select, update
+
+from app.config import (
+    RETENTION_BATCH_SIZE,
+    RETENTION_INPUTS_TTL,
+    RETENTION_JOBS_TTL,
+    RETENTION_OUTPUTS_TTL,
+    RETENTION_SWEEP_INTERVAL,
+    RETENTION_TEMP_FILES_TTL,
+    S3_BUCKET_NAME,
+    UPLOAD_DIR,
+    USE_S3,
+)
+from app.database.models import FileConversion, Job, JobStatusEnum
+from app.redis_client import get_redis
+from app.services.conversion_cache import S3ConversionCache, get_conversion_cache
+from app.services.file_conversion_and_zipping import TEMP_PREFIX
+from app.services.job_status import publish_job_events
+from app.services.s3_client import get_s3_client
+
+# Jobs whose files are no longer read by any task
+FINISHED_STATUSES = (
+    JobStatusEnum.completed,
+    JobStatusEnum.failed,
+    JobStatusEnum.cancelled,
+)
+S3_DELETE_BATCH = 1000  # Most keys one DeleteObjects request takes
+LOCK_KEY = "retention:lock"
+
+
+def _is_output(job_id, relative_path: str) -> bool:
+    """
+    Whether a file of the job, given relative to its directory (or S3
+    prefix), is a result: a PDF (under converted/ in S3) or the job ZIP.
+    """
+    return (
+        relative_path.startswith("converted/")
+        or relative_path.endswith(".pdf")
+        or relative_path == f"{job_id}.zip"
+    )
+
+
+def _s3_keys(job_id) -> Iterator[str]:
+    paginator = get_s3_client().get_paginator("list_objects_v2")
+    for page in paginator.paginate(Bucket=S3_BUCKET_NAME, Prefix=f"{job_id}/"):
+        for item in page.get("Contents", []):
+            yield item["Key"]
+
+
+def delete_s3_objects(keys: List[str]) -> int:
+    """
+    Delete S3 objects with as few DeleteObjects requests as possible.
+    Raises when S3 could not delete some of them, so the sweep retries.
+    """
+    s3 = get_s3_client()
+    failed = []
+    for start in range(0, len(keys), S3_DELETE_BATCH):
+        response = s3.delete_objects(
+            Bucket=S3_BUCKET_NAME,
+            Delete={
+                "Objects": [
+                    {"Key": key} for key in keys[start : start + S3_DELETE_BATCH]
+                ],
+                "Quiet": True,
+            },
+        )
+        failed += response.get("Errors", [])
+    if failed:
+        raise RuntimeError(
+            f"Could not delete {len(failed)} S3 objects, e.g. {failed[0]['Key']}: "
+            f"{failed[0].get('Message')}"
+        )
+    return len(keys)
+
+
+def _remove_local_files(job_id, keep_outputs: bool) -> int:
+    job_dir = os.path.join(UPLOAD_DIR, str(job_id))
+    removed = 0
+    for root, _, files in os.walk(job_dir, topdown=False):
+        for name in files:
+            path = os.path.join(root, name)
+            relative = os.path.relpath(path, job_dir).replace(os.sep, "/")
+            if keep_outputs and _is_output(job_id, relative):
+                continue
+            os.remove(path)
+            removed += 1
+        if not os.listdir(root):
+            os.rmdir(root)
+    return removed
+
+
+def delete_job_files(job_ids: List[uuid.UUID], keep_outputs: bool = False) -> int:
+    """
+    Remove the stored files of jobs, all of them or only the inputs (the
+    uploaded archive and extracted DOCX files). Returns the number removed.
+    """
+    if USE_S3:
+        keys = [
+            key
+            for job_id in job_ids
+            for key in _s3_keys(job_id)
+            if not (keep_outputs and _is_output(job_id, key.split("/", 1)[1]))
+        ]
+        return delete_s3_objects(keys)
+    return sum(_remove_local_files(job_id, keep_outputs) for job_id in job_ids)
+
+
+def _expired_jobs(session, expired_at, ttl: int) -> list:
+    """
+    Next RETENTION_BATCH_SIZE jobs finished more than `ttl` seconds ago
+    whose files were not removed yet (`expired_at` is not set), oldest
+    first. Each job is visited once, whenever it finished.
+    """
+    return session.execute(
+        select(Job.id, Job.status)
+        .where(
+            Job.status.in_(FINISHED_STATUSES),
+            # Finished jobs are no longer updated, so this is when they finished
+            Job.updated_at < datetime.now() - timedelta(seconds=ttl),
+            expired_at.is_(None),
+        )
+        .order_by(Job.updated_at)
+        .limit(RETENTION_BATCH_SIZE)
+    ).all()
+
+
+def _mark_expired(session, job_ids: List[uuid.UUID], **values):
+    session.execute(
+        update(Job)
+        .where(Job.id.in_(job_ids))
+        # Kept as is: the TTLs of the other artifacts count from it
+        .values(updated_at=Job.updated_at, **values)
+        .execution_options(synchronize_session=False)
+    )
+    session.commit()
+
+
+def expire_inputs(session) -> int:
+    """
+    Remove the uploaded archives and DOCX files of jobs finished more than
+    RETENTION_INPUTS_TTL ago, the results stay downloadable.
+    """
+    removed = 0
+    while True:
+        jobs = _expired_jobs(session, Job.inputs_expired_at, RETENTION_INPUTS_TTL)
+        if not jobs:
+            return removed
+        job_ids = [job.id for job in jobs]
+        removed += delete_job_files(job_ids, keep_outputs=True)
+        _mark_expired(session, job_ids, inputs_expired_at=datetime.now())
+
+
+def expire_outputs(session) -> int:
+    """
+    Remove every file of jobs finished more than RETENTION_OUTPUTS_TTL ago
+    and their download URLs. The job rows stay until RETENTION_JOBS_TTL.
+    """
+    removed = 0
+    while True:
+        jobs = _expired_jobs(session, Job.outputs_expired_at, RETENTION_OUTPUTS_TTL)
+        if not jobs:
+            return removed
+        job_ids = [job.id for job in jobs]
+        removed += delete_job_files(job_ids)
+        now = datetime.now()
+        _mark_expired(
+            session,
+            job_ids,
+            download_url=None,
+            inputs_expired_at=func.coalesce(Job.inputs_expired_at, now),
+            outputs_expired_at=now,
+        )
+        for job in jobs:
+            publish_job_events(
+                job.id,
+                [{"type": "job", "status": job.status.value, "download_url": None}],
+            )
+
+
+def abort_multipart_uploads(job_ids: List[uuid.UUID]) -> int:
+    """
+    Abort the multipart uploads left unfinished by abandoned direct uploads,
+    whose parts S3 keeps (and bills) until then. Returns the number aborted.
+    """
+    s3 = get_s3_client()
+    paginator = s3.get_paginator("list_multipart_uploads")
+    aborted = 0
+    for job_id in job_ids:
+        for page in paginator.paginate(Bucket=S3_BUCKET_NAME, Prefix=f"{job_id}/"):
+            for upload in page.get("Uploads", []):
+                s3.abort_multipart_upload(
+                    Bucket=S3_BUCKET_NAME,
+                    Key=upload["Key"],
+                    UploadId=upload["UploadId"],
+                )
+                aborted += 1
+    return aborted
+
+
+def delete_expired_jobs(session) -> int:
+    """
+    Delete finished jobs, and uploads never completed, older than
+    RETENTION_JOBS_TTL with their files. Rows are deleted in chunks of
+    RETENTION_BATCH_SIZE, each in a short transaction of its own, so the
+    sweep never holds many row locks for long.
+    """
+    cutoff = datetime.now() - timedelta(seconds=RETENTION_JOBS_TTL)
+    deleted = 0
+    while True:
+        jobs = session.execute(
+            select(Job.id, Job.status)
+            .where(
+                Job.status.in_(FINISHED_STATUSES + (JobStatusEnum.uploading,)),
+                Job.created_at < cutoff,
+            )
+            .order_by(Job.created_at)
+            .limit(RETENTION_BATCH_SIZE)
+        ).all()
+        if not jobs:
+            return deleted
+        job_ids = [job.id for job in jobs]
+        if USE_S3:
+            abort_multipart_uploads(
+                [job.id for job in jobs if job.status == JobStatusEnum.uploading]
+            )
+        delete_job_files(job_ids)
+        while True:
+            chunk = (
+                select(FileConversion.id)
+                .where(FileConversion.job_id.in_(job_ids))
+                .limit(RETENTION_BATCH_SIZE)
+            )
+            files = session.execute(
+                delete(FileConversion)
+                .where(FileConversion.id.in_(chunk))
+                .execution_options(synchronize_session=False)
+            ).rowcount
+            session.commit()
+            if files < RETENTION_BATCH_SIZE:
+                break
+        session.execute(
+            delete(Job)
+            .where(Job.id.in_(job_ids))
+            .execution_options(synchronize_session=False)
+        )
+        session.commit()
+        deleted += len(job_ids)
+
+
+def remove_stale_temp_files(directory: str = None) -> int:
+    """
+    Remove worker temp files and directories (TEMP_PREFIX) older than
+    RETENTION_TEMP_FILES_TTL. Running tasks remove their own, these are
+    left by workers killed mid-task.
+    """
+    if not RETENTION_TEMP_FILES_TTL:
+        return 0
+    cutoff = time.time() - RETENTION_TEMP_FILES_TTL
+    removed = 0
+    for entry in os.scandir(directory or tempfile.gettempdir()):
+        if not entry.name.startswith(TEMP_PREFIX):
+            continue
+        try:
+            if entry.stat(follow_symlinks=False).st_mtime >= cutoff:
+                continue
+            if entry.is_dir(follow_symlinks=False):
+                shutil.rmtree(entry.path)
+            else:
+                os.remove(entry.path)
+            removed += 1
+        except OSError as e:
+            print(f"Could not remove {entry.path}: {e}")
+    return removed
+
+
+def collect_garbage(session) -> dict:
+    """
+    One retention sweep over every artifact type with a TTL, and eviction
+    of the S3 conversion cache. Skipped when another sweep still runs.
+    Returns what was removed, per type.
+    """
+    if not get_redis().set(LOCK_KEY, 1, nx=True, ex=int(RETENTION_SWEEP_INTERVAL)):
+        return {}
+    try:
+        removed = {"temp_files": remove_stale_temp_files()}
+        if RETENTION_INPUTS_TTL:
+            removed["inputs"] = expire_inputs(session)
+        if RETENTION_OUTPUTS_TTL:
+            removed["outputs"] = expire_outputs(session)
+        if RETENTION_JOBS_TTL:
+            removed["jobs"] = delete_expired_jobs(session)
+        cache = get_conversion_cache()
+        if isinstance(cache, S3ConversionCache):
+            removed["conversion_cache"] = cache.evict()
+        return removed
+    finally:
+        get_redis().delete(LOCK_KEY)
@@ -0,0 +1,132 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional, Tuple
+
+import boto3
+from boto3.s3.transfer import TransferConfig
+from botocore.config import Config
+from botocore.exceptions import ClientError
+
+from app.config import (
+    S3_BUCKET_NAME,
+    S3_ENDPOINT_URL,
+    S3_MAX_POOL_CONNECTIONS,
+    S3_MULTIPART_CHUNKSIZE,
+    S3_MULTIPART_CONCURRENCY,
+    S3_MULTIPART_THRESHOLD,
+    S3_PUBLIC_ENDPOINT_URL,
+    S3_TRANSFER_CONCURRENCY,
+)
+from app.metrics import record_bytes, stage_timer
+from app.tracing import span
+
+TRANSFER_CONFIG = TransferConfig(
+    multipart_threshold=S3_MULTIPART_THRESHOLD,
+    multipart_chunksize=S3_MULTIPART_CHUNKSIZE,
+    max_concurrency=S3_MULTIPART_CONCURRENCY,
+)
+
+_client = None
+_client_pid = None
+_client_lock = threading.Lock()
+
+
+def get_s3_client():
+    """
+    Return the S3 client shared by every thread of the current process.
+    A client inherited through fork (Celery prefork workers) is replaced,
+    so each worker process has its own connection pool.
+    """
+    global _client, _client_pid
+    if _client is None or _client_pid != os.getpid():
+        with _client_lock:
+            if _client is None or _client_pid != os.getpid():
+                _client = boto3.session.Session().client(
+                    "s3",
+                    endpoint_url=S3_ENDPOINT_URL,
+                    config=Config(max_pool_connections=S3_MAX_POOL_CONNECTIONS),
+                )
+                _client_pid = os.getpid()
+    return _client
+
+
+_presign_client = None
+
+
+def get_presign_s3_client():
+    """
+    Return the client used to presign URLs handed out to API clients.
+    Signatures cover the host, so when clients reach S3 under another
+    address than the services do (S3_PUBLIC_ENDPOINT_URL), the URLs have to
+    be signed for that address. Presigning needs no connection.
+    """
+    global _presign_client
+    if not S3_PUBLIC_ENDPOINT_URL:
+        return get_s3_client()
+    if _presign_client is None:
+        _presign_client = boto3.session.Session().client(
+            "s3",
+            endpoint_url=S3_PUBLIC_ENDPOINT_URL,
+            config=Config(signature_version="s3v4"),
+        )
+    return _presign_client
+
+
+def download_file(s3_key: str, local_path: str):
+    with span("s3.download", s3_key=s3_key), stage_timer("s3_download"):
+        get_s3_client().download_file(
+            S3_BUCKET_NAME, s3_key, local_path, Config=TRANSFER_CONFIG
+        )
+    record_bytes("in", "s3_download", os.path.getsize(local_path))
+
+
+def upload_file(local_path: str, s3_key: str):
+    size = os.path.getsize(local_path)
+    with span("s3.upload", s3_key=s3_key, size=size), stage_timer("s3_upload"):
+        get_s3_client().upload_file(
+            local_path, S3_BUCKET_NAME, s3_key, Config=TRANSFER_CONFIG
+        )
+    record_bytes("out", "s3_upload", size)
+
+
+def object_exists(s3_key: str) -> bool:
+    try:
+        get_s3_client().head_object(Bucket=S3_BUCKET_NAME, Key=s3_key)
+    except ClientError as e:
+        if e.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound"):
+            return False
+        raise
+    return True
+
+
+def _run_parallel(transfer, items: List[Tuple[str, str]]) -> List[Optional[Exception]]:
+    def run(item):
+        try:
+            transfer(*item)
+        except Exception as e:
+            return e
+        return None
+
+    if not items:
+        return []
+    with ThreadPoolExecutor(
+        max_workers=min(S3_TRANSFER_CONCURRENCY, len(items))
+    ) as pool:
+        return list(pool.map(run, items))
+
+
+def download_files(items: List[Tuple[str, str]]) -> List[Optional[Exception]]:
+    """
+    Download (s3_key, local_path) pairs with up to S3_TRANSFER_CONCURRENCY
+    transfers in flight. Returns the error of each item, None on success.
+    """
+    return _run_parallel(download_file, items)
+
+
+def upload_files(items: List[Tuple[str, str]]) -> List[Optional[Exception]]:
+    """
+    Upload (local_path, s3_key) pairs with up to S3_TRANSFER_CONCURRENCY
+    transfers in flight. Returns the error of each item, None on success.
+    """
+    return _run_parallel(upload_file, items)
@@ -0,0 +1,73 @@
+import zipfile
+from pathlib import Path
+from typing import Iterable, Iterator, List, Tuple
+
+from app.config import S3_BUCKET_NAME, USE_S3
+from app.services.s3_client import get_s3_client
+
+CHUNK_SIZE = 1024 * 1024
+
+
+class _ZipStreamSink:
+    """
+    Write-only sink without seek(). zipfile falls back to data descriptors
+    for unseekable outputs, so entries can be written before their size
+    and CRC are known.
+    """
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self) -> Iterator[bytes]:
+        chunks, self._chunks = self._chunks, []
+        yield from chunks
+
+
+def stream_zip(members: Iterable[Tuple[str, Iterable[bytes]]]) -> Iterator[bytes]:
+    """
+    Build a ZIP archive (store mode) as a stream of bytes. Each member is a
+    name and an iterable of content chunks, read only while the archive is
+    consumed, so memory stays constant regardless of archive size.
+    """
+    sink = _ZipStreamSink()
+    with zipfile.ZipFile(sink, "w", compression=zipfile.ZIP_STORED) as zipf:
+        for arcname, chunks in members:
+            with zipf.open(arcname, "w") as entry:
+                for chunk in chunks:
+                    entry.write(chunk)
+                    yield from sink.drain()
+            yield from sink.drain()
+    yield from sink.drain()
+
+
+def read_converted_file(path: str) -> Iterator[bytes]:
+    """
+    Read a converted file from S3 or local storage in chunks.
+    """
+    if USE_S3:
+        body = get_s3_client().get_object(Bucket=S3_BUCKET_NAME, Key=path)["Body"]
+        try:
+            yield from body.iter_chunks(CHUNK_SIZE)
+        finally:
+            body.close()
+    else:
+        with open(path, "rb") as f:
+            while chunk := f.read(CHUNK_SIZE):
+                yield chunk
+
+
+def stream_converted_files(files: List[Tuple[str, str]]) -> Iterator[bytes]:
+    """
+    Stream a ZIP of converted files given as (original file name, output path).
+    """
+    return stream_zip(
+        (Path(file_name).with_suffix(".pdf").as_posix(), read_converted_file(path))
+        for file_name, path in files
+    )
@@ -1,85 +1,576 @@
 import uuid
+from datetime import datetime, timedelta
+from functools import partial
+from typing import List, Optional
 from app.database.models import FileConversion, Job, JobStatusEnum
 from app.database.session import SessionLocal
 from app.services.file_conversion_and_zipping import (
+    TEMP_PREFIX,
+    ArchiveValidationError,
     convert_docx_to_pdf,
+    convert_docx_to_pdf_batch,
+    extract_member,
     file_zip,
-    unzip_file,
+    open_archive,
+    validate_archive,
 )
+from app.services.fair_scheduler import (
+    enqueue_conversion,
+    finish_conversion,
+    held_files,
+    release_conversions,
+)
+from app.services.job_cancellation import is_job_cancelled
+from app.services.retention import collect_garbage as collect_expired_artifacts
+from app.metrics import record_conversion, stage_timer
+from app.tracing import set_job_id
 from app.services.generate_s3_url import generate_presigned_url
+from app.services.job_status import file_download_url, publish_job_events
+from app.services.s3_client import (
+    download_file,
+    download_files,
+    object_exists,
+    upload_file,
+    upload_files,
+)
+from botocore.exceptions import (
+    ClientError,
+    ConnectionError as BotoConnectionError,
+    HTTPClientError,
+)
 from celery import shared_task
+from celery.exceptions import Retry
+from celery.utils.time import get_exponential_backoff_interval
+from redis.exceptions import (
+    ConnectionError as RedisConnectionError,
+    TimeoutError as RedisTimeoutError,
+)
+from sqlalchemy import case, insert, select, update
+from sqlalchemy.exc import OperationalError
 from pathlib import Path
 import os
-from app.celery import celery_app
-from app.config import UPLOAD_DIR, USE_S3, S3_BUCKET_NAME, BASE_URL
-import boto3
+from app.celery import celery_app, task_producer
+from app.config import (
+    UPLOAD_DIR,
+    USE_S3,
+    BASE_URL,
+    CONVERSION_BATCH_SIZE,
+    CONVERSION_BATCH_MAX_BYTES,
+    CONVERSION_MAX_RETRIES,
+    CONVERSION_RETRY_BACKOFF,
+    CONVERSION_RETRY_BACKOFF_MAX,
+    STALE_JOB_AFTER,
+    STREAM_ZIP_DOWNLOADS,
+    S3_TRANSFER_CONCURRENCY,
+    USE_FAIR_SCHEDULER,
+)
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 import tempfile
+import zipfile
 
 
-s3 = boto3.client("s3")
+def _output_key(file_to_convert: FileConversion) -> str:
+    output_name = Path(file_to_convert.file_name).with_suffix(".pdf")
+    return f"{file_to_convert.job_id}/converted/{output_name}"
 
 
-@shared_task
-def process_file_conversion(file_id: uuid.UUID, file_path: str):
+def _save_conversion_result(
+    file_to_convert: FileConversion, result: dict, upload: bool = True
+):
+    """
+    Record a converter result on the FileConversion row, uploading the PDF
+    to S3 first when S3 storage is enabled (unless the caller already did).
+    """
+    if result["status"] == "success":
+        if USE_S3:
+            # Upload result PDF to S3
+            s3_key_out = _output_key(file_to_convert)
+            if upload:
+                upload_file(result["converted_file"], s3_key_out)
+            file_to_convert.output_file_path = s3_key_out
+        else:
+            file_to_convert.output_file_path = result["converted_file"]
+
+        file_to_convert.status = JobStatusEnum.completed
+        file_to_convert.error_message = None
+        record_conversion("success")
+    else:
+        _mark_failed(file_to_convert, result["error_message"], "conversion")
+
+
+def _mark_failed(file_to_convert: FileConversion, error_message: str, error_class: str):
+    """
+    Mark a file failed. `error_class` is the step that failed (conversion,
+    download, upload, extraction) or the exception class of a task error.
+    """
+    file_to_convert.status = JobStatusEnum.failed
+    file_to_convert.error_message = error_message
+    record_conversion("failed", error_class)
+
+
+def _is_transient(error: BaseException) -> bool:
+    """
+    Whether a task error may go away on its own: lost connections and
+    timeouts of S3, the database or Redis, throttling and 5xx answers of S3.
+    """
+    if isinstance(error, ClientError):
+        response = error.response
+        return response.get("ResponseMetadata", {}).get("HTTPStatusCode", 0) >= 500 or (
+            response.get("Error", {}).get("Code")
+            in ("Throttling", "ThrottlingException", "SlowDown", "RequestTimeout")
+        )
+    return isinstance(
+        error,
+        (
+            ConnectionError,
+            TimeoutError,
+            BotoConnectionError,
+            HTTPClientError,
+            OperationalError,
+            RedisConnectionError,
+            RedisTimeoutError,
+        ),
+    )
+
+
+def _can_retry(task) -> bool:
+    return task.request.retries < CONVERSION_MAX_RETRIES
+
+
+def _retry_countdown(task) -> float:
+    # Exponential backoff with full jitter, so tasks failing together do
+    # not retry in step
+    return get_exponential_backoff_interval(
+        CONVERSION_RETRY_BACKOFF,
+        task.request.retries,
+        CONVERSION_RETRY_BACKOFF_MAX,
+        full_jitter=True,
+    )
+
+
+def _retry_conversion(task, args: list, error_class: str) -> Retry:
+    """
+    Publish the conversion task again with `args` after an exponential
+    backoff with full jitter, so files failing together do not retry in step.
+    Retried tasks go to the queue they came from, past the fair scheduler.
+    """
+    print(f"Retrying {task.name} ({error_class}), attempt {task.request.retries + 1}")
+    record_conversion("retried", error_class)
+    return task.retry(
+        args=args,
+        countdown=_retry_countdown(task),
+        max_retries=CONVERSION_MAX_RETRIES,
+    )
+
+
+def _count_finished_files(
+    session, job_id: uuid.UUID, completed: int = 0, failed: int = 0
+) -> dict:
+    """
+    Add finished files to the job counters with a single atomic UPDATE.
+    Concurrent workers serialize on the job row, so exactly one of them
+    sees the last file finish. Returns the job progress after the update.
+    """
+    completed_files, failed_files, total_files = session.execute(
+        update(Job)
+        .where(Job.id == job_id)
+        .values(
+            completed_files=Job.completed_files + completed,
+            failed_files=Job.failed_files + failed,
+        )
+        .returning(Job.completed_files, Job.failed_files, Job.total_files)
+    ).one()
+    return {
+        "type": "progress",
+        "completed_files": completed_files,
+        "failed_files": failed_files,
+        "total_files": total_files,
+    }
+
+
+def _job_done(progress: dict) -> bool:
+    return (
+        progress["completed_files"] + progress["failed_files"]
+        == progress["total_files"]
+    )
+
+
+def _file_event(file_conversion: FileConversion) -> dict:
+    return {
+        "type": "file",
+        "file_id": str(file_conversion.id),
+        "file_name": file_conversion.file_name,
+        "status": file_conversion.status.value,
+        "error_message": file_conversion.error_message,
+        "download_url": (
+            file_download_url(file_conversion.job_id, file_conversion.id)
+            if file_conversion.status == JobStatusEnum.completed
+            else None
+        ),
+    }
+
+
+def _job_event(job: Job) -> dict:
+    return {
+        "type": "job",
+        "status": job.status.value,
+        "download_url": job.download_url,
+    }
+
+
+# Files in these states are never converted or counted again
+FINISHED = (JobStatusEnum.completed, JobStatusEnum.failed, JobStatusEnum.cancelled)
+
+
+def _is_finished(file_to_convert: FileConversion) -> bool:
+    return file_to_convert.status in FINISHED
+
+
+def _is_redelivery(task) -> bool:
+    """
+    Whether an earlier delivery of the task may have converted its files:
+    the broker redelivered it after a worker was lost, or the recovery
+    sweep re-enqueued it.
+    """
+    delivery_info = task.request.delivery_info or {}
+    return bool(delivery_info.get("redelivered") or task.request.get("resumed"))
+
+
+def _stored_output(file_to_convert: FileConversion, file_path: str) -> Optional[dict]:
+    """
+    Success result for a file whose PDF an earlier delivery already stored,
+    None when the file has to be converted. PDFs only appear once complete:
+    S3 uploads are atomic and local PDFs are renamed into place.
+    """
+    if USE_S3:
+        s3_key = _output_key(file_to_convert)
+        if object_exists(s3_key):
+            return {"status": "success", "converted_file": s3_key}
+        return None
+    pdf_path = str(Path(file_path).with_suffix(".pdf"))
+    if os.path.exists(pdf_path):
+        return {"status": "success", "converted_file": pdf_path}
+    return None
+
+
+def _mark_started(session, job_id: uuid.UUID, file_ids: List[uuid.UUID]):
+    """
+    Mark files in_progress once a worker takes them up, and publish it. The
+    recovery sweep tells stalled conversions from ones still waiting in a
+    queue by it.
+    """
+    started = session.execute(
+        update(FileConversion)
+        .where(
+            FileConversion.id.in_(file_ids),
+            FileConversion.status == JobStatusEnum.pending,
+        )
+        .values(status=JobStatusEnum.in_progress)
+        .returning(FileConversion.id, FileConversion.file_name)
+        .execution_options(synchronize_session=False)
+    ).all()
+    session.commit()
+    if started:
+        publish_job_events(
+            job_id,
+            [
+                {
+                    "type": "file",
+                    "file_id": str(file_id),
+                    "file_name": file_name,
+                    "status": JobStatusEnum.in_progress.value,
+                    "error_message": None,
+                    "download_url": None,
+                }
+                for file_id, file_name in started
+            ],
+        )
+
+
+def _lock_unfinished(session, files: List[FileConversion]) -> List[FileConversion]:
+    """
+    Lock the rows of `files` until commit and return the files no other
+    delivery of the task finished meanwhile, the only ones to record and
+    count. A file converted twice is still counted once.
+    """
+    finished = set(
+        session.scalars(
+            select(FileConversion.id)
+            .where(
+                FileConversion.id.in_([fc.id for fc in files]),
+                FileConversion.status.in_(FINISHED),
+            )
+            .order_by(FileConversion.id)
+            .with_for_update()
+        )
+    )
+    return [fc for fc in files if fc.id not in finished]
+
+
+@shared_task(bind=True)
+def process_file_conversion(self, file_id: uuid.UUID, file_path: str):
     """
     Celery task to convert a DOCX file to PDF.
     Supports both local and S3 file paths.
+    Transient failures are retried with backoff up to CONVERSION_MAX_RETRIES
+    times, permanent ones mark the file failed at once.
     """
     session = SessionLocal()
     temp_docx_path = ""
+    file_to_convert = None
     try:
         file_to_convert = (
             session.query(FileConversion).filter(FileConversion.id == file_id).first()
         )
+        if file_to_convert is None or _is_finished(file_to_convert):
+            return
+        set_job_id(file_to_convert.job_id)
+        _mark_started(session, file_to_convert.job_id, [file_to_convert.id])
+        stored = _is_redelivery(self) and _stored_output(file_to_convert, file_path)
+        if stored:
+            print(f"Output of {file_id} already stored by an earlier delivery")
+            _save_conversion_result(file_to_convert, stored, upload=False)
+            _record_file_conversion(session, file_to_convert)
+            return
         # If Its prod, store in S3 else store locally
         if USE_S3:
             s3_key = file_path
-            with tempfile.NamedTemporaryFile(delete=False, suffix=".docx") as temp_docx:
-                s3.download_fileobj(S3_BUCKET_NAME, s3_key, temp_docx)
+            with tempfile.NamedTemporaryFile(
+                delete=False, prefix=TEMP_PREFIX, suffix=".docx"
+            ) as temp_docx:
                 temp_docx_path = temp_docx.name
+            download_file(s3_key, temp_docx_path)
         else:
             temp_docx_path = file_path
 
         # Convert docx to pdf
-        result = convert_docx_to_pdf(temp_docx_path)
+        result = convert_docx_to_pdf(
+            temp_docx_path, partial(is_job_cancelled, file_to_convert.job_id)
+        )
         print(f"Conversion result: {result}")
-        if result["status"] == "success":
-            file_to_convert.status = JobStatusEnum.completed
+        if result.get("retryable") and _can_retry(self):
+            raise _retry_conversion(self, [file_id, file_path], "conversion")
+        _save_conversion_result(file_to_convert, result)
+        _record_file_conversion(session, file_to_convert)
+    except Retry:
+        raise
+    except Exception as e:
+        session.rollback()
+        print(f"Error in process_file_conversion: {e}")
+        if file_to_convert is not None:
+            if _is_transient(e) and _can_retry(self):
+                raise _retry_conversion(self, [file_id, file_path], type(e).__name__)
+            _fail_file_conversion(file_id, str(e), type(e).__name__)
+    finally:
+        session.close()
 
-            if USE_S3:
-                # Upload result PDF to S3
-                converted_path = result["converted_file"]
-                s3_key_out = f"{file_to_convert.job_id}/converted/{os.path.basename(converted_path)}"
-                with open(converted_path, "rb") as f:
-                    s3.upload_fileobj(f, S3_BUCKET_NAME, s3_key_out)
-                file_to_convert.output_file_path = s3_key_out
-            else:
-                file_to_convert.output_file_path = result["converted_file"]
+        # Clean up temp files
+        if USE_S3 and os.path.exists(temp_docx_path):
+            os.remove(temp_docx_path)
+        if USE_FAIR_SCHEDULER:
+            finish_conversion(str(file_id))
 
-            file_to_convert.error_message = None
-        else:
-            file_to_convert.status = JobStatusEnum.failed
-            file_to_convert.error_message = result["error_message"]
 
-        session.commit()
+def _record_file_conversion(session, file_to_convert: FileConversion):
+    """
+    Commit the outcome of a converted file with the job counters, publish
+    it and zip the job after its last file.
+    """
+    if not _lock_unfinished(session, [file_to_convert]):
+        # Another delivery of the task recorded the file first
+        session.rollback()
+        return
+    progress = _count_finished_files(
+        session,
+        file_to_convert.job_id,
+        completed=int(file_to_convert.status == JobStatusEnum.completed),
+        failed=int(file_to_convert.status == JobStatusEnum.failed),
+    )
+    session.commit()
+    publish_job_events(file_to_convert.job_id, [_file_event(file_to_convert), progress])
 
-        # If all files are done, trigger zipping
-        job = file_to_convert.job
-        all_done = all(
-            f.status in [JobStatusEnum.completed, JobStatusEnum.failed]
-            for f in job.file_conversions
+    # If all files are done, trigger zipping
+    if _job_done(progress):
+        zip_converted_files.apply_async(
+            args=[file_to_convert.job_id], queue="zip_queue"
         )
-        if all_done:
-            zip_converted_files.apply_async(args=[job.id], queue="zip_queue")
+
+
+def _fail_file_conversion(file_id: uuid.UUID, error_message: str, error_class: str):
+    """
+    Record an unexpected task error as a failed file, so the job still
+    reaches its final state.
+    """
+    session = SessionLocal()
+    try:
+        file_to_convert = (
+            session.query(FileConversion)
+            .filter(FileConversion.id == file_id)
+            .with_for_update()
+            .first()
+        )
+        if file_to_convert is None or _is_finished(file_to_convert):
+            return
+        _mark_failed(file_to_convert, error_message, error_class)
+        progress = _count_finished_files(session, file_to_convert.job_id, failed=1)
+        session.commit()
+        publish_job_events(
+            file_to_convert.job_id, [_file_event(file_to_convert), progress]
+        )
+        if _job_done(progress):
+            zip_converted_files.apply_async(
+                args=[file_to_convert.job_id], queue="zip_queue"
+            )
     except Exception as e:
         session.rollback()
-        print(f"Error in process_file_conversion: {e}")
+        print(f"Error recording failure of {file_id}: {e}")
     finally:
         session.close()
 
-        # Clean up temp files
-        if USE_S3 and os.path.exists(temp_docx_path):
-            os.remove(temp_docx_path)
+
+@shared_task(bind=True)
+def process_file_conversion_batch(
+    self, file_ids: List[uuid.UUID], file_paths: List[str]
+):
+    """
+    Celery task to convert a batch of DOCX files to PDF with one DB session
+    and one converter invocation. A failure of one file is recorded on its
+    own FileConversion row without affecting the rest of the batch.
+    Files failing transiently are retried together in a new task, which
+    converts every document in a run of its own.
+    """
+    session = SessionLocal()
+    retries = []  # (file id, path) of files to convert again
+    can_retry = _can_retry(self)
+    try:
+        files_by_id = {
+            fc.id: fc
+            for fc in session.query(FileConversion)
+            .filter(FileConversion.id.in_(file_ids))
+            .all()
+            if not _is_finished(fc)
+        }
+        # The files of a batch all belong to one job
+        job_id = next(iter(files_by_id.values())).job_id if files_by_id else None
+        if job_id is not None:
+            set_job_id(job_id)
+            _mark_started(session, job_id, list(files_by_id))
+        with tempfile.TemporaryDirectory(prefix=TEMP_PREFIX) as temp_dir:
+            inputs = []
+            for file_id, file_path in zip(file_ids, file_paths):
+                file_to_convert = files_by_id.get(uuid.UUID(str(file_id)))
+                if file_to_convert is None:
+                    continue
+                if USE_S3:
+                    local_path = os.path.join(temp_dir, f"{file_to_convert.id}.docx")
+                else:
+                    local_path = file_path
+                inputs.append((file_to_convert, file_path, local_path))
+
+            if _is_redelivery(self):
+                pending = []
+                for file_to_convert, key, path in inputs:
+                    stored = _stored_output(file_to_convert, key)
+                    if stored:
+                        _save_conversion_result(file_to_convert, stored, upload=False)
+                    else:
+                        pending.append((file_to_convert, key, path))
+                inputs = pending
+
+            if USE_S3:
+                # Fetch the whole batch in parallel before converting
+                errors = download_files([(key, path) for _, key, path in inputs])
+                downloaded = []
+                for (file_to_convert, key, path), error in zip(inputs, errors):
+                    if error is not None and _is_transient(error) and can_retry:
+                        retries.append((file_to_convert.id, key))
+                    elif error is not None:
+                        _mark_failed(
+                            file_to_convert, f"Download failed: {error}", "download"
+                        )
+                    else:
+                        downloaded.append((file_to_convert, key, path))
+                inputs = downloaded
+
+            results = convert_docx_to_pdf_batch(
+                [path for _, _, path in inputs],
+                isolate=self.request.retries > 0,
+                is_cancelled=partial(is_job_cancelled, job_id),
+            )
+            upload_errors = iter(
+                upload_files(
+                    [
+                        (result["converted_file"], _output_key(file_to_convert))
+                        for (file_to_convert, _, _), result in zip(inputs, results)
+                        if result["status"] == "success"
+                    ]
+                )
+                if USE_S3
+                else []
+            )
+            for (file_to_convert, key, _), result in zip(inputs, results):
+                print(f"Conversion result for {file_to_convert.file_name}: {result}")
+                if result.get("retryable") and can_retry:
+                    retries.append((file_to_convert.id, key))
+                    continue
+                if USE_S3 and result["status"] == "success":
+                    error = next(upload_errors)
+                    if error is not None and _is_transient(error) and can_retry:
+                        retries.append((file_to_convert.id, key))
+                        continue
+                    if error is not None:
+                        _mark_failed(
+                            file_to_convert, f"Upload failed: {error}", "upload"
+                        )
+                        continue
+                _save_conversion_result(file_to_convert, result, upload=False)
+
+        retried = {file_id for file_id, _ in retries}
+        done = [fc for fc in files_by_id.values() if fc.id not in retried]
+        recorded = _lock_unfinished(session, done) if done else []
+        for fc in done:
+            if fc not in recorded:
+                # Another delivery of the task recorded the file first
+                session.expunge(fc)
+        events_by_job = {}
+        for job_id in {fc.job_id for fc in recorded}:
+            finished = [fc for fc in recorded if fc.job_id == job_id]
+            statuses = [fc.status for fc in finished]
+            progress = _count_finished_files(
+                session,
+                job_id,
+                completed=statuses.count(JobStatusEnum.completed),
+                failed=statuses.count(JobStatusEnum.failed),
+            )
+            events_by_job[job_id] = [_file_event(fc) for fc in finished] + [progress]
+        session.commit()
+
+        finished_jobs = []
+        for job_id, events in events_by_job.items():
+            publish_job_events(job_id, events)
+            if _job_done(events[-1]):
+                finished_jobs.append(job_id)
+        for job_id in finished_jobs:
+            zip_converted_files.apply_async(args=[job_id], queue="zip_queue")
+        if retries:
+            raise _retry_conversion(
+                self,
+                [[file_id for file_id, _ in retries], [key for _, key in retries]],
+                "conversion",
+            )
+    except Retry:
+        raise
+    except Exception as e:
+        session.rollback()
+        print(f"Error in process_file_conversion_batch: {e}")
+        if _is_transient(e) and can_retry:
+            raise _retry_conversion(self, [file_ids, file_paths], type(e).__name__)
+        for file_id in file_ids:
+            _fail_file_conversion(file_id, str(e), type(e).__name__)
+    finally:
+        session.close()
+        if USE_FAIR_SCHEDULER:
+            finish_conversion(str(file_ids[0]))
 
 
 @shared_task
@@ -88,39 +579,66 @@ def zip_converted_files(job_id: uuid.UUID):
     Celery task to zip all converted files for a job.
     Supports both local and S3 storage.
     """
+    set_job_id(job_id)
     session = SessionLocal()
     try:
         job = session.query(Job).filter(Job.id == job_id).first()
-        if not job:
+        if not job or job.status in FINISHED:
+            # Zipped already by an earlier delivery, or cancelled
             return
 
+        # (S3 key or local path, name in the archive); the archive keeps the
+        # folders of the upload, documents of the same name may sit in several
         converted_files = [
-            fc.output_file_path
+            (
+                fc.output_file_path,
+                Path(fc.file_name).with_suffix(".pdf").as_posix(),
+            )
             for fc in job.file_conversions
             if fc.status == JobStatusEnum.completed
             and not os.path.basename(fc.output_file_path).startswith(".~")
         ]
         if not converted_files:
+            job.status = JobStatusEnum.failed
+            session.commit()
+            publish_job_events(job_id, [_job_event(job)])
             return
 
-        if USE_S3:
+        if STREAM_ZIP_DOWNLOADS:
+            # The archive is built from the converted files on download
+            job.download_url = f"{BASE_URL}/api/v1/jobs/{job_id}/download"
+        elif USE_S3:
             # Download all files locally into a temp dir
-            with tempfile.TemporaryDirectory() as temp_dir:
-                local_paths = []
-                for s3_key in converted_files:
-                    local_file_path = os.path.join(temp_dir, os.path.basename(s3_key))
-                    with open(local_file_path, "wb") as f:
-                        s3.download_fileobj(S3_BUCKET_NAME, s3_key, f)
-                    local_paths.append(local_file_path)
+            with tempfile.TemporaryDirectory(prefix=TEMP_PREFIX) as temp_dir:
+                local_paths = [
+                    os.path.join(temp_dir, f"{index}.pdf")
+                    for index in range(len(converted_files))
+                ]
+                errors = download_files(
+                    [
+                        (s3_key, local_path)
+                        for (s3_key, _), local_path in zip(converted_files, local_paths)
+                    ]
+                )
+                for error in errors:
+                    if error is not None:
+                        raise error
 
                 # Zip them
                 zip_path = os.path.join(temp_dir, f"{job_id}.zip")
-                file_zip(local_paths, zip_path)
+                file_zip(
+                    [
+                        (local_path, arcname)
+                        for local_path, (_, arcname) in zip(
+                            local_paths, converted_files
+                        )
+                    ],
+                    zip_path,
+                )
 
                 # Upload zip
                 zip_s3_key = f"{job_id}/{job_id}.zip"
-                with open(zip_path, "rb") as f:
-                    s3.upload_fileobj(f, S3_BUCKET_NAME, zip_s3_key)
+                upload_file(zip_path, zip_s3_key)
 
                 # Set URL
                 job.download_url = f"{BASE_URL}/{zip_s3_key}"
@@ -135,6 +653,7 @@ def zip_converted_files(job_id: uuid.UUID):
 
         job.status = JobStatusEnum.completed
         session.commit()
+        publish_job_events(job_id, [_job_event(job)])
 
     except Exception as e:
         session.rollback()
@@ -143,33 +662,471 @@ def zip_converted_files(job_id: uuid.UUID):
         session.close()
 
 
-@shared_task
-def unzip_and_schedule_file_conversion(zip_path: str, job_id: uuid.UUID):
+class _ConversionDispatcher:
     """
-    Celery task to unzip the uploaded file and schedule file conversions.
+    Publish conversion tasks as soon as their documents are stored, in
+    batches of CONVERSION_BATCH_SIZE / CONVERSION_BATCH_MAX_BYTES when
+    batching is enabled. Every message goes over one producer connection.
+    With USE_FAIR_SCHEDULER the tasks are handed to the fair-share
+    scheduler instead, which releases them to libre_queue.
+    """
+
+    def __init__(self, producer, job_id: uuid.UUID, priority: int = 1):
+        self.producer = producer
+        self.job_id = job_id
+        self.priority = priority
+        self.batch, self.batch_bytes = [], 0
+
+    def _send(self, task, args: tuple, lease: uuid.UUID):
+        if USE_FAIR_SCHEDULER:
+            enqueue_conversion(
+                self.job_id, self.priority, str(lease), task.name, list(args)
+            )
+            release_conversions()
+        else:
+            # Task ids are file ids, so DELETE /jobs/{job_id} can revoke them
+            task.apply_async(
+                args, queue="libre_queue", task_id=str(lease), producer=self.producer
+            )
+
+    def add(self, row: dict, size: int):
+        if CONVERSION_BATCH_SIZE <= 1:
+            self._send(
+                process_file_conversion,
+                (row["id"], row["output_file_path"]),
+                lease=row["id"],
+            )
+            return
+        if self.batch and self.batch_bytes + size > CONVERSION_BATCH_MAX_BYTES:
+            self.flush()
+        self.batch.append(row)
+        self.batch_bytes += size
+        if len(self.batch) >= CONVERSION_BATCH_SIZE:
+            self.flush()
+
+    def flush(self):
+        if self.batch:
+            self._send(
+                process_file_conversion_batch,
+                (
+                    [row["id"] for row in self.batch],
+                    [row["output_file_path"] for row in self.batch],
+                ),
+                lease=self.batch[0]["id"],
+            )
+        self.batch, self.batch_bytes = [], 0
+
+
+def _register_files(
+    job_id: uuid.UUID, rows: List[dict], error_message: Optional[str] = None
+) -> int:
+    """
+    Insert all FileConversion rows in one statement and set the job total,
+    which has to be known before the first conversion can finish.
+    Returns the priority of the job. A job cancelled meanwhile stays cancelled.
+    A job without rows fails, with `error_message` as the reason shown by
+    the status endpoint.
     """
-    files = unzip_file(zip_path)
-    print(f"Unzipped files: ", os.path.dirname(zip_path) + "/" + files[0])
     db = SessionLocal()
-    job = db.query(Job).filter(Job.id == job_id).first()
-    for file in files:
-        # unzip
-        print(f"Added for conversion: {file}")
-        if "/.~" in file:
-            continue
-        file_conversion = FileConversion(
-            file_name=file,
-            job=job,
-            output_file_path=os.path.dirname(zip_path)
-            + "/"
-            + file,  # S3 key or local path
+    try:
+        if rows:
+            db.execute(insert(FileConversion), rows)
+        priority = db.execute(
+            update(Job)
+            .where(Job.id == job_id)
+            .values(
+                total_files=len(rows),
+                status=case(
+                    (Job.status == JobStatusEnum.cancelled, Job.status),
+                    else_=JobStatusEnum.pending if rows else JobStatusEnum.failed,
+                ),
+                error_message=None if rows else error_message,
+            )
+            .returning(Job.priority)
+        ).scalar_one()
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+    publish_job_events(
+        job_id,
+        [
+            {
+                "type": "job",
+                "status": (
+                    JobStatusEnum.pending if rows else JobStatusEnum.failed
+                ).value,
+                "download_url": None,
+            },
+            {
+                "type": "progress",
+                "completed_files": 0,
+                "failed_files": 0,
+                "total_files": len(rows),
+            },
+        ],
+    )
+    print(f"Added {len(rows)} files for conversion")
+    return priority
+
+
+def _unfinished_files(job_id: uuid.UUID) -> Optional[tuple]:
+    """
+    Priority of a job whose files were registered by an earlier delivery of
+    the unzip task, and the rows of its unfinished files by file name.
+    None on the first delivery.
+    """
+    db = SessionLocal()
+    try:
+        job = db.get(Job, job_id)
+        if job is None or not job.total_files:
+            return None
+        files = (
+            db.query(FileConversion)
+            .filter(
+                FileConversion.job_id == job_id,
+                FileConversion.status.notin_(FINISHED),
+            )
+            .all()
         )
-        db.add(file_conversion)
+        return job.priority, {
+            fc.file_name: {
+                "id": fc.id,
+                "job_id": fc.job_id,
+                "file_name": fc.file_name,
+                "output_file_path": fc.output_file_path,
+            }
+            for fc in files
+        }
+    finally:
+        db.close()
+
+
+def _extract_and_dispatch(zip_ref, members: list, dispatcher: _ConversionDispatcher):
+    """
+    Extract (info, row) members one at a time and dispatch each conversion
+    once its document is stored. In S3 mode a member is extracted to a
+    temporary file and uploaded while the next ones are extracted, with at
+    most S3_TRANSFER_CONCURRENCY uploads in flight. Stops extracting once
+    the job is cancelled.
+    """
+    if not USE_S3:
+        for info, row in members:
+            if is_job_cancelled(dispatcher.job_id):
+                return
+            try:
+                extract_member(zip_ref, info, row["output_file_path"])
+            except Exception as e:
+                _fail_file_conversion(
+                    row["id"], f"Extraction failed: {e}", "extraction"
+                )
+                continue
+            dispatcher.add(row, info.file_size)
+        return
+
+    def upload(local_path: str, s3_key: str):
+        try:
+            upload_file(local_path, s3_key)
+        finally:
+            os.remove(local_path)
+
+    def dispatch_uploaded(done):
+        for future in done:
+            info, row = uploads.pop(future)
+            try:
+                future.result()
+            except Exception as e:
+                _fail_file_conversion(row["id"], f"Upload failed: {e}", "upload")
+                continue
+            dispatcher.add(row, info.file_size)
+
+    uploads = {}
+    with tempfile.TemporaryDirectory(prefix=TEMP_PREFIX) as tmp_dir, ThreadPoolExecutor(
+        max_workers=S3_TRANSFER_CONCURRENCY
+    ) as pool:
+        for index, (info, row) in enumerate(members):
+            if is_job_cancelled(dispatcher.job_id):
+                break
+            local_path = os.path.join(tmp_dir, f"{index}.docx")
+            try:
+                extract_member(zip_ref, info, local_path)
+            except Exception as e:
+                _fail_file_conversion(
+                    row["id"], f"Extraction failed: {e}", "extraction"
+                )
+                continue
+            uploads[pool.submit(upload, local_path, row["output_file_path"])] = (
+                info,
+                row,
+            )
+            # Dispatch whatever finished meanwhile and bound the disk used
+            # by extracted files waiting for their upload
+            done, _ = wait(
+                uploads,
+                timeout=None if len(uploads) >= S3_TRANSFER_CONCURRENCY else 0,
+                return_when=FIRST_COMPLETED,
+            )
+            dispatch_uploaded(done)
+        while uploads:
+            done, _ = wait(uploads, return_when=FIRST_COMPLETED)
+            dispatch_uploaded(done)
+
+
+def _fail_job(job_id: uuid.UUID, error_message: str):
+    """
+    Fail a job as a whole, with `error_message` as the reason shown by the
+    status endpoint. A job finished meanwhile keeps its status.
+    """
+    db = SessionLocal()
+    try:
+        failed = db.execute(
+            update(Job)
+            .where(
+                Job.id == job_id,
+                Job.status.in_([JobStatusEnum.pending, JobStatusEnum.in_progress]),
+            )
+            .values(status=JobStatusEnum.failed, error_message=error_message)
+            .returning(Job.id)
+        ).first()
         db.commit()
-        db.refresh(file_conversion)
+    finally:
+        db.close()
+    if failed:
+        publish_job_events(
+            job_id,
+            [
+                {
+                    "type": "job",
+                    "status": JobStatusEnum.failed.value,
+                    "download_url": None,
+                }
+            ],
+        )
+
+
+@shared_task(bind=True)
+@stage_timer("unzip")
+def unzip_and_schedule_file_conversion(self, zip_path: str, job_id: uuid.UUID):
+    """
+    Celery task to extract the uploaded archive and schedule file conversions.
+    The archive is validated from its central directory first and all
+    FileConversion rows are inserted in one statement. Members are then
+    extracted one by one, each conversion being dispatched as soon as its
+    document is stored rather than after the whole archive is unpacked.
+    A redelivered task resumes: only the unfinished files are extracted and
+    dispatched again. Transient errors (S3, database, broker) are retried
+    the same way, other errors fail the job.
+    """
+    set_job_id(job_id)
+    if is_job_cancelled(job_id):
+        print(f"Job {job_id} was cancelled before its archive was extracted")
+        return
+    try:
+        with open_archive(zip_path) as zip_ref:
+            try:
+                members = validate_archive(zip_ref)
+                error_message = "Archive contains no DOCX documents"
+            except ArchiveValidationError as e:
+                print(f"Rejected archive {zip_path} of job {job_id}: {e}")
+                members, error_message = [], f"Archive rejected: {e}"
+            resumed = _unfinished_files(job_id)
+            if resumed is None:
+                rows = [
+                    {
+                        # Generated here so the rows need no refresh before dispatch
+                        "id": uuid.uuid4(),
+                        "job_id": job_id,
+                        "file_name": info.filename,
+                        # S3 key or local path
+                        "output_file_path": os.path.dirname(zip_path)
+                        + "/"
+                        + info.filename,
+                    }
+                    for info in members
+                ]
+                priority = _register_files(job_id, rows, error_message)
+                members = list(zip(members, rows))
+            else:
+                priority, unfinished = resumed
+                print(f"Resuming unzip of job {job_id}: {len(unfinished)} files left")
+                members = [
+                    (info, unfinished[info.filename])
+                    for info in members
+                    if info.filename in unfinished
+                ]
+
+            with task_producer() as producer:
+                dispatcher = _ConversionDispatcher(producer, job_id, priority)
+                _extract_and_dispatch(zip_ref, members, dispatcher)
+                dispatcher.flush()
+    except zipfile.BadZipFile as e:
+        print(f"Invalid archive {zip_path} of job {job_id}: {e}")
+        _register_files(job_id, [], f"Invalid archive: {e}")
+    except Exception as e:
+        if _is_transient(e) and _can_retry(self):
+            print(f"Retrying unzip of job {job_id}, attempt {self.request.retries + 1}")
+            raise self.retry(
+                countdown=_retry_countdown(self), max_retries=CONVERSION_MAX_RETRIES
+            )
+        print(f"Unzip of job {job_id} failed: {e}")
+        _fail_job(job_id, f"Archive could not be extracted: {e}")
+
 
-        process_file_conversion.apply_async(
-            args=[file_conversion.id, os.path.dirname(zip_path) + "/" + file],
-            queue="libre_queue",
+@shared_task
+def release_fair_share_conversions():
+    """
+    Periodic release of held conversions (Celery beat, USE_FAIR_SCHEDULER).
+    Completions release the next tasks themselves, this covers slots freed
+    by expired leases.
+    """
+    released = release_conversions()
+    if released:
+        print(f"Released {released} conversions")
+
+
+def _queued_conversions() -> int:
+    """
+    Conversion tasks waiting in libre_queue for a worker. When the broker
+    cannot tell, they are assumed to be waiting.
+    """
+    if celery_app.conf.task_always_eager:
+        return 0
+    try:
+        with celery_app.connection_for_read() as connection:
+            return connection.default_channel.queue_declare(
+                queue="libre_queue", passive=True
+            ).message_count
+    except Exception as e:
+        print(f"Could not count the tasks waiting in libre_queue: {e}")
+        return 1
+
+
+@shared_task
+def recover_stuck_jobs():
+    """
+    Periodic sweep (Celery beat) resuming jobs without progress for
+    STALE_JOB_AFTER seconds, e.g. after a worker was lost with tasks that
+    could not be redelivered. Only unfinished files are converted again, a
+    job whose files are all finished is zipped and a job whose archive was
+    never extracted is unzipped again.
+    Started files are resent once they stall. Files no worker started yet
+    are resent only while no conversion waits in libre_queue and the fair
+    scheduler does not hold them, before that they are merely queued, e.g.
+    behind a large job.
+    """
+    cutoff = datetime.now() - timedelta(seconds=STALE_JOB_AFTER)
+    session = SessionLocal()
+    try:
+        jobs = session.scalars(
+            select(Job)
+            .where(
+                Job.status.in_([JobStatusEnum.pending, JobStatusEnum.in_progress]),
+                Job.updated_at < cutoff,
+            )
+            .with_for_update(skip_locked=True)
+        ).all()
+        queued = _queued_conversions() if jobs else 0
+        resumed, zips, unzips, lost = [], [], [], []
+        for job in jobs:
+            # The next sweep gives the resumed tasks another STALE_JOB_AFTER
+            job.updated_at = datetime.now()
+            if not job.total_files:
+                if job.archive_path:
+                    unzips.append((job.archive_path, job.id))
+                else:
+                    job.status = JobStatusEnum.failed
+                    job.error_message = "Archive could not be extracted"
+                    lost.append(job.id)
+                continue
+            unfinished = session.scalars(
+                select(FileConversion).where(
+                    FileConversion.job_id == job.id,
+                    FileConversion.status.in_(
+                        [JobStatusEnum.pending, JobStatusEnum.in_progress]
+                    ),
+                )
+            ).all()
+            if not unfinished:
+                zips.append(job.id)
+                continue
+            held = held_files(job.id) if USE_FAIR_SCHEDULER else set()
+            files = [
+                (fc.id, fc.output_file_path)
+                for fc in unfinished
+                if fc.updated_at < cutoff
+                # Files not started yet may still wait for a worker in
+                # libre_queue or in the fair scheduler
+                and (
+                    fc.status == JobStatusEnum.in_progress
+                    or not (queued or str(fc.id) in held)
+                )
+            ]
+            if files:
+                resumed.append((job.id, job.priority, files))
+        session.commit()
+    finally:
+        session.close()
+
+    for job_id in lost:
+        print(f"Failing stuck job {job_id}: its archive is unknown")
+        publish_job_events(
+            job_id,
+            [
+                {
+                    "type": "job",
+                    "status": JobStatusEnum.failed.value,
+                    "download_url": None,
+                }
+            ],
         )
-    db.close()
+    with task_producer() as producer:
+        for zip_path, job_id in unzips:
+            print(f"Resuming stuck job {job_id}: extracting its archive again")
+            unzip_and_schedule_file_conversion.apply_async(
+                (zip_path, job_id), queue="file_conversion_queue", producer=producer
+            )
+        for job_id in zips:
+            print(f"Resuming stuck job {job_id}: all files finished, zipping")
+            zip_converted_files.apply_async(
+                args=[job_id], queue="zip_queue", producer=producer
+            )
+        for job_id, priority, files in resumed:
+            print(f"Resuming stuck job {job_id}: {len(files)} files to convert")
+            for file_id, file_path in files:
+                if USE_FAIR_SCHEDULER:
+                    enqueue_conversion(
+                        job_id,
+                        priority,
+                        str(file_id),
+                        process_file_conversion.name,
+                        [file_id, file_path],
+                        headers={"resumed": True},
+                    )
+                    continue
+                process_file_conversion.apply_async(
+                    (file_id, file_path),
+                    queue="libre_queue",
+                    task_id=str(file_id),
+                    headers={"resumed": True},
+                    producer=producer,
+                )
+    if USE_FAIR_SCHEDULER and resumed:
+        release_conversions()
+
+
+@shared_task
+def collect_garbage():
+    """
+    Periodic retention sweep (Celery beat): removes worker temp files,
+    inputs and outputs of old jobs, and old job rows, each after its TTL
+    (RETENTION_* settings).
+    """
+    session = SessionLocal()
+    try:
+        removed = collect_expired_artifacts(session)
+    finally:
+        session.close()
+    if any(removed.values()):
+        print(f"Retention sweep removed {removed}")
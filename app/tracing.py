@@ -0,0 +1,270 @@
+import importlib
+import os
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+from typing import Optional
+
+from opentelemetry import context, propagate, trace
+from opentelemetry.sdk.resources import Resource
+from opentelemetry.sdk.trace import TracerProvider
+from opentelemetry.sdk.trace.export import (
+    BatchSpanProcessor,
+    ConsoleSpanExporter,
+    SimpleSpanProcessor,
+    SpanExporter,
+    SpanExportResult,
+)
+from opentelemetry.sdk.trace.sampling import ParentBased, TraceIdRatioBased
+from opentelemetry.trace import SpanKind, Status, StatusCode
+from sqlalchemy import event
+
+from app.config import (
+    TRACE_FILE,
+    TRACING_EXPORTER,
+    TRACING_SAMPLE_RATIO,
+    TRACING_SERVICE_NAME,
+)
+
+TRACING_ENABLED = TRACING_EXPORTER != "none"
+
+_provider = None
+_provider_pid = None
+_provider_lock = threading.Lock()
+_task_spans = {}  # Celery task id -> (span, context token)
+
+
+class JsonLinesSpanExporter(SpanExporter):
+    """
+    Append finished spans to a file, one JSON object per line. Several
+    processes can share the file: each span is written with one append.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def export(self, spans) -> SpanExportResult:
+        lines = "".join(span.to_json(indent=None) + "\n" for span in spans)
+        try:
+            with open(self.path, "a") as f:
+                f.write(lines)
+        except OSError as e:
+            print(f"Could not write spans to {self.path}: {e}")
+            return SpanExportResult.FAILURE
+        return SpanExportResult.SUCCESS
+
+
+def _otlp_exporter() -> SpanExporter:
+    try:
+        from opentelemetry.exporter.otlp.proto.http.trace_exporter import (
+            OTLPSpanExporter,
+        )
+    except ImportError:
+        raise RuntimeError(
+            "TRACING_EXPORTER=otlp needs the opentelemetry-exporter-otlp-proto-http package"
+        )
+    # Endpoint and headers come from the standard OTEL_EXPORTER_OTLP_* variables
+    return OTLPSpanExporter()
+
+
+def _span_processor(exporter_name: str):
+    """
+    Build the span processor for TRACING_EXPORTER: file, console, otlp or
+    `module:factory` of a callable returning a SpanExporter.
+    """
+    if exporter_name == "file":
+        # Spans are written as they end, pool processes exit without atexit
+        return SimpleSpanProcessor(JsonLinesSpanExporter(TRACE_FILE))
+    if exporter_name == "console":
+        return SimpleSpanProcessor(ConsoleSpanExporter())
+    if exporter_name == "otlp":
+        return BatchSpanProcessor(_otlp_exporter())
+    module_name, _, factory = exporter_name.partition(":")
+    if not factory:
+        raise ValueError(f"Unknown TRACING_EXPORTER {exporter_name!r}")
+    exporter = getattr(importlib.import_module(module_name), factory)()
+    return BatchSpanProcessor(exporter)
+
+
+def get_tracer():
+    """
+    Return the tracer of this process. The provider is created on first use
+    in every process, as forked Celery pool processes cannot reuse the
+    exporter threads of their parent. A no-op tracer when tracing is off.
+    """
+    global _provider, _provider_pid
+    if not TRACING_ENABLED:
+        return trace.NoOpTracer()
+    if _provider is None or _provider_pid != os.getpid():
+        with _provider_lock:
+            if _provider is None or _provider_pid != os.getpid():
+                provider = TracerProvider(
+                    resource=Resource.create({"service.name": TRACING_SERVICE_NAME}),
+                    sampler=ParentBased(TraceIdRatioBased(TRACING_SAMPLE_RATIO)),
+                    shutdown_on_exit=False,
+                )
+                provider.add_span_processor(_span_processor(TRACING_EXPORTER))
+                _provider, _provider_pid = provider, os.getpid()
+    return _provider.get_tracer(__name__)
+
+
+def shutdown_tracing():
+    """
+    Flush buffered spans, called when a worker process exits.
+    """
+    if _provider is not None and _provider_pid == os.getpid():
+        _provider.shutdown()
+
+
+@contextmanager
+def span(name: str, kind: SpanKind = SpanKind.INTERNAL, **attributes):
+    """
+    Run the block in a span, a child of the current one. Exceptions are
+    recorded on the span and re-raised.
+    """
+    with get_tracer().start_as_current_span(
+        name,
+        kind=kind,
+        attributes={key: str(value) for key, value in attributes.items()},
+    ) as current:
+        yield current
+
+
+def traced(name: str):
+    """
+    Decorator running every call of the function in a span named `name`.
+    """
+
+    def decorate(function):
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return function(*args, **kwargs)
+
+        return wrapper
+
+    return decorate
+
+
+def set_job_id(job_id):
+    """
+    Tag the current span with the job it works on.
+    """
+    trace.get_current_span().set_attribute("job.id", str(job_id))
+
+
+def inject_trace_context(carrier: dict) -> dict:
+    """
+    Add the current trace context (traceparent) to a message carrier. An
+    existing context is kept, e.g. that of a conversion held by the fair
+    scheduler and published later by another task.
+    """
+    if TRACING_ENABLED and "traceparent" not in carrier:
+        propagate.inject(carrier)
+    return carrier
+
+
+def start_task_span(task):
+    """
+    Start the span of a Celery task, continuing the trace of the publisher.
+    Time spent in the broker queue (and held by the fair scheduler) is
+    recorded as spans ending where the task starts.
+    """
+    if not TRACING_ENABLED:
+        return
+    request = task.request
+    carrier = {"traceparent": request.get("traceparent")}
+    if request.get("tracestate"):
+        carrier["tracestate"] = request.get("tracestate")
+    parent = propagate.extract(carrier) if carrier["traceparent"] else None
+    tracer = get_tracer()
+    now = time.time_ns()
+
+    published_at = request.get("published_at")
+    scheduled_at = request.get("scheduled_at")
+    delivery_info = request.delivery_info or {}
+    queue = delivery_info.get("routing_key") or ""
+    if scheduled_at and published_at:
+        tracer.start_span(
+            "fair_scheduler.wait",
+            context=parent,
+            start_time=int(scheduled_at * 1e9),
+        ).end(int(published_at * 1e9))
+    if published_at:
+        tracer.start_span(
+            "queue.wait",
+            context=parent,
+            kind=SpanKind.CONSUMER,
+            start_time=min(int(published_at * 1e9), now),
+            attributes={"messaging.destination.name": queue},
+        ).end(now)
+
+    task_span = tracer.start_span(
+        task.name.rsplit(".", 1)[-1],
+        context=parent,
+        kind=SpanKind.CONSUMER,
+        start_time=now,
+        attributes={
+            "celery.task_name": task.name,
+            "celery.task_id": str(request.id),
+            "messaging.destination.name": queue,
+            "celery.retries": request.retries or 0,
+        },
+    )
+    token = context.attach(trace.set_span_in_context(task_span))
+    _task_spans[request.id] = (task_span, token)
+
+
+def record_task_failure(task_id: str, exception: BaseException):
+    entry = _task_spans.get(task_id)
+    if entry is not None:
+        entry[0].record_exception(exception)
+        entry[0].set_status(Status(StatusCode.ERROR, str(exception)))
+
+
+def end_task_span(task_id: str, state: Optional[str] = None):
+    entry = _task_spans.pop(task_id, None)
+    if entry is None:
+        return
+    task_span, token = entry
+    if state:
+        task_span.set_attribute("celery.state", state)
+    task_span.end()
+    context.detach(token)
+
+
+def trace_engine(engine):
+    """
+    One span per statement run on a (sync) SQLAlchemy engine; pass
+    `async_engine.sync_engine` for an async one. No-op with tracing off.
+    """
+    if not TRACING_ENABLED:
+        return
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def start_statement_span(conn, cursor, statement, parameters, ctx, executemany):
+        operation = statement.lstrip().split(" ", 1)[0].upper()
+        statement_span = get_tracer().start_span(
+            f"db.{operation.lower()}",
+            kind=SpanKind.CLIENT,
+            attributes={"db.statement": statement[:500]},
+        )
+        conn.info.setdefault("trace_spans", []).append(statement_span)
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def end_statement_span(conn, cursor, statement, parameters, ctx, executemany):
+        conn.info["trace_spans"].pop().end()
+
+    @event.listens_for(engine, "handle_error")
+    def fail_statement_span(exception_context):
+        connection = exception_context.connection
+        spans = connection.info.get("trace_spans") if connection else None
+        if spans:
+            statement_span = spans.pop()
+            statement_span.record_exception(exception_context.original_exception)
+            statement_span.set_status(Status(StatusCode.ERROR))
+            statement_span.end()
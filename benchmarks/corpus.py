@@ -0,0 +1,69 @@
+import io
+import random
+import zipfile
+from xml.sax.saxutils import escape
+
+CONTENT_TYPES = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+    '<Default Extension="rels" '
+    'ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+    '<Default Extension="xml" ContentType="application/xml"/>'
+    '<Override PartName="/word/document.xml" ContentType="application/'
+    'vnd.openxmlformats-officedocument.wordprocessingml.document.main+xml"/>'
+    "</Types>"
+)
+
+RELATIONSHIPS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/'
+    '2006/relationships/officeDocument" Target="word/document.xml"/>'
+    "</Relationships>"
+)
+
+WORDS = (
+    "lorem ipsum dolor sit amet consectetur adipiscing elit sed do eiusmod "
+    "tempor incididunt ut labore et dolore magna aliqua enim ad minim veniam "
+    "quis nostrud exercitation ullamco laboris nisi aliquip ex ea commodo"
+).split()
+
+
+def make_docx(size_bytes: int, rng: random.Random) -> bytes:
+    """
+    Build a minimal valid .docx whose document body holds about
+    `size_bytes` of random paragraphs.
+    """
+    paragraphs, written = [], 0
+    while written < size_bytes:
+        text = " ".join(rng.choice(WORDS) for _ in range(rng.randint(20, 80)))
+        paragraph = f"<w:p><w:r><w:t>{escape(text)}</w:t></w:r></w:p>"
+        paragraphs.append(paragraph)
+        written += len(paragraph)
+    document = (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<w:document xmlns:w="http://schemas.openxmlformats.org/'
+        'wordprocessingml/2006/main"><w:body>'
+        + "".join(paragraphs)
+        + "</w:body></w:document>"
+    )
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", compression=zipfile.ZIP_DEFLATED) as docx:
+        docx.writestr("[Content_Types].xml", CONTENT_TYPES)
+        docx.writestr("_rels/.rels", RELATIONSHIPS)
+        docx.writestr("word/document.xml", document)
+    return buffer.getvalue()
+
+
+def make_archive(file_count: int, file_size: int, seed: int) -> bytes:
+    """
+    Build the ZIP a client would upload: `file_count` distinct documents
+    of about `file_size` bytes of text each. The same seed gives the same
+    archive, so runs on different commits convert the same corpus.
+    """
+    rng = random.Random(seed)
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+        for index in range(file_count):
+            archive.writestr(f"doc_{index:05d}.docx", make_docx(file_size, rng))
+    return buffer.getvalue()
@@ -0,0 +1,341 @@
+"""
+End-to-end benchmark of the conversion pipeline:
+upload -> unzip -> convert -> zip, run in-process against local stand-ins
+(eager Celery, SQLite or a local Postgres, in-memory S3 and Redis, and a
+stub converter unless --converter libreoffice is given).
+
+    python -m benchmarks.run --jobs 5 --files 50 --file-size 20000 \\
+        --output results.json --baseline baseline.json
+
+Results are written as JSON together with the commit they were measured
+on; --baseline compares against an earlier result file and exits with
+status 1 when throughput or a stage latency regressed beyond --tolerance.
+"""
+
+import argparse
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from collections import defaultdict
+from contextlib import ExitStack, redirect_stdout
+from functools import wraps
+from unittest.mock import patch
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--jobs", type=int, default=3, help="Measured jobs")
+    parser.add_argument("--warmup", type=int, default=1, help="Unmeasured jobs")
+    parser.add_argument("--files", type=int, default=20, help="Documents per job")
+    parser.add_argument(
+        "--file-size", type=int, default=20_000, help="Text bytes per document"
+    )
+    parser.add_argument("--seed", type=int, default=1, help="Corpus seed")
+    parser.add_argument("--converter", choices=("stub", "libreoffice"), default="stub")
+    parser.add_argument(
+        "--stub-delay", type=float, default=0.0, help="Seconds per stub conversion"
+    )
+    parser.add_argument("--s3", action="store_true", help="Store files in fake S3")
+    parser.add_argument(
+        "--database-url", help="Database to use instead of a temporary SQLite file"
+    )
+    parser.add_argument("--batch-size", type=int, default=1)
+    parser.add_argument("--no-cache", action="store_true", help="Disable the cache")
+    parser.add_argument("--stream-zip", action="store_true")
+    parser.add_argument(
+        "--verbose", action="store_true", help="Show the app's own output"
+    )
+    parser.add_argument("--output", help="Write the results to this JSON file")
+    parser.add_argument("--baseline", help="Compare with this results file")
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.10,
+        help="Allowed relative regression against the baseline",
+    )
+    parser.add_argument(
+        "--min-delta-ms",
+        type=float,
+        default=1.0,
+        help="Stage latency changes below this are treated as noise",
+    )
+    return parser.parse_args(argv)
+
+
+def configure_environment(args, workdir: str):
+    """
+    The app reads its settings at import time, so everything is set up in
+    the environment before the first app import.
+    """
+    if args.database_url:
+        os.environ["DATABASE_URL"] = args.database_url
+    else:
+        os.environ["DATABASE_URL"] = f"sqlite:///{workdir}/benchmark.db"
+        os.environ["ASYNC_DATABASE_URL"] = f"sqlite+aiosqlite:///{workdir}/benchmark.db"
+    os.environ["UPLOAD_DIR"] = os.path.join(workdir, "uploads")
+    os.environ["USE_S3"] = "true" if args.s3 else "false"
+    os.environ["CONVERSION_BATCH_SIZE"] = str(args.batch_size)
+    # No broker redelivers and no sweeper resumes here, so any batch size fits
+    longest_batch = args.batch_size * float(
+        os.environ.get("LIBREOFFICE_TIMEOUT_MAX", "600")
+    )
+    for name, default in (("TASK_VISIBILITY_TIMEOUT", 3600), ("STALE_JOB_AFTER", 1800)):
+        if int(os.environ.get(name, default)) <= longest_batch:
+            os.environ[name] = str(int(longest_batch) + 1)
+    os.environ["CONVERSION_CACHE_ENABLED"] = "false" if args.no_cache else "true"
+    os.environ["CONVERSION_CACHE_DIR"] = os.path.join(workdir, "cache")
+    os.environ["STREAM_ZIP_DOWNLOADS"] = "true" if args.stream_zip else "false"
+    os.environ["LIBREOFFICE_SLOT_DIR"] = os.path.join(workdir, "slots")
+    os.environ["USE_FAIR_SCHEDULER"] = "false"
+    if args.converter == "stub":
+        from benchmarks.stand_ins import write_stub_converter
+
+        os.environ["LIBREOFFICE_BINARY"] = write_stub_converter(
+            workdir, args.stub_delay
+        )
+        os.environ["LIBREOFFICE_POOL_SIZE"] = "0"
+
+
+class StageTimer:
+    def __init__(self):
+        self.samples = defaultdict(list)
+        self.enabled = False
+
+    def wrap(self, stage: str, function):
+        @wraps(function)
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                if self.enabled:
+                    self.samples[stage].append(time.perf_counter() - start)
+
+        return timed
+
+    def wrap_async(self, stage: str, function):
+        @wraps(function)
+        async def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return await function(*args, **kwargs)
+            finally:
+                if self.enabled:
+                    self.samples[stage].append(time.perf_counter() - start)
+
+        return timed
+
+
+def percentile(values, fraction: float) -> float:
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(fraction * len(ordered)) - 1))
+    return ordered[index]
+
+
+def summarize(samples) -> dict:
+    return {
+        "count": len(samples),
+        "p50_ms": round(percentile(samples, 0.50) * 1000, 3),
+        "p90_ms": round(percentile(samples, 0.90) * 1000, 3),
+        "p99_ms": round(percentile(samples, 0.99) * 1000, 3),
+        "max_ms": round(max(samples) * 1000, 3),
+    }
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def run_benchmark(args, workdir: str) -> dict:
+    import fakeredis
+    import fakeredis.aioredis
+    from fastapi.testclient import TestClient
+
+    from app import redis_client, tasks
+    from app.celery import celery_app
+    from app.database.base import Base
+    from app.database.models import Job, JobStatusEnum
+    from app.database.session import SessionLocal, engine
+    from app.main import app
+    from app.services import file_upload, s3_client
+    from benchmarks.corpus import make_archive
+    from benchmarks.stand_ins import FakeS3
+
+    Base.metadata.create_all(engine)
+    # The TestClient serves requests from another thread, where shared tasks
+    # only find this app once it is the default
+    celery_app.set_default()
+    celery_app.conf.task_always_eager = True
+    celery_app.conf.task_eager_propagates = True
+    redis_server = fakeredis.FakeServer()
+    redis_client._client = fakeredis.FakeRedis(
+        server=redis_server, decode_responses=True
+    )
+    redis_client._async_client = fakeredis.aioredis.FakeRedis(
+        server=redis_server, decode_responses=True
+    )
+    s3_client._client = FakeS3()
+    s3_client._client_pid = os.getpid()
+
+    timer = StageTimer()
+    stages = {
+        (file_upload, "save_file"): ("upload", True),
+        (tasks, "extract_member"): ("extract", False),
+        (tasks, "convert_docx_to_pdf"): ("convert", False),
+        (tasks, "convert_docx_to_pdf_batch"): ("convert_batch", False),
+        (tasks, "file_zip"): ("zip", False),
+    }
+    jobs, failed_files, measured_files = [], 0, 0
+    with ExitStack() as stack, TestClient(app) as client:
+        for (module, name), (stage, is_async) in stages.items():
+            function = getattr(module, name)
+            wrapper = timer.wrap_async if is_async else timer.wrap
+            stack.enter_context(patch.object(module, name, wrapper(stage, function)))
+
+        wall_start = None
+        for index in range(args.warmup + args.jobs):
+            measured = index >= args.warmup
+            if measured and wall_start is None:
+                timer.enabled = True
+                wall_start = time.perf_counter()
+            archive = make_archive(args.files, args.file_size, args.seed + index)
+
+            start = time.perf_counter()
+            response = client.post(
+                "/api/v1/jobs/",
+                files={"file": ("corpus.zip", archive, "application/zip")},
+            )
+            elapsed = time.perf_counter() - start
+            response.raise_for_status()
+
+            with SessionLocal() as session:
+                job = session.get(Job, uuid.UUID(response.json()["job_id"]))
+                if job.status != JobStatusEnum.completed:
+                    raise RuntimeError(f"Job {job.id} ended as {job.status.value}")
+                if measured:
+                    jobs.append(elapsed)
+                    failed_files += job.failed_files
+                    measured_files += job.total_files
+        wall_time = time.perf_counter() - wall_start
+
+    timer.samples["job"] = jobs
+    self_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    children_rss = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    return {
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "cpus": os.cpu_count(),
+        "parameters": {
+            key: value
+            for key, value in vars(args).items()
+            if key
+            not in (
+                "output",
+                "baseline",
+                "tolerance",
+                "min_delta_ms",
+                "database_url",
+                "verbose",
+            )
+        },
+        "files": measured_files,
+        "failed_files": failed_files,
+        "wall_time_s": round(wall_time, 3),
+        "files_per_sec": round(measured_files / wall_time, 3),
+        "stages": {
+            stage: summarize(samples)
+            for stage, samples in timer.samples.items()
+            if samples
+        },
+        # ru_maxrss is in KiB on Linux
+        "peak_rss_mb": round(self_rss / 1024, 1),
+        "peak_child_rss_mb": round(children_rss / 1024, 1),
+    }
+
+
+def compare(
+    result: dict, baseline: dict, tolerance: float, min_delta_ms: float
+) -> list:
+    """
+    Return the regressions of `result` against `baseline`.
+    """
+    regressions = []
+    if baseline["parameters"] != result["parameters"]:
+        print("Warning: baseline was measured with other parameters")
+    if result["files_per_sec"] < baseline["files_per_sec"] * (1 - tolerance):
+        regressions.append(
+            f"files/sec {baseline['files_per_sec']} -> {result['files_per_sec']}"
+        )
+    for stage, stats in result["stages"].items():
+        before = baseline["stages"].get(stage)
+        if (
+            before
+            and stats["p50_ms"] > before["p50_ms"] * (1 + tolerance)
+            and stats["p50_ms"] - before["p50_ms"] > min_delta_ms
+        ):
+            regressions.append(
+                f"{stage} p50 {before['p50_ms']}ms -> {stats['p50_ms']}ms"
+            )
+    return regressions
+
+
+def print_report(result: dict):
+    print(
+        f"\n{result['files']} files in {result['wall_time_s']}s: "
+        f"{result['files_per_sec']} files/sec, {result['failed_files']} failed "
+        f"(commit {result['commit']})"
+    )
+    print(f"{'stage':<15}{'count':>7}{'p50 ms':>11}{'p90 ms':>11}{'p99 ms':>11}")
+    for stage, stats in result["stages"].items():
+        print(
+            f"{stage:<15}{stats['count']:>7}{stats['p50_ms']:>11}"
+            f"{stats['p90_ms']:>11}{stats['p99_ms']:>11}"
+        )
+    print(
+        f"peak RSS {result['peak_rss_mb']} MB, "
+        f"converter processes {result['peak_child_rss_mb']} MB"
+    )
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    with tempfile.TemporaryDirectory(prefix="conversion_benchmark_") as workdir:
+        configure_environment(args, workdir)
+        with ExitStack() as stack:
+            if not args.verbose:
+                devnull = stack.enter_context(open(os.devnull, "w"))
+                stack.enter_context(redirect_stdout(devnull))
+            result = run_benchmark(args, workdir)
+
+    print_report(result)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(result, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(
+                result, json.load(f), args.tolerance, args.min_delta_ms
+            )
+        for regression in regressions:
+            print(f"Regression: {regression}")
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,186 @@
+import io
+import os
+import stat
+import sys
+import threading
+import uuid
+from datetime import datetime, timezone
+
+from botocore.exceptions import ClientError
+
+STUB_CONVERTER = '''#!{python}
+"""Stand-in for `libreoffice --convert-to pdf`, writes a tiny PDF per input."""
+import os
+import sys
+import time
+
+args = sys.argv[1:]
+if "--version" in args:
+    print("LibreOffice 0.0.0 benchmark-stub")
+    sys.exit(0)
+outdir = args[args.index("--outdir") + 1]
+inputs = [arg for arg in args if arg.endswith(".docx")]
+for path in inputs:
+    time.sleep({delay})
+    name = os.path.splitext(os.path.basename(path))[0] + ".pdf"
+    with open(os.path.join(outdir, name), "wb") as pdf:
+        pdf.write(b"%PDF-1.4\\n%benchmark stub\\n" + os.path.getsize(path).to_bytes(8, "big"))
+'''
+
+
+def write_stub_converter(directory: str, delay: float) -> str:
+    """
+    Write an executable that answers the converter command line like
+    LibreOffice does, sleeping `delay` seconds per document.
+    """
+    path = os.path.join(directory, "stub-soffice")
+    with open(path, "w") as f:
+        f.write(STUB_CONVERTER.format(python=sys.executable, delay=delay))
+    os.chmod(path, os.stat(path).st_mode | stat.S_IXUSR)
+    return path
+
+
+def _client_error(code: str, operation: str):
+    return ClientError({"Error": {"Code": code, "Message": code}}, operation)
+
+
+def _not_found(operation: str):
+    return ClientError({"Error": {"Code": "404", "Message": "Not Found"}}, operation)
+
+
+class _Body(io.BytesIO):
+    def iter_chunks(self, chunk_size: int = 1024 * 1024):
+        while chunk := self.read(chunk_size):
+            yield chunk
+
+
+class _Paginator:
+    def __init__(self, s3):
+        self.s3 = s3
+
+    def paginate(self, Bucket, Prefix=""):
+        with self.s3.lock:
+            contents = [
+                {"Key": key, "Size": len(data), "LastModified": self.s3.modified[key]}
+                for key, data in sorted(self.s3.objects.items())
+                if key.startswith(Prefix)
+            ]
+        yield {"Contents": contents}
+
+
+class FakeS3:
+    """
+    In-memory stand-in for the boto3 S3 client calls the app makes on
+    the upload, conversion and zip path, shared by the benchmarks and the
+    tests. Thread-safe, single bucket.
+    """
+
+    def __init__(self):
+        self.objects = {}
+        self.modified = {}
+        self.uploads = {}
+        self.lock = threading.Lock()
+
+    def _store(self, key: str, data: bytes):
+        self.objects[key] = data
+        self.modified[key] = datetime.now(timezone.utc)
+
+    def put_object(self, Bucket, Key, Body=b"", **kwargs):
+        data = Body.read() if hasattr(Body, "read") else bytes(Body)
+        with self.lock:
+            self._store(Key, data)
+        return {"ETag": f'"{uuid.uuid4().hex}"'}
+
+    def get_object(self, Bucket, Key, **kwargs):
+        with self.lock:
+            if Key not in self.objects:
+                raise ClientError(
+                    {"Error": {"Code": "NoSuchKey", "Message": "Not Found"}},
+                    "GetObject",
+                )
+            data = self.objects[Key]
+        return {"Body": _Body(data), "ContentLength": len(data)}
+
+    def head_object(self, Bucket, Key):
+        with self.lock:
+            if Key not in self.objects:
+                raise _not_found("HeadObject")
+            return {
+                "ContentLength": len(self.objects[Key]),
+                "LastModified": self.modified[Key],
+            }
+
+    def copy_object(self, Bucket, Key, CopySource, **kwargs):
+        with self.lock:
+            self._store(Key, self.objects[CopySource["Key"]])
+
+    def delete_object(self, Bucket, Key):
+        with self.lock:
+            self.objects.pop(Key, None)
+            self.modified.pop(Key, None)
+
+    def delete_objects(self, Bucket, Delete):
+        with self.lock:
+            for item in Delete["Objects"]:
+                self.objects.pop(item["Key"], None)
+                self.modified.pop(item["Key"], None)
+
+    def upload_file(self, Filename, Bucket, Key, **kwargs):
+        with open(Filename, "rb") as f:
+            self.put_object(Bucket=Bucket, Key=Key, Body=f.read())
+
+    def download_file(self, Bucket, Key, Filename, **kwargs):
+        with self.lock:
+            if Key not in self.objects:
+                raise _not_found("HeadObject")
+            data = self.objects[Key]
+        with open(Filename, "wb") as f:
+            f.write(data)
+
+    def create_multipart_upload(self, Bucket, Key, **kwargs):
+        upload_id = uuid.uuid4().hex
+        with self.lock:
+            self.uploads[upload_id] = {}
+        return {"UploadId": upload_id}
+
+    def upload_part(self, Bucket, Key, UploadId, PartNumber, Body, **kwargs):
+        etag = f'"{uuid.uuid4().hex}"'
+        with self.lock:
+            self.uploads[UploadId][PartNumber] = (etag, bytes(Body))
+        return {"ETag": etag}
+
+    def list_parts(self, Bucket, Key, UploadId, **kwargs):
+        with self.lock:
+            if UploadId not in self.uploads:
+                raise _client_error("NoSuchUpload", "ListParts")
+            parts = sorted(self.uploads[UploadId].items())
+        return {
+            "Parts": [
+                {"PartNumber": number, "ETag": etag, "Size": len(data)}
+                for number, (etag, data) in parts
+            ]
+        }
+
+    def complete_multipart_upload(self, Bucket, Key, UploadId, MultipartUpload):
+        with self.lock:
+            if UploadId not in self.uploads:
+                raise _client_error("NoSuchUpload", "CompleteMultipartUpload")
+            uploaded = self.uploads[UploadId]
+            numbers = [part["PartNumber"] for part in MultipartUpload["Parts"]]
+            if numbers != sorted(set(numbers)):
+                raise _client_error("InvalidPartOrder", "CompleteMultipartUpload")
+            for part in MultipartUpload["Parts"]:
+                if uploaded.get(part["PartNumber"], (None,))[0] != part["ETag"]:
+                    raise _client_error("InvalidPart", "CompleteMultipartUpload")
+            del self.uploads[UploadId]
+            self._store(Key, b"".join(uploaded[number][1] for number in numbers))
+
+    def abort_multipart_upload(self, Bucket, Key, UploadId):
+        with self.lock:
+            self.uploads.pop(UploadId, None)
+
+    def get_paginator(self, operation: str):
+        return _Paginator(self)
+
+    def generate_presigned_url(self, ClientMethod, Params, ExpiresIn=3600):
+        return f"https://fake-s3.local/{Params['Bucket']}/{Params['Key']}"
@@ -0,0 +1,88 @@
+"""
+Where the wall-clock time of a job went, from spans written with
+TRACING_EXPORTER=file:
+
+    python -m benchmarks.trace_report traces/spans.jsonl <job_id>
+
+Prints the wall time of the job's trace, queue wait against task work,
+and the time per span name.
+"""
+
+import argparse
+import json
+import sys
+from collections import defaultdict
+from datetime import datetime
+
+WAIT_SPANS = ("queue.wait", "fair_scheduler.wait")
+
+
+def load_spans(path: str, job_id: str) -> list:
+    """
+    Read the spans of the trace(s) tagged with `job_id`.
+    """
+    with open(path) as f:
+        spans = [json.loads(line) for line in f if line.strip()]
+    trace_ids = {
+        span["context"]["trace_id"]
+        for span in spans
+        if span.get("attributes", {}).get("job.id") == job_id
+    }
+    return [span for span in spans if span["context"]["trace_id"] in trace_ids]
+
+
+def _seconds(span: dict) -> tuple:
+    start = datetime.fromisoformat(span["start_time"]).timestamp()
+    end = datetime.fromisoformat(span["end_time"]).timestamp()
+    return start, end
+
+
+def summarize(spans: list) -> dict:
+    """
+    Wall time of the trace, total queue wait and task time, and count and
+    total seconds per span name.
+    """
+    times = [_seconds(span) for span in spans]
+    by_name = defaultdict(lambda: {"count": 0, "seconds": 0.0})
+    waiting = working = 0.0
+    for span, (start, end) in zip(spans, times):
+        by_name[span["name"]]["count"] += 1
+        by_name[span["name"]]["seconds"] += end - start
+        if span["name"] in WAIT_SPANS:
+            waiting += end - start
+        elif "celery.task_name" in span.get("attributes", {}):
+            working += end - start
+    return {
+        "wall_seconds": max(end for _, end in times) - min(s for s, _ in times),
+        "queue_wait_seconds": waiting,
+        "task_seconds": working,
+        "spans": dict(by_name),
+    }
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("trace_file")
+    parser.add_argument("job_id")
+    args = parser.parse_args(argv)
+
+    spans = load_spans(args.trace_file, args.job_id)
+    if not spans:
+        print(f"No spans of job {args.job_id} in {args.trace_file}")
+        return 1
+    summary = summarize(spans)
+    print(
+        f"Job {args.job_id}: {summary['wall_seconds']:.3f}s wall, "
+        f"{summary['queue_wait_seconds']:.3f}s queued, "
+        f"{summary['task_seconds']:.3f}s in tasks (summed over tasks)"
+    )
+    print(f"{'span':<40}{'count':>7}{'total s':>11}")
+    for name, stats in sorted(
+        summary["spans"].items(), key=lambda item: -item[1]["seconds"]
+    ):
+        print(f"{name:<40}{stats['count']:>7}{stats['seconds']:>11.3f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,56 @@
+"""Add indexes for retention sweeps
+
+Revision ID: a8c6e2f4b7d9
+Revises: f7a5b1c4d6e8
+Create Date: 2026-10-18 18:24:37.618042
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = "a8c6e2f4b7d9"
+down_revision: Union[str, Sequence[str], None] = "f7a5b1c4d6e8"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Built concurrently so uploads and workers are not blocked meanwhile,
+    # which cannot happen inside a transaction block
+    with op.get_context().autocommit_block():
+        op.create_index(
+            "ix_jobs_status_created_at",
+            "jobs",
+            ["status", "created_at"],
+            postgresql_concurrently=True,
+            if_not_exists=True,
+        )
+        op.create_index(
+            "ix_file_conversions_job_id_status",
+            "file_conversions",
+            ["job_id", "status"],
+            postgresql_concurrently=True,
+            if_not_exists=True,
+        )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        op.drop_index(
+            "ix_file_conversions_job_id_status",
+            table_name="file_conversions",
+            postgresql_concurrently=True,
+            if_exists=True,
+        )
+        op.drop_index(
+            "ix_jobs_status_created_at",
+            table_name="jobs",
+            postgresql_concurrently=True,
+            if_exists=True,
+        )
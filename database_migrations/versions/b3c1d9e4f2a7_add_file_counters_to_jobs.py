@@ -0,0 +1,54 @@
+"""Add file counters to jobs
+
+Revision ID: b3c1d9e4f2a7
+Revises: 7371e062f2ae
+Create Date: 2026-10-18 10:12:41.402183
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "b3c1d9e4f2a7"
+down_revision: Union[str, Sequence[str], None] = "7371e062f2ae"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    for column in ("total_files", "completed_files", "failed_files"):
+        op.add_column(
+            "jobs",
+            sa.Column(column, sa.Integer(), nullable=False, server_default="0"),
+        )
+    # Backfill the counters of existing jobs
+    op.execute(
+        """
+        UPDATE jobs SET
+            total_files = counts.total,
+            completed_files = counts.completed,
+            failed_files = counts.failed
+        FROM (
+            SELECT
+                job_id,
+                count(*) AS total,
+                count(*) FILTER (WHERE status = 'completed') AS completed,
+                count(*) FILTER (WHERE status = 'failed') AS failed
+            FROM file_conversions
+            GROUP BY job_id
+        ) AS counts
+        WHERE jobs.id = counts.job_id
+        """
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column("jobs", "failed_files")
+    op.drop_column("jobs", "completed_files")
+    op.drop_column("jobs", "total_files")
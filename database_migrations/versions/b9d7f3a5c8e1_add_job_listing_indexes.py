@@ -0,0 +1,83 @@
+"""Add indexes for keyset-paginated job and file listings
+
+Revision ID: b9d7f3a5c8e1
+Revises: a8c6e2f4b7d9
+Create Date: 2026-10-18 19:05:52.140388
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = "b9d7f3a5c8e1"
+down_revision: Union[str, Sequence[str], None] = "a8c6e2f4b7d9"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Built concurrently so uploads and workers are not blocked meanwhile,
+    # which cannot happen inside a transaction block
+    with op.get_context().autocommit_block():
+        op.create_index(
+            "ix_jobs_created_at_id",
+            "jobs",
+            ["created_at", "id"],
+            postgresql_concurrently=True,
+            if_not_exists=True,
+        )
+        # Supersedes (status, created_at): the listing is ordered by id too
+        op.create_index(
+            "ix_jobs_status_created_at_id",
+            "jobs",
+            ["status", "created_at", "id"],
+            postgresql_concurrently=True,
+            if_not_exists=True,
+        )
+        op.drop_index(
+            "ix_jobs_status_created_at",
+            table_name="jobs",
+            postgresql_concurrently=True,
+            if_exists=True,
+        )
+        op.create_index(
+            "ix_file_conversions_job_id_file_name_id",
+            "file_conversions",
+            ["job_id", "file_name", "id"],
+            postgresql_concurrently=True,
+            if_not_exists=True,
+        )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        op.drop_index(
+            "ix_file_conversions_job_id_file_name_id",
+            table_name="file_conversions",
+            postgresql_concurrently=True,
+            if_exists=True,
+        )
+        op.create_index(
+            "ix_jobs_status_created_at",
+            "jobs",
+            ["status", "created_at"],
+            postgresql_concurrently=True,
+            if_not_exists=True,
+        )
+        op.drop_index(
+            "ix_jobs_status_created_at_id",
+            table_name="jobs",
+            postgresql_concurrently=True,
+            if_exists=True,
+        )
+        op.drop_index(
+            "ix_jobs_created_at_id",
+            table_name="jobs",
+            postgresql_concurrently=True,
+            if_exists=True,
+        )
@@ -0,0 +1,29 @@
+"""Add error_message to jobs
+
+Revision ID: c0e8a4b6d2f9
+Revises: b9d7f3a5c8e1
+Create Date: 2026-10-18 21:12:37.402816
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "c0e8a4b6d2f9"
+down_revision: Union[str, Sequence[str], None] = "b9d7f3a5c8e1"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column("jobs", sa.Column("error_message", sa.String(), nullable=True))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column("jobs", "error_message")
@@ -0,0 +1,42 @@
+"""Add uploading job status
+
+Revision ID: c4d2e8f1a9b3
+Revises: b3c1d9e4f2a7
+Create Date: 2026-10-18 13:05:17.630412
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = "c4d2e8f1a9b3"
+down_revision: Union[str, Sequence[str], None] = "b3c1d9e4f2a7"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # ALTER TYPE ... ADD VALUE cannot run inside a transaction block
+    with op.get_context().autocommit_block():
+        op.execute("ALTER TYPE jobstatusenum ADD VALUE IF NOT EXISTS 'uploading'")
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    # Postgres cannot drop a value from an enum type, the type is rebuilt
+    op.execute("UPDATE jobs SET status = 'failed' WHERE status = 'uploading'")
+    op.execute("ALTER TYPE jobstatusenum RENAME TO jobstatusenum_old")
+    op.execute(
+        "CREATE TYPE jobstatusenum AS ENUM "
+        "('pending', 'in_progress', 'completed', 'failed')"
+    )
+    for table in ("jobs", "file_conversions"):
+        op.execute(
+            f"ALTER TABLE {table} ALTER COLUMN status TYPE jobstatusenum "
+            "USING status::text::jobstatusenum"
+        )
+    op.execute("DROP TYPE jobstatusenum_old")
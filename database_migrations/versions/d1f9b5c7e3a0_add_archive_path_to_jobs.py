@@ -0,0 +1,29 @@
+"""Add archive_path to jobs
+
+Revision ID: d1f9b5c7e3a0
+Revises: c0e8a4b6d2f9
+Create Date: 2026-10-18 21:48:05.917263
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "d1f9b5c7e3a0"
+down_revision: Union[str, Sequence[str], None] = "c0e8a4b6d2f9"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column("jobs", sa.Column("archive_path", sa.String(), nullable=True))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column("jobs", "archive_path")
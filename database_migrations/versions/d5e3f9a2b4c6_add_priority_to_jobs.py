@@ -0,0 +1,32 @@
+"""Add priority to jobs
+
+Revision ID: d5e3f9a2b4c6
+Revises: c4d2e8f1a9b3
+Create Date: 2026-10-18 14:21:48.115903
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "d5e3f9a2b4c6"
+down_revision: Union[str, Sequence[str], None] = "c4d2e8f1a9b3"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column(
+        "jobs",
+        sa.Column("priority", sa.Integer(), nullable=False, server_default="1"),
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column("jobs", "priority")
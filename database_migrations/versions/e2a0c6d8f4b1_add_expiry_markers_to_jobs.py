@@ -0,0 +1,51 @@
+"""Add retention expiry markers to jobs
+
+Revision ID: e2a0c6d8f4b1
+Revises: d1f9b5c7e3a0
+Create Date: 2026-10-18 22:20:43.551092
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "e2a0c6d8f4b1"
+down_revision: Union[str, Sequence[str], None] = "d1f9b5c7e3a0"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column("jobs", sa.Column("inputs_expired_at", sa.DateTime(), nullable=True))
+    op.add_column("jobs", sa.Column("outputs_expired_at", sa.DateTime(), nullable=True))
+    # Built concurrently so uploads and workers are not blocked meanwhile,
+    # which cannot happen inside a transaction block
+    with op.get_context().autocommit_block():
+        for artifact in ("inputs", "outputs"):
+            op.create_index(
+                f"ix_jobs_{artifact}_unexpired",
+                "jobs",
+                ["status", "updated_at"],
+                postgresql_where=sa.text(f"{artifact}_expired_at IS NULL"),
+                postgresql_concurrently=True,
+                if_not_exists=True,
+            )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        for artifact in ("outputs", "inputs"):
+            op.drop_index(
+                f"ix_jobs_{artifact}_unexpired",
+                table_name="jobs",
+                postgresql_concurrently=True,
+                if_exists=True,
+            )
+    op.drop_column("jobs", "outputs_expired_at")
+    op.drop_column("jobs", "inputs_expired_at")
@@ -0,0 +1,39 @@
+"""Add updated_at to jobs and file conversions
+
+Revision ID: e6f4a0b3c5d7
+Revises: d5e3f9a2b4c6
+Create Date: 2026-10-18 16:02:41.508217
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "e6f4a0b3c5d7"
+down_revision: Union[str, Sequence[str], None] = "d5e3f9a2b4c6"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    for table in ("jobs", "file_conversions"):
+        op.add_column(
+            table,
+            sa.Column(
+                "updated_at", sa.DateTime(), nullable=True, server_default=sa.func.now()
+            ),
+        )
+    # The recovery sweep looks for unfinished jobs without recent progress
+    op.create_index("ix_jobs_status_updated_at", "jobs", ["status", "updated_at"])
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index("ix_jobs_status_updated_at", table_name="jobs")
+    for table in ("jobs", "file_conversions"):
+        op.drop_column(table, "updated_at")
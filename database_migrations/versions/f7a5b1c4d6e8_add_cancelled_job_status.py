@@ -0,0 +1,43 @@
+"""Add cancelled job status
+
+Revision ID: f7a5b1c4d6e8
+Revises: e6f4a0b3c5d7
+Create Date: 2026-10-18 17:11:09.274615
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = "f7a5b1c4d6e8"
+down_revision: Union[str, Sequence[str], None] = "e6f4a0b3c5d7"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # ALTER TYPE ... ADD VALUE cannot run inside a transaction block
+    with op.get_context().autocommit_block():
+        op.execute("ALTER TYPE jobstatusenum ADD VALUE IF NOT EXISTS 'cancelled'")
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    # Postgres cannot drop a value from an enum type, the type is rebuilt
+    for table in ("jobs", "file_conversions"):
+        op.execute(f"UPDATE {table} SET status = 'failed' WHERE status = 'cancelled'")
+    op.execute("ALTER TYPE jobstatusenum RENAME TO jobstatusenum_old")
+    op.execute(
+        "CREATE TYPE jobstatusenum AS ENUM "
+        "('uploading', 'pending', 'in_progress', 'completed', 'failed')"
+    )
+    for table in ("jobs", "file_conversions"):
+        op.execute(
+            f"ALTER TABLE {table} ALTER COLUMN status TYPE jobstatusenum "
+            "USING status::text::jobstatusenum"
+        )
+    op.execute("DROP TYPE jobstatusenum_old")
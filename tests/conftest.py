@@ -0,0 +1,58 @@
+from unittest.mock import patch
+
+import fakeredis
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import NullPool
+
+from app import redis_client
+from app.database.base import Base
+from app.database.session import get_async_db
+from app.main import app
+from app.services import file_upload, job_status
+from app.services.job_events import JobEventHub
+
+
+@pytest.fixture
+def client(tmp_path):
+    """
+    API client on a SQLite database and an in-memory Redis, uploads stored
+    under tmp_path. Yields the client and a sync session factory.
+    """
+    db_path = tmp_path / "jobs.db"
+    sync_engine = create_engine(f"sqlite:///{db_path}")
+    Base.metadata.create_all(sync_engine)
+    async_engine = create_async_engine(
+        f"sqlite+aiosqlite:///{db_path}", poolclass=NullPool
+    )
+    async_session = async_sessionmaker(async_engine, expire_on_commit=False)
+
+    async def override_get_async_db():
+        async with async_session() as db:
+            yield db
+
+    server = fakeredis.FakeServer()
+    app.dependency_overrides[get_async_db] = override_get_async_db
+    with patch.object(
+        redis_client,
+        "_client",
+        fakeredis.FakeRedis(server=server, decode_responses=True),
+    ), patch.object(
+        redis_client,
+        "_async_client",
+        fakeredis.FakeAsyncRedis(server=server, decode_responses=True),
+    ), patch.object(
+        job_status, "job_event_hub", JobEventHub()
+    ), patch.object(
+        file_upload, "USE_S3", False
+    ), patch.object(
+        file_upload, "UPLOAD_DIR", str(tmp_path / "uploads")
+    ), TestClient(
+        app
+    ) as test_client:
+        yield test_client, sessionmaker(bind=sync_engine)
+    app.dependency_overrides.clear()
+    sync_engine.dispose()
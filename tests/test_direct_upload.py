@@ -0,0 +1,95 @@
+import uuid
+from unittest.mock import patch
+
+import boto3
+
+from app.services import direct_upload
+from benchmarks.stand_ins import FakeS3
+
+
+def _presign_client():
+    # Presigning happens offline, no S3 is needed
+    return boto3.session.Session(
+        aws_access_key_id="test", aws_secret_access_key="test", region_name="us-east-1"
+    ).client("s3", endpoint_url="http://localhost:9000")
+
+
+def _patched(fake_s3):
+    return patch.multiple(
+        direct_upload,
+        get_s3_client=lambda: fake_s3,
+        get_presign_s3_client=_presign_client,
+    )
+
+
+def test_small_upload_gets_presigned_post():
+    job_id = uuid.uuid4()
+    with _patched(FakeS3()):
+        upload = direct_upload.presign_direct_upload(job_id, size=1024)
+
+    assert upload["key"] == f"{job_id}/upload.zip"
+    assert upload["post"]["fields"]["key"] == f"{job_id}/upload.zip"
+    assert "policy" in upload["post"]["fields"]
+    assert "upload_id" not in upload
+
+
+def test_large_upload_gets_presigned_parts_and_completes_listed_parts():
+    job_id = uuid.uuid4()
+    fake_s3 = FakeS3()
+    with _patched(fake_s3), patch.object(
+        direct_upload, "S3_UPLOAD_PART_SIZE", 8 * 1024 * 1024
+    ):
+        upload = direct_upload.presign_direct_upload(job_id, size=12 * 1024 * 1024)
+        upload_id = upload["upload_id"]
+        assert [part["part_number"] for part in upload["parts"]] == [1, 2]
+        assert "partNumber=2" in upload["parts"][1]["url"]
+        # The client PUTs the parts to the presigned URLs, last one first
+        for number, body in ((2, b"zip tail"), (1, b"zip head, ")):
+            fake_s3.upload_part(
+                Bucket=direct_upload.S3_BUCKET_NAME,
+                Key=upload["key"],
+                UploadId=upload_id,
+                PartNumber=number,
+                Body=body,
+            )
+
+        assert direct_upload.finish_direct_upload(job_id, upload_id)
+        # A retried completion still finds the ZIP
+        assert direct_upload.finish_direct_upload(job_id, upload_id, parts=[])
+
+    assert fake_s3.objects[upload["key"]] == b"zip head, zip tail"
+
+
+def test_finish_without_uploaded_zip_fails():
+    with _patched(FakeS3()):
+        assert not direct_upload.finish_direct_upload(uuid.uuid4())
+
+
+def test_notification_yields_uploaded_jobs_only():
+    job_id = uuid.uuid4()
+    event = {
+        "Records": [
+            {
+                "eventName": "s3:ObjectCreated:Put",
+                "s3": {
+                    "bucket": {"name": direct_upload.S3_BUCKET_NAME},
+                    "object": {"key": f"{job_id}%2Fupload.zip"},
+                },
+            },
+            {
+                "eventName": "ObjectCreated:CompleteMultipartUpload",
+                "s3": {
+                    "bucket": {"name": direct_upload.S3_BUCKET_NAME},
+                    "object": {"key": f"{job_id}/converted/a.pdf"},
+                },
+            },
+            {
+                "eventName": "ObjectRemoved:Delete",
+                "s3": {
+                    "bucket": {"name": direct_upload.S3_BUCKET_NAME},
+                    "object": {"key": f"{job_id}/upload.zip"},
+                },
+            },
+        ]
+    }
+    assert direct_upload.uploaded_job_ids(event) == [job_id]
@@ -0,0 +1,97 @@
+import uuid
+from unittest.mock import patch
+
+import fakeredis
+import pytest
+
+from app.services import fair_scheduler
+
+
+@pytest.fixture
+def scheduler():
+    redis = fakeredis.FakeRedis(decode_responses=True)
+    sent = []
+    with patch.object(fair_scheduler, "get_redis", return_value=redis), patch.object(
+        fair_scheduler.celery_app, "producer_or_acquire"
+    ), patch.object(
+        fair_scheduler.celery_app,
+        "send_task",
+        side_effect=lambda name, args, **kwargs: sent.append((name, args)),
+    ), patch.object(
+        fair_scheduler, "FAIR_SCHEDULER_MAX_IN_FLIGHT", 2
+    ):
+        yield redis, sent
+
+
+def _enqueue(job_id, count, weight=1):
+    for i in range(count):
+        fair_scheduler.enqueue_conversion(
+            job_id,
+            weight,
+            f"{job_id}-{i}",
+            "app.tasks.process_file_conversion",
+            [f"{job_id}-{i}", f"doc{i}.docx"],
+        )
+
+
+def _run(sent, releases):
+    """Finish released tasks one at a time, returning the jobs in order."""
+    order = []
+    while len(order) < releases and sent:
+        _, (lease, _) = sent.pop(0)
+        order.append(lease.rsplit("-", 1)[0])
+        fair_scheduler.finish_conversion(lease)
+    return order
+
+
+def test_small_job_is_not_starved_by_bulk_job(scheduler):
+    _, sent = scheduler
+    bulk, small = str(uuid.uuid4()), str(uuid.uuid4())
+    _enqueue(bulk, 100)
+    assert fair_scheduler.release_conversions() == 2
+    _enqueue(small, 3)
+
+    order = _run(sent, 10)
+    # The small job is done within a few slots instead of after 100 files
+    assert order[:8].count(small) == 3
+    assert len(sent) == 2
+
+
+def test_jobs_share_capacity_by_priority(scheduler):
+    _, sent = scheduler
+    heavy, light = str(uuid.uuid4()), str(uuid.uuid4())
+    _enqueue(heavy, 50, weight=3)
+    _enqueue(light, 50, weight=1)
+    fair_scheduler.release_conversions()
+
+    order = _run(sent, 40)
+    assert order.count(heavy) == 30
+    assert order.count(light) == 10
+
+
+def test_expired_leases_free_their_slots(scheduler):
+    redis, sent = scheduler
+    job_id = str(uuid.uuid4())
+    _enqueue(job_id, 4)
+    fair_scheduler.release_conversions()
+    assert len(sent) == 2
+    assert fair_scheduler.release_conversions() == 0
+
+    # Workers died holding both leases
+    redis.zadd(fair_scheduler.IN_FLIGHT_KEY, {f"{job_id}-0": 0, f"{job_id}-1": 0})
+    assert fair_scheduler.release_conversions() == 2
+    assert not redis.exists(f"{fair_scheduler.JOB_QUEUE_PREFIX}{job_id}")
+    assert not redis.zscore(fair_scheduler.ACTIVE_JOBS_KEY, job_id)
+
+
+def test_held_files_are_those_not_released_yet(scheduler):
+    _, sent = scheduler
+    job = str(uuid.uuid4())
+    _enqueue(job, 3)
+    fair_scheduler.enqueue_conversion(
+        job, 1, "batch", "app.tasks.process_file_conversion_batch", [["b1", "b2"], []]
+    )
+    fair_scheduler.release_conversions()
+
+    assert [args[0] for _, args in sent] == [f"{job}-0", f"{job}-1"]
+    assert fair_scheduler.held_files(job) == {f"{job}-2", "b1", "b2"}
@@ -0,0 +1,249 @@
+import io
+import os
+import subprocess
+import time
+import zipfile
+from pathlib import Path
+from unittest.mock import patch
+
+import pytest
+
+from app.services import conversion_slots
+from app.services import file_conversion_and_zipping
+from app.services.conversion_cache import LocalConversionCache
+from app.services.file_conversion_and_zipping import (
+    ArchiveValidationError,
+    convert_docx_to_pdf_batch,
+    validate_archive,
+)
+from app.services.libreoffice_pool import ConversionCancelled
+from app.services.zip_stream import stream_zip
+
+
+def test_convert_batch_reports_per_file_status(tmp_path):
+    """One converter run for the batch, with failures reported per file."""
+    good = tmp_path / "good.docx"
+    bad = tmp_path / "bad.docx"
+    good.write_bytes(b"docx")
+    bad.write_bytes(b"docx")
+
+    def fake_run(command, timeout, is_cancelled=None):
+        assert command[1].startswith("-env:UserInstallation=file://")
+        output_dir = Path(command[command.index("--outdir") + 1])
+        (output_dir / "good.pdf").write_bytes(b"%PDF")
+        return subprocess.CompletedProcess(
+            command, 0, "", "bad.docx: source file could not be loaded"
+        )
+
+    with patch(
+        "app.services.file_conversion_and_zipping.get_conversion_cache",
+        return_value=None,
+    ), patch(
+        "app.services.file_conversion_and_zipping.get_libreoffice_pool",
+        return_value=None,
+    ), patch(
+        "app.services.conversion_slots.LIBREOFFICE_SLOT_DIR", str(tmp_path / "slots")
+    ), patch(
+        "app.services.file_conversion_and_zipping._run_converter",
+        side_effect=fake_run,
+    ) as run:
+        results = convert_docx_to_pdf_batch([str(good), str(bad)])
+
+    assert run.call_count == 1
+    assert results[0] == {
+        "status": "success",
+        "converted_file": str(Path(tmp_path) / "good.pdf"),
+    }
+    assert results[1]["status"] == "error"
+    assert "could not be loaded" in results[1]["error_message"]
+
+
+def test_converter_timeout_kills_the_whole_process_group(tmp_path):
+    """A hung converter is killed together with the processes it started."""
+    pid_file = tmp_path / "child.pid"
+    start = time.monotonic()
+    with pytest.raises(subprocess.TimeoutExpired):
+        file_conversion_and_zipping._run_converter(
+            ["sh", "-c", f"sleep 30 & echo $! > {pid_file}; wait"], timeout=0.5
+        )
+
+    assert time.monotonic() - start < 5
+    child = Path(f"/proc/{pid_file.read_text().strip()}/stat")
+    # Gone, or a zombie waiting for init to reap it
+    assert not child.exists() or child.read_text().split()[2] == "Z"
+
+
+def test_cancelled_conversion_is_killed(tmp_path):
+    """Cancelling the job kills the running converter without waiting for it."""
+    pid_file = tmp_path / "child.pid"
+    cancelled_at = time.monotonic() + 0.3
+    with patch.object(
+        file_conversion_and_zipping, "JOB_CANCEL_POLL_INTERVAL", 0.1
+    ), pytest.raises(ConversionCancelled):
+        file_conversion_and_zipping._run_converter(
+            ["sh", "-c", f"sleep 30 & echo $! > {pid_file}; wait"],
+            timeout=30,
+            is_cancelled=lambda: time.monotonic() >= cancelled_at,
+        )
+
+    assert time.monotonic() - cancelled_at < 5
+    child = Path(f"/proc/{pid_file.read_text().strip()}/stat")
+    assert not child.exists() or child.read_text().split()[2] == "Z"
+
+
+def test_timeouts_fail_single_documents_and_retry_batches(tmp_path):
+    """The document that hung a batch is unknown, so only a batch is retryable."""
+    paths = []
+    for name in ("a", "b"):
+        (tmp_path / f"{name}.docx").write_bytes(b"docx")
+        paths.append(str(tmp_path / f"{name}.docx"))
+
+    def hang(command, timeout, is_cancelled=None):
+        raise subprocess.TimeoutExpired(command, timeout)
+
+    with patch(
+        "app.services.file_conversion_and_zipping.get_conversion_cache",
+        return_value=None,
+    ), patch(
+        "app.services.file_conversion_and_zipping.get_libreoffice_pool",
+        return_value=None,
+    ), patch(
+        "app.services.conversion_slots.LIBREOFFICE_SLOT_DIR", str(tmp_path / "slots")
+    ), patch(
+        "app.services.file_conversion_and_zipping._run_converter", side_effect=hang
+    ):
+        batch = convert_docx_to_pdf_batch(paths)
+        isolated = convert_docx_to_pdf_batch(paths, isolate=True)
+
+    assert [result["retryable"] for result in batch] == [True, True]
+    assert [result["retryable"] for result in isolated] == [False, False]
+    assert "timed out" in isolated[0]["error_message"]
+
+
+def test_convert_batch_reuses_cached_and_duplicate_documents(tmp_path):
+    """Identical documents are converted once, later batches hit the cache."""
+    cache = LocalConversionCache(str(tmp_path / "cache"), 10**9, 3600)
+    first = tmp_path / "job1"
+    second = tmp_path / "job2"
+    for directory in (first, second):
+        directory.mkdir()
+        (directory / "a.docx").write_bytes(b"same template")
+        (directory / "b.docx").write_bytes(b"same template")
+
+    def fake_convert(paths, isolate=False, is_cancelled=None):
+        for path in paths:
+            Path(path).with_suffix(".pdf").write_bytes(b"%PDF")
+        return [
+            {"status": "success", "converted_file": str(Path(p).with_suffix(".pdf"))}
+            for p in paths
+        ]
+
+    with patch(
+        "app.services.file_conversion_and_zipping.get_conversion_cache",
+        return_value=cache,
+    ), patch(
+        "app.services.conversion_cache.converter_version", return_value="7.3"
+    ), patch(
+        "app.services.file_conversion_and_zipping.record_lookup"
+    ), patch(
+        "app.services.file_conversion_and_zipping._convert_batch_with_libreoffice",
+        side_effect=fake_convert,
+    ) as convert:
+        results = convert_docx_to_pdf_batch(
+            [str(first / "a.docx"), str(first / "b.docx")]
+        )
+        assert convert.call_args.args[0] == [str(first / "a.docx")]
+        assert (first / "b.pdf").read_bytes() == b"%PDF"
+
+        results += convert_docx_to_pdf_batch(
+            [str(second / "a.docx"), str(second / "b.docx")]
+        )
+        assert convert.call_args.args[0] == []
+
+    assert all(result["status"] == "success" for result in results)
+    assert (second / "a.pdf").read_bytes() == b"%PDF"
+
+
+def test_stream_zip_produces_valid_archive():
+    """The streamed archive is readable and written with data descriptors."""
+    members = [
+        ("a.pdf", iter([b"%PDF-1.4 ", b"first"])),
+        ("docs/b.pdf", iter([b"%PDF-1.4 second"])),
+    ]
+    chunks = list(stream_zip(members))
+    assert len(chunks) > 1
+
+    with zipfile.ZipFile(io.BytesIO(b"".join(chunks))) as archive:
+        assert archive.testzip() is None
+        assert archive.read("a.pdf") == b"%PDF-1.4 first"
+        assert archive.read("docs/b.pdf") == b"%PDF-1.4 second"
+        for info in archive.infolist():
+            assert info.compress_type == zipfile.ZIP_STORED
+            assert info.flag_bits & 0x08
+
+
+def _archive(members) -> zipfile.ZipFile:
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+        for name, data in members:
+            archive.writestr(name, data)
+    return zipfile.ZipFile(buffer)
+
+
+def test_validate_archive_skips_non_docx_members():
+    archive = _archive(
+        [
+            ("a.docx", b"PK"),
+            ("readme.txt", b"text"),
+            ("__MACOSX/._a.docx", b""),
+            ("~$a.docx", b"owner"),
+        ]
+    )
+    assert [info.filename for info in validate_archive(archive)] == ["a.docx"]
+
+
+@pytest.mark.parametrize(
+    "members",
+    [
+        [("../evil.docx", b"PK")],
+        [("/abs.docx", b"PK")],
+        # Compresses far beyond ZIP_MAX_COMPRESSION_RATIO
+        [("bomb.docx", b"\0" * (10 * 1024 * 1024))],
+    ],
+)
+def test_validate_archive_rejects_unsafe_archives(members):
+    with pytest.raises(ArchiveValidationError):
+        validate_archive(_archive(members))
+
+
+def test_validate_archive_counts_only_documents_against_the_member_limit():
+    members = [("dir/", b""), ("__MACOSX/._a.docx", b""), ("notes.txt", b"text")]
+    with patch.object(file_conversion_and_zipping, "ZIP_MAX_MEMBERS", 2):
+        assert len(validate_archive(_archive(members + [("a.docx", b"PK")]))) == 1
+        with pytest.raises(ArchiveValidationError):
+            validate_archive(
+                _archive([(f"{name}.docx", b"PK") for name in ("a", "b", "c")])
+            )
+
+
+def test_conversion_slots_are_exclusive(tmp_path):
+    with patch.object(
+        conversion_slots, "LIBREOFFICE_SLOT_DIR", str(tmp_path)
+    ), patch.object(conversion_slots, "LIBREOFFICE_SLOTS", 2):
+        with conversion_slots.conversion_slot() as first:
+            with conversion_slots.conversion_slot() as second:
+                assert first.index != second.index
+                assert first.profile_dir != second.profile_dir
+                assert first.scratch_dir != second.scratch_dir
+        assert os.path.isdir(first.profile_dir)
+
+
+def test_slot_count_follows_cpus_and_memory():
+    with patch.object(conversion_slots, "LIBREOFFICE_SLOTS", 0), patch.object(
+        conversion_slots, "available_cpus", return_value=8
+    ), patch.object(
+        conversion_slots, "available_memory", return_value=3 * 1024**3
+    ), patch.object(
+        conversion_slots, "LIBREOFFICE_SLOT_MEMORY", 1024**3
+    ):
+        assert conversion_slots.conversion_slot_count() == 3
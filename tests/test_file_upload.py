@@ -0,0 +1,145 @@
+import asyncio
+import io
+import threading
+import uuid
+from unittest.mock import patch
+
+import pytest
+from fastapi import UploadFile
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from app.database.base import Base
+from app.database.models import Job, JobStatusEnum
+from app.services import file_upload
+from benchmarks.stand_ins import FakeS3
+
+
+def _track_parts(fake_s3, fail_part=None) -> dict:
+    """
+    Count the part uploads in flight at once, and fail part `fail_part`.
+    """
+    upload_part = fake_s3.upload_part
+    lock = threading.Lock()
+    parts = {"in_flight": 0, "max_in_flight": 0}
+
+    def tracked(**kwargs):
+        with lock:
+            parts["in_flight"] += 1
+            parts["max_in_flight"] = max(parts["max_in_flight"], parts["in_flight"])
+        try:
+            if kwargs["PartNumber"] == fail_part:
+                raise RuntimeError("part upload failed")
+            return upload_part(**kwargs)
+        finally:
+            with lock:
+                parts["in_flight"] -= 1
+
+    fake_s3.upload_part = tracked
+    return parts
+
+
+def _save(fake_s3, data: bytes, part_size: int):
+    upload = UploadFile(file=io.BytesIO(data), filename="archive.zip")
+    job_id = uuid.uuid4()
+    with patch.object(file_upload, "get_s3_client", return_value=fake_s3), patch.object(
+        file_upload, "USE_S3", True
+    ), patch.object(file_upload, "S3_UPLOAD_PART_SIZE", part_size), patch.object(
+        file_upload, "S3_UPLOAD_CONCURRENCY", 2
+    ):
+        return job_id, asyncio.run(file_upload.save_file(job_id, upload))
+
+
+def test_save_file_streams_multipart_upload():
+    """Large uploads are sent as ordered parts with bounded concurrency."""
+    fake_s3 = FakeS3()
+    parts = _track_parts(fake_s3)
+    data = bytes(range(256)) * 40  # 10 KiB, 10 parts of 1 KiB
+    job_id, key = _save(fake_s3, data, part_size=1024)
+
+    assert key == f"{job_id}/archive.zip"
+    assert fake_s3.objects[key] == data
+    assert parts["max_in_flight"] <= 2
+
+
+def test_save_file_small_upload_uses_single_put():
+    fake_s3 = FakeS3()
+    job_id, key = _save(fake_s3, b"tiny", part_size=1024)
+    assert fake_s3.objects[key] == b"tiny"
+    assert fake_s3.uploads == {}
+
+
+def test_save_file_aborts_failed_multipart_upload():
+    fake_s3 = FakeS3()
+    _track_parts(fake_s3, fail_part=3)
+    with pytest.raises(RuntimeError):
+        _save(fake_s3, b"x" * 8192, part_size=1024)
+    # Aborting drops the upload with its parts
+    assert fake_s3.uploads == {}
+    assert fake_s3.objects == {}
+
+
+def _upload(tmp_path, save_file):
+    """
+    Run handle_file_upload against a SQLite database, storing the ZIP with
+    `save_file(session_factory, job_id)`. Returns the job and whether its
+    unzip was scheduled.
+    """
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'jobs.db'}")
+    session_factory = async_sessionmaker(engine, expire_on_commit=False)
+
+    async def run():
+        async with engine.begin() as connection:
+            await connection.run_sync(Base.metadata.create_all)
+        upload = UploadFile(file=io.BytesIO(b"zip"), filename="archive.zip")
+        async with session_factory() as db:
+            try:
+                job_id = await file_upload.handle_file_upload(upload, db)
+            except RuntimeError:
+                job_id = (await db.scalars(select(Job.id))).one()
+        async with session_factory() as db:
+            job = await db.get(Job, job_id)
+        await engine.dispose()
+        return job
+
+    async def store(job_id, file):
+        return await save_file(session_factory, job_id)
+
+    with patch.object(file_upload, "save_file", store), patch.object(
+        file_upload, "publish_job_events"
+    ), patch.object(
+        file_upload.unzip_and_schedule_file_conversion, "apply_async"
+    ) as apply_async:
+        job = asyncio.run(run())
+    return job, apply_async.called
+
+
+def test_job_cancelled_during_its_upload_is_not_scheduled(tmp_path):
+    async def cancel_while_saving(session_factory, job_id):
+        async with session_factory() as db:
+            await db.execute(
+                update(Job)
+                .where(Job.id == job_id)
+                .values(status=JobStatusEnum.cancelled)
+            )
+            await db.commit()
+        return "archive.zip"
+
+    job, scheduled = _upload(tmp_path, cancel_while_saving)
+
+    assert job.status == JobStatusEnum.cancelled
+    assert job.archive_path is None
+    assert not scheduled
+
+
+def test_job_whose_upload_fails_is_failed(tmp_path):
+    async def fail(session_factory, job_id):
+        raise RuntimeError("disk full")
+
+    job, scheduled = _upload(tmp_path, fail)
+
+    assert (job.status, job.error_message) == (
+        JobStatusEnum.failed,
+        "Upload failed: disk full",
+    )
+    assert not scheduled
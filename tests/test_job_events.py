@@ -0,0 +1,51 @@
+import asyncio
+from unittest.mock import patch
+
+from app.services.job_events import JobEventHub, job_events_channel
+
+
+class FakePubSub:
+    """Stand-in for a Redis pattern subscription fed from an asyncio queue."""
+
+    def __init__(self, messages: asyncio.Queue):
+        self.messages = messages
+        self.patterns = []
+
+    async def psubscribe(self, pattern):
+        self.patterns.append(pattern)
+
+    async def listen(self):
+        while True:
+            channel, data = await self.messages.get()
+            yield {"type": "pmessage", "channel": channel, "data": data}
+
+    async def aclose(self):
+        pass
+
+
+class FakeRedis:
+    def __init__(self):
+        self.messages = asyncio.Queue()
+        self.subscriptions = 0
+
+    def pubsub(self):
+        self.subscriptions += 1
+        return FakePubSub(self.messages)
+
+
+def test_hub_fans_out_events_over_one_subscription():
+    async def scenario():
+        redis = FakeRedis()
+        hub = JobEventHub()
+        with patch("app.services.job_events.get_async_redis", return_value=redis):
+            async with hub.subscribe("job-1") as first, hub.subscribe(
+                "job-1"
+            ) as second, hub.subscribe("job-2") as other:
+                await redis.messages.put((job_events_channel("job-1"), "done"))
+                assert await asyncio.wait_for(first.get(), 1) == "done"
+                assert await asyncio.wait_for(second.get(), 1) == "done"
+                assert other.empty()
+        hub._listener.cancel()
+        return redis.subscriptions
+
+    assert asyncio.run(scenario()) == 1
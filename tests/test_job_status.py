@@ -0,0 +1,116 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import patch
+
+from app.database.models import FileConversion, Job, JobStatusEnum
+from app.services import job_status
+
+
+def _job(session_factory) -> str:
+    session = session_factory()
+    job = Job(status=JobStatusEnum.pending)
+    session.add(job)
+    session.commit()
+    job_id = job.id
+    session.close()
+    return job_id
+
+
+def _set_status(session_factory, job_id, status: JobStatusEnum):
+    session = session_factory()
+    session.get(Job, job_id).status = status
+    session.commit()
+    session.close()
+
+
+def test_matching_etag_is_answered_with_304(client):
+    test_client, session_factory = client
+    job_id = _job(session_factory)
+
+    response = test_client.get(f"/api/v1/jobs/{job_id}")
+    etag = response.headers["etag"]
+    again = test_client.get(f"/api/v1/jobs/{job_id}", headers={"If-None-Match": etag})
+
+    assert response.status_code == 200
+    assert again.status_code == 304
+    assert again.headers["etag"] == etag
+
+
+def test_cached_status_is_replaced_once_events_are_published(client):
+    test_client, session_factory = client
+    job_id = _job(session_factory)
+    assert test_client.get(f"/api/v1/jobs/{job_id}").json()["status"] == "pending"
+
+    _set_status(session_factory, job_id, JobStatusEnum.in_progress)
+    # Served from the cache until a worker publishes the change
+    assert test_client.get(f"/api/v1/jobs/{job_id}").json()["status"] == "pending"
+    job_status.publish_job_events(job_id, [])
+
+    assert test_client.get(f"/api/v1/jobs/{job_id}").json()["status"] == "in_progress"
+
+
+def test_cached_status_does_not_outlive_its_version(client):
+    test_client, session_factory = client
+    job_id = _job(session_factory)
+    with patch.object(job_status, "JOB_STATUS_CACHE_TTL", 1):
+        job_status.publish_job_events(job_id, [])
+        assert test_client.get(f"/api/v1/jobs/{job_id}").json()["status"] == "pending"
+        time.sleep(1.1)
+        # The version counter starts over once its key expired
+        _set_status(session_factory, job_id, JobStatusEnum.in_progress)
+        job_status.publish_job_events(job_id, [])
+
+        response = test_client.get(f"/api/v1/jobs/{job_id}")
+
+    assert response.json()["status"] == "in_progress"
+
+
+def test_long_poll_returns_as_soon_as_the_job_changes(client):
+    test_client, session_factory = client
+    job_id = _job(session_factory)
+    etag = test_client.get(f"/api/v1/jobs/{job_id}").headers["etag"]
+
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        start = time.monotonic()
+        poll = pool.submit(
+            test_client.get,
+            f"/api/v1/jobs/{job_id}?wait=10",
+            headers={"If-None-Match": etag},
+        )
+        time.sleep(0.5)
+        _set_status(session_factory, job_id, JobStatusEnum.completed)
+        job_status.publish_job_events(job_id, [{"type": "job", "status": "completed"}])
+        response = poll.result(timeout=10)
+
+    assert time.monotonic() - start < 5
+    assert response.status_code == 200
+    assert response.json()["status"] == "completed"
+    assert response.headers["etag"] != etag
+
+
+def test_status_counts_files_and_lists_them_only_on_request(client):
+    test_client, session_factory = client
+    session = session_factory()
+    job = Job(status=JobStatusEnum.in_progress, total_files=2, completed_files=1)
+    session.add(job)
+    session.flush()
+    session.add_all(
+        FileConversion(job_id=job.id, file_name=name, status=status)
+        for name, status in (
+            ("a.docx", JobStatusEnum.completed),
+            ("b.docx", JobStatusEnum.pending),
+        )
+    )
+    session.commit()
+    job_id = job.id
+    session.close()
+
+    counted = test_client.get(f"/api/v1/jobs/{job_id}").json()
+    listed = test_client.get(f"/api/v1/jobs/{job_id}?files=true").json()
+
+    assert "files" not in counted
+    assert (counted["total_files"], counted["completed_files"]) == (2, 1)
+    assert counted["files_url"].endswith(f"/api/v1/jobs/{job_id}/files")
+    assert [file["file_name"] for file in listed["files"]] == ["a.docx", "b.docx"]
+    # Each variant is cached on its own
+    assert "files" not in test_client.get(f"/api/v1/jobs/{job_id}").json()
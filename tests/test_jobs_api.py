@@ -1,42 +1,360 @@
-from fastapi.testclient import TestClient
-from app.main import app
-import tempfile
+import base64
+import io
+import json
+import uuid
+import zipfile
+from datetime import datetime, timedelta
 from unittest.mock import MagicMock, patch
-from app.database.models import Job
-
-client = TestClient(app)
-
-
-def test_upload_files(monkeypatch):
-    """Test the file upload endpoint with multiple files."""
-    with patch(
-        "app.services.file_upload.process_file_conversion"
-    ) as mock_process_file_conversion:
-        mock_process_file_conversion.return_value = None
-        with tempfile.TemporaryDirectory() as tmpdir:
-            monkeypatch.setenv("UPLOAD_DIR", tmpdir)
-            files = [
-                (
-                    "files",
-                    (
-                        "test1.docx",
-                        b"Dummy content",
-                    ),
-                ),
-                (
-                    "files",
-                    (
-                        "test2.docx",
-                        b"More content",
-                    ),
-                ),
-            ]
-            response = client.post("/api/v1/jobs", files=files)
-            assert response.status_code == 202
-            assert "job_id" in response.json()
-
-
-def test_upload_no_files():
+
+from botocore.exceptions import ClientError
+from botocore.response import StreamingBody
+
+from app.database.models import FileConversion, Job, JobStatusEnum
+from app.api.v1 import jobs
+from app.services import direct_upload, file_download, file_upload, job_cancellation
+
+
+def _zip_bytes() -> bytes:
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w") as archive:
+        archive.writestr("test1.docx", b"Dummy content")
+        archive.writestr("test2.docx", b"More content")
+    return buffer.getvalue()
+
+
+def test_upload_files(client):
+    """Test the upload endpoint stores the ZIP and schedules unzipping."""
+    test_client, session_factory = client
+    archive = _zip_bytes()
+    with patch.object(
+        file_upload, "unzip_and_schedule_file_conversion"
+    ) as unzip_and_schedule:
+        response = test_client.post(
+            "/api/v1/jobs/",
+            files={"file": ("docs.zip", archive, "application/zip")},
+        )
+
+    assert response.status_code == 202
+    job_id = response.json()["job_id"]
+    call = unzip_and_schedule.apply_async.call_args
+    zip_path, scheduled_job_id = call.args[0]
+    assert str(scheduled_job_id) == job_id
+    assert call.kwargs == {"queue": "file_conversion_queue"}
+    with open(zip_path, "rb") as f:
+        assert f.read() == archive
+
+    session = session_factory()
+    job = session.query(Job).one()
+    assert str(job.id) == job_id
+    assert job.status == JobStatusEnum.pending
+    session.close()
+
+
+def test_upload_no_files(client):
     """Test the file upload endpoint with no files."""
-    response = client.post("/api/v1/jobs", files=[])
+    test_client, _ = client
+    response = test_client.post("/api/v1/jobs/", files=[])
     assert response.status_code == 422
+
+
+def _running_job(session_factory, tmp_path):
+    """A job with one converted and one pending file."""
+    pdf_path = tmp_path / "a.pdf"
+    pdf_path.write_bytes(b"%PDF-1.4 a")
+    session = session_factory()
+    job = Job(status=JobStatusEnum.in_progress, total_files=2)
+    session.add(job)
+    session.flush()
+    done = FileConversion(
+        job_id=job.id,
+        file_name="docs/a.docx",
+        output_file_path=str(pdf_path),
+        status=JobStatusEnum.completed,
+    )
+    pending = FileConversion(
+        job_id=job.id, file_name="b.docx", status=JobStatusEnum.pending
+    )
+    session.add_all([done, pending])
+    session.commit()
+    ids = job.id, done.id, pending.id
+    session.close()
+    return ids
+
+
+def test_converted_file_is_downloadable_before_the_job_completes(client, tmp_path):
+    test_client, session_factory = client
+    job_id, done_id, pending_id = _running_job(session_factory, tmp_path)
+
+    response = test_client.get(f"/api/v1/jobs/{job_id}/files/{done_id}/download")
+    assert response.status_code == 200
+    assert response.content == b"%PDF-1.4 a"
+    assert 'filename="a.pdf"' in response.headers["content-disposition"]
+
+    response = test_client.get(f"/api/v1/jobs/{job_id}/files/{pending_id}/download")
+    assert response.status_code == 409
+    other_job = uuid.uuid4()
+    response = test_client.get(f"/api/v1/jobs/{other_job}/files/{done_id}/download")
+    assert response.status_code == 404
+
+
+def test_bucket_notification_starts_only_jobs_whose_zip_exists(client):
+    test_client, session_factory = client
+    session = session_factory()
+    jobs_by_name = {
+        name: Job(status=JobStatusEnum.uploading) for name in ("uploaded", "forged")
+    }
+    session.add_all(jobs_by_name.values())
+    session.commit()
+    job_ids = {name: job.id for name, job in jobs_by_name.items()}
+    session.close()
+    event = {
+        "Records": [
+            {
+                "eventName": "ObjectCreated:Put",
+                "s3": {
+                    "bucket": {"name": direct_upload.S3_BUCKET_NAME},
+                    "object": {"key": f"{job_id}/upload.zip"},
+                },
+            }
+            for job_id in job_ids.values()
+        ]
+    }
+
+    def head_object(Bucket, Key):
+        if not Key.startswith(str(job_ids["uploaded"])):
+            raise ClientError({"Error": {"Code": "404"}}, "HeadObject")
+        return {"ContentLength": 100}
+
+    s3 = MagicMock(head_object=head_object)
+    url = "/api/v1/jobs/uploads/notifications"
+
+    with patch.object(jobs, "S3_NOTIFICATION_TOKEN", None):
+        assert test_client.post(url, json=event).status_code == 403
+    with patch.object(jobs, "S3_NOTIFICATION_TOKEN", "secret"), patch.object(
+        direct_upload, "get_s3_client", return_value=s3
+    ), patch.object(direct_upload, "unzip_and_schedule_file_conversion") as unzip:
+        assert test_client.post(url, json=event).status_code == 401
+        response = test_client.post(
+            url, json=event, headers={"Authorization": "Bearer secret"}
+        )
+
+    assert response.status_code == 204
+    unzip.apply_async.assert_called_once()
+    session = session_factory()
+    assert session.get(Job, job_ids["uploaded"]).status == JobStatusEnum.pending
+    assert session.get(Job, job_ids["forged"]).status == JobStatusEnum.uploading
+    session.close()
+
+
+def test_cancel_revokes_unfinished_files_and_keeps_converted_ones(client, tmp_path):
+    test_client, session_factory = client
+    job_id, done_id, pending_id = _running_job(session_factory, tmp_path)
+    with patch.object(job_cancellation, "publish_job_events"), patch.object(
+        job_cancellation.celery_app.control, "revoke"
+    ) as revoke:
+        response = test_client.delete(f"/api/v1/jobs/{job_id}")
+        again = test_client.delete(f"/api/v1/jobs/{job_id}")
+        missing = test_client.delete(f"/api/v1/jobs/{uuid.uuid4()}")
+
+    assert response.status_code == 202
+    assert again.status_code == 202
+    assert missing.status_code == 404
+    revoke.assert_called_once_with([str(pending_id)])
+    assert job_cancellation.is_job_cancelled(job_id)
+    session = session_factory()
+    assert session.get(Job, job_id).status == JobStatusEnum.cancelled
+    assert session.get(FileConversion, done_id).status == JobStatusEnum.completed
+    assert session.get(FileConversion, pending_id).status == JobStatusEnum.cancelled
+    session.close()
+
+    response = test_client.get(f"/api/v1/jobs/{job_id}/files/{done_id}/download")
+    assert response.status_code == 200
+
+
+def test_finished_job_cannot_be_cancelled(client):
+    test_client, session_factory = client
+    session = session_factory()
+    job = Job(status=JobStatusEnum.completed, total_files=0)
+    session.add(job)
+    session.commit()
+    job_id = job.id
+    session.close()
+
+    with patch.object(job_cancellation, "_stop_queued_work") as stop:
+        response = test_client.delete(f"/api/v1/jobs/{job_id}")
+
+    assert response.status_code == 409
+    stop.assert_not_called()
+
+
+def _raw_cursor(values) -> str:
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode()
+
+
+def _pages(test_client, url: str, **params) -> list:
+    pages = []
+    while True:
+        response = test_client.get(url, params=params)
+        assert response.status_code == 200
+        pages.append(response.json())
+        if "next_cursor" not in pages[-1]:
+            return pages
+        params["cursor"] = pages[-1]["next_cursor"]
+
+
+def test_jobs_are_listed_newest_first_a_page_at_a_time(client):
+    test_client, session_factory = client
+    now = datetime.now()
+    session = session_factory()
+    jobs = [
+        Job(
+            status=JobStatusEnum.failed if hours == 3 else JobStatusEnum.completed,
+            # Two jobs created at the same time are told apart by id
+            created_at=now - timedelta(hours=min(hours, 4)),
+        )
+        for hours in range(6)
+    ]
+    session.add_all(jobs)
+    session.commit()
+    expected = [
+        str(job.id)
+        for job in sorted(jobs, key=lambda job: (job.created_at, job.id), reverse=True)
+    ]
+    session.close()
+
+    pages = _pages(test_client, "/api/v1/jobs/", limit=2)
+    assert [len(page["jobs"]) for page in pages] == [2, 2, 2]
+    assert [job["job_id"] for page in pages for job in page["jobs"]] == expected
+
+    (page,) = _pages(
+        test_client,
+        "/api/v1/jobs/",
+        status="completed",
+        created_after=(now - timedelta(hours=3, minutes=30)).isoformat(),
+    )
+    assert [job["job_id"] for job in page["jobs"]] == expected[:3]
+    assert page["jobs"][0]["total_files"] == 0
+
+    for cursor in ("garbage", _raw_cursor([1, 2]), _raw_cursor(["x", "y"])):
+        response = test_client.get("/api/v1/jobs/", params={"cursor": cursor})
+        assert response.status_code == 400
+    response = test_client.get(
+        f"/api/v1/jobs/{jobs[0].id}/files", params={"cursor": _raw_cursor([1, 2])}
+    )
+    assert response.status_code == 400
+
+
+def test_files_of_a_job_are_listed_a_page_at_a_time(client, tmp_path):
+    test_client, session_factory = client
+    job_id, done_id, pending_id = _running_job(session_factory, tmp_path)
+    url = f"/api/v1/jobs/{job_id}/files"
+
+    pages = _pages(test_client, url, limit=1)
+    files = [file for page in pages for file in page["files"]]
+    assert [file["file_id"] for file in files] == [str(pending_id), str(done_id)]
+    assert files[1]["download_url"].endswith(f"/files/{done_id}/download")
+
+    (page,) = _pages(test_client, url, status="pending")
+    assert [file["file_name"] for file in page["files"]] == ["b.docx"]
+    assert test_client.get(f"/api/v1/jobs/{uuid.uuid4()}/files").status_code == 404
+
+
+def test_partial_zip_holds_the_files_converted_so_far(client, tmp_path):
+    test_client, session_factory = client
+    job_id, _, _ = _running_job(session_factory, tmp_path)
+
+    assert test_client.get(f"/api/v1/jobs/{job_id}/download").status_code == 404
+    response = test_client.get(f"/api/v1/jobs/{job_id}/download?partial=true")
+
+    assert response.status_code == 200
+    assert response.headers["x-files-included"] == "1"
+    assert response.headers["x-files-total"] == "2"
+    with zipfile.ZipFile(io.BytesIO(response.content)) as archive:
+        assert archive.namelist() == ["docs/a.pdf"]
+        assert archive.read("docs/a.pdf") == b"%PDF-1.4 a"
+
+    with patch.object(jobs, "stream_converted_files") as stream:
+        response = test_client.head(f"/api/v1/jobs/{job_id}/download?partial=true")
+    assert response.status_code == 200
+    assert response.headers["x-files-included"] == "1"
+    stream.assert_not_called()
+
+
+class RangeS3:
+    """S3 stand-in answering ranged GetObject calls for one object."""
+
+    def __init__(self, data: bytes, etag: str = '"v1"'):
+        self.data, self.etag, self.calls = data, etag, []
+
+    def get_object(self, Bucket, Key, Range=None, IfMatch=None, **kwargs):
+        self.calls.append({"Range": Range, "IfMatch": IfMatch})
+        if IfMatch and IfMatch != self.etag:
+            raise ClientError({"Error": {"Code": "PreconditionFailed"}}, "GetObject")
+        response = {"ETag": self.etag, "ContentLength": len(self.data)}
+        body = self.data
+        if Range:
+            start, end = Range[len("bytes=") :].split("-")
+            end = int(end) if end else len(self.data) - 1
+            body = self.data[int(start) : end + 1]
+            response["ContentLength"] = len(body)
+            response["ContentRange"] = f"bytes {start}-{end}/{len(self.data)}"
+        response["Body"] = StreamingBody(io.BytesIO(body), len(body))
+        return response
+
+
+def test_local_zip_download_resumes_with_range(client, tmp_path):
+    test_client, _ = client
+    job_id = uuid.uuid4()
+    upload_dir = tmp_path / "uploads"
+    (upload_dir / str(job_id)).mkdir(parents=True)
+    (upload_dir / str(job_id) / f"{job_id}.zip").write_bytes(b"0123456789abcdef")
+
+    with patch.object(jobs, "UPLOAD_DIR", str(upload_dir)), patch.object(
+        file_download, "UPLOAD_DIR", str(upload_dir)
+    ):
+        full = test_client.get(f"/api/v1/jobs/{job_id}/download")
+        etag = full.headers["etag"]
+        resumed = test_client.get(
+            f"/api/v1/jobs/{job_id}/download",
+            headers={"Range": "bytes=10-", "If-Range": etag},
+        )
+        changed = test_client.get(
+            f"/api/v1/jobs/{job_id}/download",
+            headers={"Range": "bytes=10-", "If-Range": '"other"'},
+        )
+
+    assert full.headers["content-length"] == "16"
+    assert resumed.status_code == 206
+    assert resumed.content == b"abcdef"
+    assert resumed.headers["content-range"] == "bytes 10-15/16"
+    assert changed.status_code == 200
+    assert changed.content == b"0123456789abcdef"
+
+
+def test_s3_zip_download_passes_ranges_through(client):
+    test_client, _ = client
+    job_id = uuid.uuid4()
+    s3 = RangeS3(b"0123456789abcdef")
+
+    with patch.object(jobs, "USE_S3", True), patch.object(
+        file_download, "get_s3_client", return_value=s3
+    ):
+        resumed = test_client.get(
+            f"/api/v1/jobs/{job_id}/download",
+            headers={"Range": "bytes=10-", "If-Range": '"v1"'},
+        )
+        changed = test_client.get(
+            f"/api/v1/jobs/{job_id}/download",
+            headers={"Range": "bytes=10-", "If-Range": '"v0"'},
+        )
+
+    assert resumed.status_code == 206
+    assert resumed.content == b"abcdef"
+    assert resumed.headers["content-range"] == "bytes 10-15/16"
+    assert resumed.headers["content-length"] == "6"
+    assert resumed.headers["etag"] == '"v1"'
+    assert s3.calls[0] == {"Range": "bytes=10-", "IfMatch": '"v1"'}
+    # A changed object fails the precondition and is sent whole
+    assert changed.status_code == 200
+    assert changed.content == b"0123456789abcdef"
+    assert s3.calls[-1] == {"Range": None, "IfMatch": None}
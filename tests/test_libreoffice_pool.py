@@ -0,0 +1,123 @@
+import os
+import threading
+import time
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from app.services import libreoffice_pool
+from app.services.libreoffice_pool import (
+    TEMP_PREFIX,
+    LibreOfficeInstance,
+    LibreOfficePool,
+)
+
+
+class _Process:
+    pid = 0
+
+    def poll(self):
+        return None
+
+    def wait(self, timeout=None):
+        return 0
+
+
+@pytest.fixture
+def office(tmp_path):
+    """
+    Pool instances backed by a stubbed UNO desktop instead of soffice.
+    Yields the indexes of the started instances and, per converted
+    document, the index of the instance that opened it.
+    """
+    started, opened = [], []
+
+    def connect(instance):
+        desktop = MagicMock()
+
+        def load(url, *args):
+            opened.append((instance.index, url))
+            if "corrupt" in url:
+                return None
+            if "slow" in url:
+                release.wait(5)
+            return MagicMock()
+
+        desktop.loadComponentFromURL.side_effect = load
+        started.append(instance.index)
+        return desktop
+
+    release = threading.Event()
+    with patch.object(libreoffice_pool, "uno", MagicMock()) as uno, patch.object(
+        libreoffice_pool, "_properties", lambda **kwargs: kwargs
+    ), patch.object(
+        libreoffice_pool.subprocess, "Popen", side_effect=lambda *a, **k: _Process()
+    ), patch.object(
+        LibreOfficeInstance, "_connect", connect
+    ), patch.object(
+        libreoffice_pool.tempfile, "tempdir", str(tmp_path)
+    ):
+        uno.systemPathToFileUrl.side_effect = lambda path: os.path.basename(path)
+        yield started, opened, release
+
+
+def test_conversions_are_routed_to_idle_instances(office):
+    started, opened, release = office
+    pool = LibreOfficePool(2, max_conversions=10)
+    slow = threading.Thread(target=pool.convert, args=("slow.docx", "slow.pdf"))
+    slow.start()
+    while not opened:
+        time.sleep(0.01)
+
+    pool.convert("a.docx", "a.pdf")
+    release.set()
+    slow.join()
+    pool.convert("b.docx", "b.pdf")
+    pool.close()
+
+    busy = {url: index for index, url in opened}
+    assert busy["a.docx"] != busy["slow.docx"]
+    # Both instances are started once and reused
+    assert sorted(started) == [0, 1]
+
+
+def test_instances_are_recycled_after_max_conversions(office):
+    started, opened, _ = office
+    pool = LibreOfficePool(1, max_conversions=2)
+    for name in ("a", "b", "c"):
+        pool.convert(f"{name}.docx", f"{name}.pdf")
+    pool.close()
+
+    assert started == [0, 0]
+    assert len(opened) == 3
+
+
+def test_instance_is_restarted_after_a_failed_conversion(office):
+    started, _, _ = office
+    pool = LibreOfficePool(1, max_conversions=10)
+    pool.convert("a.docx", "a.pdf")
+    with pytest.raises(ValueError):
+        pool.convert("corrupt.docx", "corrupt.pdf")
+    pool.convert("b.docx", "b.pdf")
+    pool.close()
+
+    assert started == [0, 0]
+
+
+def test_profiles_are_worker_temp_dirs_kept_while_in_use(office):
+    started, _, _ = office
+    pool = LibreOfficePool(1, max_conversions=10)
+    (instance,) = pool._instances
+    assert os.path.basename(instance.profile_dir).startswith(TEMP_PREFIX)
+    pool.convert("a.docx", "a.pdf")
+    os.utime(instance.profile_dir, (0, 0))
+
+    pool.convert("b.docx", "b.pdf")
+    assert os.stat(instance.profile_dir).st_mtime > 0
+
+    # Removed by the retention sweep while idle: restarted on a new profile
+    os.rmdir(instance.profile_dir)
+    pool.convert("c.docx", "c.pdf")
+    assert os.path.isdir(instance.profile_dir)
+    assert started == [0, 0]
+    pool.close()
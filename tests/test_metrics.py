@@ -0,0 +1,100 @@
+import time
+import uuid
+from types import SimpleNamespace
+from unittest.mock import patch
+
+import fakeredis
+from fastapi.testclient import TestClient
+from prometheus_client import REGISTRY
+from sqlalchemy import create_engine, text
+
+from app import celery as celery_module
+from app import metrics, redis_client
+from app.database.models import FileConversion
+from app.main import app
+from app.tasks import _mark_failed, _save_conversion_result
+
+
+def _sample(name: str, **labels) -> float:
+    return REGISTRY.get_sample_value(name, labels) or 0.0
+
+
+def test_metrics_endpoint_exports_queue_depths_and_request_latency():
+    fake = fakeredis.FakeRedis(decode_responses=True)
+    fake.rpush("libre_queue", "a", "b")
+    fake.rpush("libre_queue\x06\x166", "c")
+    with patch.object(redis_client, "_client", fake), TestClient(app) as client:
+        client.get("/")
+        response = client.get("/metrics")
+
+    assert response.status_code == 200
+    assert 'celery_queue_depth{queue="libre_queue"} 3.0' in response.text
+    assert 'celery_queue_depth{queue="zip_queue"} 0.0' in response.text
+    assert 'http_request_seconds_count{method="GET",route="/",status="200"}' in (
+        response.text
+    )
+
+
+def test_conversion_outcomes_are_counted_by_error_class():
+    file_conversion = FileConversion(id=uuid.uuid4(), job_id=uuid.uuid4())
+    success = _sample("file_conversions_total", status="success", error_class="")
+    failed = _sample("file_conversions_total", status="failed", error_class="upload")
+    converter_failed = _sample(
+        "file_conversions_total", status="failed", error_class="conversion"
+    )
+
+    with patch("app.tasks.USE_S3", False):
+        _save_conversion_result(
+            file_conversion, {"status": "success", "converted_file": "a.pdf"}
+        )
+        _save_conversion_result(
+            file_conversion, {"status": "error", "error_message": "crashed"}
+        )
+    _mark_failed(file_conversion, "Upload failed: timeout", "upload")
+
+    assert _sample("file_conversions_total", status="success", error_class="") == (
+        success + 1
+    )
+    assert _sample(
+        "file_conversions_total", status="failed", error_class="conversion"
+    ) == (converter_failed + 1)
+    assert _sample("file_conversions_total", status="failed", error_class="upload") == (
+        failed + 1
+    )
+
+
+def test_task_wait_is_measured_from_the_publish_time():
+    headers = {}
+    celery_module.stamp_task_headers(headers=headers)
+    headers["published_at"] -= 2
+    task = SimpleNamespace(
+        name="app.tasks.zip_converted_files",
+        request=SimpleNamespace(
+            get=headers.get, delivery_info={"routing_key": "zip_queue"}
+        ),
+    )
+    labels = {"task": "app.tasks.zip_converted_files", "queue": "zip_queue"}
+    before = _sample("celery_task_wait_seconds_sum", **labels)
+
+    celery_module.observe_task_wait(task=task)
+
+    waited = _sample("celery_task_wait_seconds_sum", **labels) - before
+    assert 2 <= waited < 2 + 5
+
+
+def test_database_statements_are_timed():
+    engine = create_engine("sqlite://")
+    metrics.instrument_engine(engine)
+    before = _sample("db_query_seconds_count", operation="SELECT")
+
+    with engine.connect() as connection:
+        connection.execute(text("SELECT 1"))
+
+    assert _sample("db_query_seconds_count", operation="SELECT") == before + 1
+
+
+def test_stage_timer_records_duration():
+    before = _sample("conversion_stage_seconds_sum", stage="zip")
+    with metrics.stage_timer("zip"):
+        time.sleep(0.01)
+    assert _sample("conversion_stage_seconds_sum", stage="zip") - before >= 0.01
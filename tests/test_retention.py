@@ -0,0 +1,211 @@
+import os
+import time
+from datetime import datetime, timedelta
+from unittest.mock import MagicMock, patch
+
+import fakeredis
+import pytest
+from sqlalchemy import create_engine, update
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from app import redis_client
+from app.database.base import Base
+from app.database.models import FileConversion, Job, JobStatusEnum
+from app.services import conversion_cache, retention
+from benchmarks.stand_ins import FakeS3
+
+
+@pytest.fixture
+def session(tmp_path):
+    engine = create_engine(
+        "sqlite://",
+        connect_args={"check_same_thread": False},
+        poolclass=StaticPool,
+    )
+    Base.metadata.create_all(engine)
+    session = sessionmaker(autoflush=False, bind=engine)()
+    with patch.object(
+        redis_client, "_client", fakeredis.FakeRedis(decode_responses=True)
+    ), patch.object(retention, "USE_S3", False), patch.object(
+        retention, "UPLOAD_DIR", str(tmp_path)
+    ), patch.object(
+        retention, "RETENTION_INPUTS_TTL", 3600
+    ), patch.object(
+        retention, "RETENTION_OUTPUTS_TTL", 3 * 3600
+    ), patch.object(
+        retention, "RETENTION_JOBS_TTL", 5 * 3600
+    ), patch.object(
+        retention, "RETENTION_BATCH_SIZE", 1
+    ):
+        yield session
+    session.close()
+
+
+def _job(session, tmp_path, hours_old: float, status=JobStatusEnum.completed):
+    created_at = datetime.now() - timedelta(hours=hours_old)
+    job = Job(
+        status=status,
+        created_at=created_at,
+        updated_at=created_at,
+        download_url="http://localhost/download",
+    )
+    session.add(job)
+    session.flush()
+    session.add_all(
+        FileConversion(job_id=job.id, file_name=f"docs/{name}.docx")
+        for name in ("a", "b")
+    )
+    session.commit()
+    job_dir = tmp_path / str(job.id)
+    (job_dir / "docs").mkdir(parents=True)
+    for name in ("upload.zip", "docs/a.docx", "docs/a.pdf", f"{job.id}.zip"):
+        (job_dir / name).write_bytes(b"data")
+    return job.id
+
+
+def _files(tmp_path, job_id) -> set:
+    job_dir = tmp_path / str(job_id)
+    return {
+        str(path.relative_to(job_dir)) for path in job_dir.rglob("*") if path.is_file()
+    }
+
+
+def test_sweep_expires_each_artifact_after_its_ttl(session, tmp_path):
+    fresh = _job(session, tmp_path, 0.5)
+    inputs_expired = _job(session, tmp_path, 2)
+    outputs_expired = _job(session, tmp_path, 4)
+    expired = _job(session, tmp_path, 6)
+    running = _job(session, tmp_path, 6, status=JobStatusEnum.in_progress)
+
+    removed = retention.collect_garbage(session)
+
+    assert _files(tmp_path, fresh) == {
+        "upload.zip",
+        "docs/a.docx",
+        "docs/a.pdf",
+        f"{fresh}.zip",
+    }
+    assert _files(tmp_path, inputs_expired) == {"docs/a.pdf", f"{inputs_expired}.zip"}
+    assert not (tmp_path / str(outputs_expired)).exists()
+    assert not (tmp_path / str(expired)).exists()
+    assert len(_files(tmp_path, running)) == 4
+    assert session.get(Job, outputs_expired).download_url is None
+    assert session.get(Job, inputs_expired).download_url is not None
+    assert session.get(Job, expired) is None
+    assert session.query(FileConversion).filter_by(job_id=expired).count() == 0
+    assert session.get(Job, running) is not None
+    assert removed["jobs"] == 1
+
+    # Jobs whose files were removed are not visited again
+    with patch.object(retention, "delete_job_files") as delete_job_files:
+        retention.collect_garbage(session)
+    delete_job_files.assert_not_called()
+
+
+def test_job_finishing_after_a_sweep_expires_by_its_finish_time(session, tmp_path):
+    running = _job(session, tmp_path, 4, status=JobStatusEnum.in_progress)
+    retention.collect_garbage(session)
+    assert len(_files(tmp_path, running)) == 4
+
+    session.execute(
+        update(Job)
+        .where(Job.id == running)
+        .values(
+            status=JobStatusEnum.completed,
+            updated_at=datetime.now() - timedelta(hours=2),
+        )
+    )
+    session.commit()
+    retention.collect_garbage(session)
+
+    assert _files(tmp_path, running) == {"docs/a.pdf", f"{running}.zip"}
+    assert session.get(Job, running).download_url is not None
+
+
+def test_multipart_uploads_of_abandoned_uploads_are_aborted(session, tmp_path):
+    abandoned = _job(session, tmp_path, 6, status=JobStatusEnum.uploading)
+    uploads, objects = MagicMock(), MagicMock()
+    uploads.paginate.return_value = [
+        {"Uploads": [{"Key": f"{abandoned}/upload.zip", "UploadId": "u1"}]}
+    ]
+    objects.paginate.return_value = [{}]
+    s3 = MagicMock()
+    s3.get_paginator.side_effect = {
+        "list_multipart_uploads": uploads,
+        "list_objects_v2": objects,
+    }.get
+    s3.delete_objects.return_value = {}
+    with patch.object(retention, "USE_S3", True), patch.object(
+        retention, "get_s3_client", return_value=s3
+    ):
+        assert retention.delete_expired_jobs(session) == 1
+
+    s3.abort_multipart_upload.assert_called_once_with(
+        Bucket=retention.S3_BUCKET_NAME, Key=f"{abandoned}/upload.zip", UploadId="u1"
+    )
+
+
+def test_s3_objects_are_deleted_in_batches(session):
+    s3 = MagicMock()
+    s3.get_paginator.return_value.paginate.return_value = [
+        {"Contents": [{"Key": "job/upload.zip"}, {"Key": "job/docs/a.docx"}]},
+        {"Contents": [{"Key": "job/docs/b.docx"}, {"Key": "job/converted/a.pdf"}]},
+        {"Contents": [{"Key": "job/job.zip"}]},
+    ]
+    s3.delete_objects.return_value = {}
+    with patch.object(retention, "USE_S3", True), patch.object(
+        retention, "S3_DELETE_BATCH", 2
+    ), patch.object(retention, "get_s3_client", return_value=s3):
+        removed = retention.delete_job_files(["job"], keep_outputs=True)
+
+    assert removed == 3
+    deleted = [
+        [item["Key"] for item in call.kwargs["Delete"]["Objects"]]
+        for call in s3.delete_objects.call_args_list
+    ]
+    assert deleted == [["job/upload.zip", "job/docs/a.docx"], ["job/docs/b.docx"]]
+
+
+def test_only_stale_worker_temp_files_are_removed(tmp_path):
+    stale = tmp_path / f"{retention.TEMP_PREFIX}abc.docx"
+    stale_dir = tmp_path / f"{retention.TEMP_PREFIX}dir"
+    fresh = tmp_path / f"{retention.TEMP_PREFIX}def.docx"
+    other = tmp_path / "tmp123.docx"
+    stale_dir.mkdir()
+    for path in (stale, fresh, other, stale_dir / "a.docx"):
+        path.write_bytes(b"data")
+    day_ago = time.time() - 2 * 24 * 3600
+    for path in (stale, stale_dir, other):
+        os.utime(path, (day_ago, day_ago))
+
+    assert retention.remove_stale_temp_files(str(tmp_path)) == 2
+    assert sorted(os.listdir(tmp_path)) == sorted([fresh.name, other.name])
+
+
+def test_s3_conversion_cache_is_evicted_by_the_sweep(session, tmp_path):
+    s3 = FakeS3()
+    cache = conversion_cache.S3ConversionCache("cache", max_bytes=8, ttl=3600)
+    pdf = tmp_path / "a.pdf"
+    pdf.write_bytes(b"%PDF")
+    with patch.object(conversion_cache, "get_s3_client", return_value=s3), patch.object(
+        retention, "get_conversion_cache", return_value=cache
+    ), patch.object(s3, "copy_object", wraps=s3.copy_object) as copy_object:
+        for key in ("aa1", "bb2", "cc3"):
+            cache.put(key, str(pdf))
+            s3.modified[cache._key(key)] -= timedelta(minutes=30)
+        # Put never lists the prefix, the sweep evicts above max_bytes
+        assert len(s3.objects) == 3
+
+        assert cache.get("bb2", str(tmp_path / "hit.pdf"))
+        assert cache.get("bb2", str(tmp_path / "hit.pdf"))
+        # The access time is only rewritten once it is 10% of the TTL old
+        assert copy_object.call_count == 1
+        assert (tmp_path / "hit.pdf").read_bytes() == b"%PDF"
+        # Downloaded next to the destination and renamed into place
+        assert sorted(os.listdir(tmp_path)) == ["a.pdf", "hit.pdf"]
+
+        removed = retention.collect_garbage(session)
+
+    assert removed["conversion_cache"] == 1
+    assert sorted(s3.objects) == [cache._key("bb2"), cache._key("cc3")]
@@ -0,0 +1,604 @@
+import io
+import zipfile
+from datetime import datetime, timedelta
+from unittest.mock import patch
+
+import pytest
+from botocore.exceptions import ClientError
+from sqlalchemy import create_engine, update
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from app import tasks
+from app.database.base import Base
+from app.database.models import FileConversion, Job, JobStatusEnum
+
+
+@pytest.fixture
+def session_factory():
+    engine = create_engine(
+        "sqlite://",
+        connect_args={"check_same_thread": False},
+        poolclass=StaticPool,
+    )
+    Base.metadata.create_all(engine)
+    factory = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    with patch.object(tasks, "SessionLocal", factory):
+        yield factory
+
+
+def _create_job(factory, file_count: int):
+    session = factory()
+    job = Job(total_files=file_count)
+    session.add(job)
+    files = [
+        FileConversion(job=job, file_name=f"doc{i}.docx", output_file_path=f"doc{i}")
+        for i in range(file_count)
+    ]
+    session.add_all(files)
+    session.commit()
+    ids = job.id, [fc.id for fc in files]
+    session.close()
+    return ids
+
+
+def test_zip_is_scheduled_once_when_last_file_finishes(session_factory):
+    job_id, file_ids = _create_job(session_factory, 3)
+    results = iter(
+        [
+            {"status": "success", "converted_file": "doc0.pdf"},
+            {"status": "error", "error_message": "corrupt"},
+            {"status": "success", "converted_file": "doc2.pdf"},
+        ]
+    )
+    with patch.object(tasks, "USE_S3", False), patch.object(
+        tasks,
+        "convert_docx_to_pdf",
+        side_effect=lambda path, is_cancelled=None: next(results),
+    ), patch.object(tasks.zip_converted_files, "apply_async") as zip_task:
+        for file_id in file_ids:
+            tasks.process_file_conversion(file_id, "doc.docx")
+            # A redelivered task must not count the file twice
+            tasks.process_file_conversion(file_id, "doc.docx")
+
+    zip_task.assert_called_once_with(args=[job_id], queue="zip_queue")
+    session = session_factory()
+    job = session.get(Job, job_id)
+    assert (job.completed_files, job.failed_files) == (2, 1)
+    assert {fc.status for fc in job.file_conversions} == {
+        JobStatusEnum.completed,
+        JobStatusEnum.failed,
+    }
+    session.close()
+
+
+def test_batch_records_per_file_status(session_factory):
+    job_id, file_ids = _create_job(session_factory, 2)
+    with patch.object(tasks, "USE_S3", False), patch.object(
+        tasks,
+        "convert_docx_to_pdf_batch",
+        return_value=[
+            {"status": "error", "error_message": "corrupt"},
+            {"status": "success", "converted_file": "doc1.pdf"},
+        ],
+    ), patch.object(tasks.zip_converted_files, "apply_async") as zip_task:
+        tasks.process_file_conversion_batch(file_ids, ["doc0.docx", "doc1.docx"])
+
+    zip_task.assert_called_once_with(args=[job_id], queue="zip_queue")
+    session = session_factory()
+    statuses = {
+        fc.file_name: (fc.status, fc.error_message)
+        for fc in session.query(FileConversion).all()
+    }
+    assert statuses == {
+        "doc0.docx": (JobStatusEnum.failed, "corrupt"),
+        "doc1.docx": (JobStatusEnum.completed, None),
+    }
+    session.close()
+
+
+def test_transient_failures_are_retried_and_permanent_ones_are_not(
+    session_factory,
+):
+    job_id, file_ids = _create_job(session_factory, 2)
+    results = iter(
+        [
+            {"status": "error", "error_message": "killed", "retryable": True},
+            {"status": "success", "converted_file": "doc0.pdf"},
+            {"status": "error", "error_message": "corrupt", "retryable": False},
+        ]
+    )
+    with patch.object(tasks, "USE_S3", False), patch.object(
+        tasks,
+        "convert_docx_to_pdf",
+        side_effect=lambda path, is_cancelled=None: next(results),
+    ) as convert, patch.object(tasks.zip_converted_files, "apply_async"):
+        for file_id in file_ids:
+            tasks.process_file_conversion.apply(args=[file_id, "doc.docx"])
+
+    assert convert.call_count == 3
+    session = session_factory()
+    statuses = {
+        fc.file_name: (fc.status, fc.error_message)
+        for fc in session.query(FileConversion).all()
+    }
+    session.close()
+    assert statuses == {
+        "doc0.docx": (JobStatusEnum.completed, None),
+        "doc1.docx": (JobStatusEnum.failed, "corrupt"),
+    }
+
+
+def test_batch_retries_transient_files_alone_until_retries_run_out(session_factory):
+    job_id, file_ids = _create_job(session_factory, 2)
+    calls = []
+
+    def convert(paths, isolate=False, is_cancelled=None):
+        calls.append((paths, isolate))
+        return [
+            (
+                {"status": "error", "error_message": "killed", "retryable": True}
+                if path == "doc1.docx"
+                else {"status": "success", "converted_file": "doc0.pdf"}
+            )
+            for path in paths
+        ]
+
+    with patch.object(tasks, "USE_S3", False), patch.object(
+        tasks, "CONVERSION_MAX_RETRIES", 2
+    ), patch.object(
+        tasks, "convert_docx_to_pdf_batch", side_effect=convert
+    ), patch.object(
+        tasks.zip_converted_files, "apply_async"
+    ) as zip_task:
+        tasks.process_file_conversion_batch.apply(
+            args=[file_ids, ["doc0.docx", "doc1.docx"]]
+        )
+
+    assert calls == [
+        (["doc0.docx", "doc1.docx"], False),
+        (["doc1.docx"], True),
+        (["doc1.docx"], True),
+    ]
+    zip_task.assert_called_once_with(args=[job_id], queue="zip_queue")
+    session = session_factory()
+    job = session.get(Job, job_id)
+    assert (job.completed_files, job.failed_files) == (1, 1)
+    session.close()
+
+
+def test_redelivered_task_records_stored_output_without_converting(
+    session_factory, tmp_path
+):
+    job_id, (file_id,) = _create_job(session_factory, 1)
+    (tmp_path / "doc0.pdf").write_bytes(b"%PDF")
+    with patch.object(tasks, "USE_S3", False), patch.object(
+        tasks, "_is_redelivery", return_value=True
+    ), patch.object(tasks, "convert_docx_to_pdf") as convert, patch.object(
+        tasks.zip_converted_files, "apply_async"
+    ) as zip_task:
+        tasks.process_file_conversion(file_id, str(tmp_path / "doc0.docx"))
+
+    convert.assert_not_called()
+    zip_task.assert_called_once_with(args=[job_id], queue="zip_queue")
+    session = session_factory()
+    file_conversion = session.get(FileConversion, file_id)
+    assert file_conversion.status == JobStatusEnum.completed
+    assert file_conversion.output_file_path == str(tmp_path / "doc0.pdf")
+    session.close()
+
+
+def test_file_recorded_by_a_concurrent_delivery_is_counted_once(session_factory):
+    job_id, file_ids = _create_job(session_factory, 2)
+
+    def convert_while_another_delivery_finishes(path, is_cancelled=None):
+        session = session_factory()
+        session.get(FileConversion, file_ids[0]).status = JobStatusEnum.completed
+        session.get(Job, job_id).completed_files = 1
+        session.commit()
+        session.close()
+        return {"status": "success", "converted_file": "doc0.pdf"}
+
+    with patch.object(tasks, "USE_S3", False), patch.object(
+        tasks,
+        "convert_docx_to_pdf",
+        side_effect=convert_while_another_delivery_finishes,
+    ), patch.object(tasks.zip_converted_files, "apply_async") as zip_task:
+        tasks.process_file_conversion(file_ids[0], "doc0.docx")
+
+    zip_task.assert_not_called()
+    session = session_factory()
+    assert session.get(Job, job_id).completed_files == 1
+    session.close()
+
+
+def test_conversion_finishing_after_the_job_was_cancelled_is_not_recorded(
+    session_factory,
+):
+    job_id, file_ids = _create_job(session_factory, 1)
+    cancelled_jobs = set()
+
+    def convert_while_the_job_is_cancelled(path, is_cancelled=None):
+        session = session_factory()
+        session.get(Job, job_id).status = JobStatusEnum.cancelled
+        session.get(FileConversion, file_ids[0]).status = JobStatusEnum.cancelled
+        session.commit()
+        session.close()
+        cancelled_jobs.add(job_id)
+        assert is_cancelled()
+        return {"status": "success", "converted_file": "doc0.pdf"}
+
+    with patch.object(tasks, "USE_S3", False), patch.object(
+        tasks, "is_job_cancelled", side_effect=cancelled_jobs.__contains__
+    ), patch.object(
+        tasks, "convert_docx_to_pdf", side_effect=convert_while_the_job_is_cancelled
+    ), patch.object(
+        tasks.zip_converted_files, "apply_async"
+    ) as zip_task:
+        tasks.process_file_conversion(file_ids[0], "doc0.docx")
+
+    zip_task.assert_not_called()
+    session = session_factory()
+    assert session.get(Job, job_id).completed_files == 0
+    assert session.get(FileConversion, file_ids[0]).status == JobStatusEnum.cancelled
+    session.close()
+
+
+def test_recovery_sweep_resumes_only_unfinished_files_of_stuck_jobs(
+    session_factory,
+):
+    stuck_id, stuck_files = _create_job(session_factory, 2)
+    done_id, (done_file,) = _create_job(session_factory, 1)
+    active_id, _ = _create_job(session_factory, 1)
+    an_hour_ago = datetime.now() - timedelta(hours=1)
+    session = session_factory()
+    session.get(FileConversion, stuck_files[0]).status = JobStatusEnum.completed
+    session.get(Job, stuck_id).completed_files = 1
+    session.get(FileConversion, done_file).status = JobStatusEnum.failed
+    session.get(Job, done_id).failed_files = 1
+    session.commit()
+    session.execute(
+        update(Job).where(Job.id != active_id).values(updated_at=an_hour_ago)
+    )
+    session.execute(update(FileConversion).values(updated_at=an_hour_ago))
+    session.commit()
+    session.close()
+
+    with patch.object(tasks, "task_producer"), patch.object(
+        tasks, "_queued_conversions", return_value=0
+    ), patch.object(
+        tasks.process_file_conversion, "apply_async"
+    ) as convert_task, patch.object(
+        tasks.zip_converted_files, "apply_async"
+    ) as zip_task:
+        tasks.recover_stuck_jobs()
+        # Resumed jobs get time to make progress before the next sweep
+        tasks.recover_stuck_jobs()
+
+    convert_task.assert_called_once()
+    assert convert_task.call_args.args[0] == (stuck_files[1], "doc1")
+    assert convert_task.call_args.kwargs["headers"] == {"resumed": True}
+    zip_task.assert_called_once()
+    assert zip_task.call_args.kwargs["args"] == [done_id]
+
+
+def test_recovery_sweep_leaves_files_waiting_for_a_worker_alone(session_factory):
+    job_id, (started, queued, held) = _create_job(session_factory, 3)
+    session = session_factory()
+    session.get(FileConversion, started).status = JobStatusEnum.in_progress
+    session.commit()
+    an_hour_ago = datetime.now() - timedelta(hours=1)
+    session.execute(update(Job).values(updated_at=an_hour_ago))
+    session.execute(update(FileConversion).values(updated_at=an_hour_ago))
+    session.commit()
+    session.close()
+
+    with patch.object(tasks, "task_producer"), patch.object(
+        tasks, "_queued_conversions", return_value=0
+    ), patch.object(tasks, "USE_FAIR_SCHEDULER", True), patch.object(
+        tasks, "held_files", return_value={str(held)}
+    ), patch.object(
+        tasks, "enqueue_conversion"
+    ) as enqueue, patch.object(
+        tasks, "release_conversions"
+    ):
+        tasks.recover_stuck_jobs()
+    # Stalled and lost files go back through the fair scheduler
+    assert {call.args[2] for call in enqueue.call_args_list} == {
+        str(started),
+        str(queued),
+    }
+
+    session = session_factory()
+    session.execute(update(Job).values(updated_at=an_hour_ago))
+    session.commit()
+    session.close()
+    with patch.object(tasks, "task_producer"), patch.object(
+        tasks, "_queued_conversions", return_value=5
+    ), patch.object(tasks.process_file_conversion, "apply_async") as convert_task:
+        tasks.recover_stuck_jobs()
+    # Only the started file, the others may be behind the queued tasks
+    assert [call.args[0] for call in convert_task.call_args_list] == [(started, "doc0")]
+
+
+def test_recovery_sweep_extracts_archives_of_stuck_jobs_again(session_factory):
+    stuck_id, _ = _create_job(session_factory, 0)
+    lost_id, _ = _create_job(session_factory, 0)
+    session = session_factory()
+    session.get(Job, stuck_id).archive_path = "in.zip"
+    session.commit()
+    session.execute(update(Job).values(updated_at=datetime.now() - timedelta(hours=1)))
+    session.commit()
+    session.close()
+
+    with patch.object(tasks, "task_producer"), patch.object(
+        tasks, "_queued_conversions", return_value=0
+    ), patch.object(
+        tasks.unzip_and_schedule_file_conversion, "apply_async"
+    ) as unzip_task:
+        tasks.recover_stuck_jobs()
+        tasks.recover_stuck_jobs()
+
+    unzip_task.assert_called_once()
+    assert unzip_task.call_args.args[0] == ("in.zip", stuck_id)
+    session = session_factory()
+    lost = session.get(Job, lost_id)
+    assert (lost.status, lost.error_message) == (
+        JobStatusEnum.failed,
+        "Archive could not be extracted",
+    )
+    session.close()
+
+
+def test_unzip_retries_transient_errors_and_fails_the_job_on_others(
+    session_factory,
+):
+    job_id, _ = _create_job(session_factory, 0)
+    errors = [
+        ClientError({"Error": {"Code": "SlowDown"}}, "GetObject"),
+        ClientError({"Error": {"Code": "NoSuchKey"}}, "GetObject"),
+    ]
+    with patch.object(
+        tasks, "open_archive", side_effect=errors
+    ) as open_archive, patch.object(tasks, "CONVERSION_RETRY_BACKOFF", 0):
+        tasks.unzip_and_schedule_file_conversion.apply(args=["in.zip", job_id])
+
+    assert open_archive.call_count == 2
+    session = session_factory()
+    job = session.get(Job, job_id)
+    assert job.status == JobStatusEnum.failed
+    assert job.error_message.startswith("Archive could not be extracted: ")
+    session.close()
+
+
+def test_redelivered_unzip_dispatches_only_unfinished_files(session_factory, tmp_path):
+    job_id, _ = _create_job(session_factory, 0)
+    zip_path = tmp_path / "in.zip"
+    with zipfile.ZipFile(zip_path, "w") as archive:
+        for name in ("a.docx", "b.docx"):
+            archive.writestr(name, _docx_bytes(name))
+
+    with patch.object(tasks, "USE_S3", False), patch.object(
+        tasks, "CONVERSION_BATCH_SIZE", 1
+    ), patch.object(tasks, "task_producer"), patch.object(
+        tasks.process_file_conversion, "apply_async"
+    ) as apply_async:
+        tasks.unzip_and_schedule_file_conversion(str(zip_path), job_id)
+        session = session_factory()
+        finished = session.query(FileConversion).filter_by(file_name="a.docx").one()
+        finished.status = JobStatusEnum.completed
+        session.commit()
+        session.close()
+        apply_async.reset_mock()
+
+        tasks.unzip_and_schedule_file_conversion(str(zip_path), job_id)
+
+    session = session_factory()
+    files = {fc.file_name: fc.id for fc in session.query(FileConversion).all()}
+    session.close()
+    assert len(files) == 2
+    assert [call.args[0][0] for call in apply_async.call_args_list] == [files["b.docx"]]
+
+
+def _docx_bytes(text: str) -> bytes:
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w") as docx:
+        docx.writestr("word/document.xml", text)
+    return buffer.getvalue()
+
+
+def test_unzip_extracts_members_and_dispatches_each_conversion(
+    session_factory, tmp_path
+):
+    job_id, _ = _create_job(session_factory, 0)
+    zip_path = tmp_path / "in.zip"
+    with zipfile.ZipFile(zip_path, "w") as archive:
+        archive.writestr("a.docx", _docx_bytes("a"))
+        archive.writestr("dir/b.docx", _docx_bytes("b"))
+        archive.writestr("dir/.~lock.a.docx#", "lock")
+        archive.writestr("notes.txt", "skipped")
+        archive.writestr("fake.docx", "not a docx")
+
+    with patch.object(tasks, "USE_S3", False), patch.object(
+        tasks, "CONVERSION_BATCH_SIZE", 1
+    ), patch.object(tasks, "task_producer"), patch.object(
+        tasks.process_file_conversion, "apply_async"
+    ) as apply_async:
+        tasks.unzip_and_schedule_file_conversion(str(zip_path), job_id)
+
+    session = session_factory()
+    job = session.get(Job, job_id)
+    assert (job.total_files, job.failed_files) == (3, 1)
+    files = {fc.file_name: fc for fc in job.file_conversions}
+    assert files["fake.docx"].status == JobStatusEnum.failed
+    dispatched = {call.args[0] for call in apply_async.call_args_list}
+    assert dispatched == {
+        (files[name].id, str(tmp_path / name)) for name in ("a.docx", "dir/b.docx")
+    }
+    session.close()
+    assert (tmp_path / "dir" / "b.docx").read_bytes() == _docx_bytes("b")
+
+
+def test_rejected_archive_fails_the_job_with_the_reason(session_factory, tmp_path):
+    job_id, _ = _create_job(session_factory, 0)
+    zip_path = tmp_path / "in.zip"
+    with zipfile.ZipFile(zip_path, "w") as archive:
+        archive.writestr("../evil.docx", _docx_bytes("evil"))
+
+    with patch.object(tasks, "USE_S3", False):
+        tasks.unzip_and_schedule_file_conversion(str(zip_path), job_id)
+
+    session = session_factory()
+    job = session.get(Job, job_id)
+    assert (job.status, job.total_files) == (JobStatusEnum.failed, 0)
+    assert job.error_message == "Archive rejected: Unsafe path in archive: ../evil.docx"
+    session.close()
+
+
+def test_unzip_in_s3_mode_uploads_members_and_dispatches_uploaded_ones(
+    session_factory, tmp_path
+):
+    job_id, _ = _create_job(session_factory, 0)
+    zip_path = tmp_path / "in.zip"
+    with zipfile.ZipFile(zip_path, "w") as archive:
+        for name in ("a.docx", "b.docx", "c.docx"):
+            archive.writestr(name, _docx_bytes(name))
+
+    uploaded = {}
+
+    def upload_file(local_path, s3_key):
+        if s3_key.endswith("b.docx"):
+            raise RuntimeError("denied")
+        with open(local_path, "rb") as f:
+            uploaded[s3_key] = f.read()
+
+    with patch.object(tasks, "USE_S3", True), patch.object(
+        tasks, "CONVERSION_BATCH_SIZE", 1
+    ), patch.object(
+        tasks, "open_archive", return_value=zipfile.ZipFile(zip_path)
+    ), patch.object(
+        tasks, "upload_file", side_effect=upload_file
+    ), patch.object(
+        tasks, "task_producer"
+    ), patch.object(
+        tasks.process_file_conversion, "apply_async"
+    ) as apply_async:
+        tasks.unzip_and_schedule_file_conversion(f"{job_id}/upload.zip", job_id)
+
+    assert uploaded == {
+        f"{job_id}/a.docx": _docx_bytes("a.docx"),
+        f"{job_id}/c.docx": _docx_bytes("c.docx"),
+    }
+    assert sorted(call.args[0][1] for call in apply_async.call_args_list) == sorted(
+        uploaded
+    )
+    session = session_factory()
+    job = session.get(Job, job_id)
+    assert (job.total_files, job.failed_files) == (3, 1)
+    session.close()
+
+
+def test_batch_in_s3_mode_transfers_in_parallel_and_reports_failures(
+    session_factory,
+):
+    job_id, file_ids = _create_job(session_factory, 3)
+    with patch.object(tasks, "USE_S3", True), patch.object(
+        tasks,
+        "download_files",
+        return_value=[None, RuntimeError("timeout"), None],
+    ) as download_files, patch.object(
+        tasks,
+        "convert_docx_to_pdf_batch",
+        side_effect=lambda paths, **kwargs: [
+            {"status": "success", "converted_file": path.replace(".docx", ".pdf")}
+            for path in paths
+        ],
+    ), patch.object(
+        tasks, "upload_files", return_value=[None, RuntimeError("denied")]
+    ) as upload_files, patch.object(
+        tasks.zip_converted_files, "apply_async"
+    ):
+        tasks.process_file_conversion_batch(
+            file_ids, [f"{job_id}/doc{i}.docx" for i in range(3)]
+        )
+
+    assert len(download_files.call_args.args[0]) == 3
+    assert [key for _, key in upload_files.call_args.args[0]] == [
+        f"{job_id}/converted/doc0.pdf",
+        f"{job_id}/converted/doc2.pdf",
+    ]
+    session = session_factory()
+    statuses = {
+        fc.file_name: (fc.status, fc.error_message, fc.output_file_path)
+        for fc in session.query(FileConversion).all()
+    }
+    session.close()
+    assert statuses["doc0.docx"] == (
+        JobStatusEnum.completed,
+        None,
+        f"{job_id}/converted/doc0.pdf",
+    )
+    assert statuses["doc1.docx"][:2] == (
+        JobStatusEnum.failed,
+        "Download failed: timeout",
+    )
+    assert statuses["doc2.docx"][:2] == (JobStatusEnum.failed, "Upload failed: denied")
+
+
+def test_s3_zip_keeps_documents_of_the_same_name_apart(session_factory, tmp_path):
+    session = session_factory()
+    job = Job(total_files=2, completed_files=2, status=JobStatusEnum.in_progress)
+    session.add(job)
+    session.add_all(
+        FileConversion(
+            job=job,
+            file_name=f"{folder}/report.docx",
+            output_file_path=f"{folder}/report.pdf",
+            status=JobStatusEnum.completed,
+        )
+        for folder in ("a", "b")
+    )
+    session.commit()
+    job_id = job.id
+    session.close()
+    archives = []
+
+    def download(items):
+        for key, local_path in items:
+            with open(local_path, "wb") as f:
+                f.write(key.encode())
+        return [None] * len(items)
+
+    def upload(zip_path, key):
+        with zipfile.ZipFile(zip_path) as archive:
+            archives.append({name: archive.read(name) for name in archive.namelist()})
+
+    with patch.object(tasks, "USE_S3", True), patch.object(
+        tasks, "STREAM_ZIP_DOWNLOADS", False
+    ), patch.object(tasks, "download_files", side_effect=download), patch.object(
+        tasks, "upload_file", side_effect=upload
+    ), patch.object(
+        tasks, "publish_job_events"
+    ):
+        tasks.zip_converted_files(job_id)
+
+    assert archives == [
+        {"a/report.pdf": b"a/report.pdf", "b/report.pdf": b"b/report.pdf"}
+    ]
+
+
+def test_started_files_are_published_in_progress(session_factory):
+    job_id, file_ids = _create_job(session_factory, 2)
+    with patch.object(tasks, "USE_S3", False), patch.object(
+        tasks,
+        "convert_docx_to_pdf_batch",
+        return_value=[{"status": "error", "error_message": "corrupt"}] * 2,
+    ), patch.object(tasks.zip_converted_files, "apply_async"), patch.object(
+        tasks, "publish_job_events"
+    ) as publish:
+        tasks.process_file_conversion_batch(file_ids, ["doc0.docx", "doc1.docx"])
+
+    started_job_id, events = publish.call_args_list[0].args
+    assert started_job_id == job_id
+    assert sorted(event["file_id"] for event in events) == sorted(map(str, file_ids))
+    assert {event["status"] for event in events} == {"in_progress"}
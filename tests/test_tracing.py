@@ -0,0 +1,106 @@
+import os
+import time
+from types import SimpleNamespace
+from unittest.mock import patch
+
+import pytest
+from opentelemetry.sdk.trace import TracerProvider
+from opentelemetry.sdk.trace.export import SimpleSpanProcessor
+from opentelemetry.sdk.trace.export.in_memory_span_exporter import (
+    InMemorySpanExporter,
+)
+
+from app import celery as celery_module
+from app import tracing
+from benchmarks import trace_report
+
+
+@pytest.fixture
+def exporter():
+    """Tracing enabled, finished spans collected in memory."""
+    exporter = InMemorySpanExporter()
+    provider = TracerProvider()
+    provider.add_span_processor(SimpleSpanProcessor(exporter))
+    with patch.object(tracing, "TRACING_ENABLED", True), patch.object(
+        tracing, "_provider", provider
+    ), patch.object(tracing, "_provider_pid", os.getpid()):
+        yield exporter
+
+
+def _task(name: str, headers: dict):
+    return SimpleNamespace(
+        name=name,
+        request=SimpleNamespace(
+            id="task-1",
+            retries=0,
+            get=headers.get,
+            delivery_info={"routing_key": "libre_queue"},
+        ),
+    )
+
+
+def test_task_continues_the_trace_of_its_publisher(exporter):
+    headers = {}
+    with tracing.span("handle_file_upload") as upload:
+        celery_module.stamp_task_headers(headers=headers)
+    headers["published_at"] -= 1.5
+
+    task = _task("app.tasks.process_file_conversion", headers)
+    celery_module.observe_task_wait(task=task)
+    with tracing.span("s3.download"):
+        pass
+    celery_module.end_task_trace(task_id="task-1", state="SUCCESS")
+
+    spans = {span.name: span for span in exporter.get_finished_spans()}
+    trace_id = upload.get_span_context().trace_id
+    assert {span.context.trace_id for span in spans.values()} == {trace_id}
+    task_span = spans["process_file_conversion"]
+    assert task_span.parent.span_id == upload.get_span_context().span_id
+    assert spans["s3.download"].parent.span_id == task_span.context.span_id
+    wait = spans["queue.wait"]
+    assert 1.5 <= (wait.end_time - wait.start_time) / 1e9 < 5
+    assert task_span.attributes["celery.state"] == "SUCCESS"
+
+
+def test_held_conversion_keeps_the_trace_of_its_job(exporter):
+    with tracing.span("unzip_and_schedule_file_conversion") as unzip:
+        held = tracing.inject_trace_context({"scheduled_at": time.time()})
+    with tracing.span("finish_conversion_of_another_job"):
+        # The releasing task publishes with the headers stored at enqueue
+        headers = dict(held)
+        celery_module.stamp_task_headers(headers=headers)
+
+    assert headers["traceparent"] == held["traceparent"]
+    celery_module.observe_task_wait(
+        task=_task("app.tasks.process_file_conversion", headers)
+    )
+    celery_module.end_task_trace(task_id="task-1")
+    spans = {span.name: span for span in exporter.get_finished_spans()}
+    assert spans["fair_scheduler.wait"].context.trace_id == (
+        unzip.get_span_context().trace_id
+    )
+    assert spans["process_file_conversion"].parent.span_id == (
+        unzip.get_span_context().span_id
+    )
+
+
+def test_file_exporter_output_is_summarized_per_job(tmp_path, exporter):
+    path = str(tmp_path / "spans.jsonl")
+    exporter.clear()
+    with tracing.span("handle_file_upload"):
+        tracing.set_job_id("job-1")
+        with tracing.span("save_file"):
+            time.sleep(0.01)
+    with tracing.span("handle_file_upload"):
+        tracing.set_job_id("job-2")
+    tracing.JsonLinesSpanExporter(path).export(exporter.get_finished_spans())
+
+    spans = trace_report.load_spans(path, "job-1")
+    summary = trace_report.summarize(spans)
+
+    assert sorted(span["name"] for span in spans) == [
+        "handle_file_upload",
+        "save_file",
+    ]
+    assert summary["wall_seconds"] >= 0.01
+    assert summary["spans"]["save_file"]["count"] == 1